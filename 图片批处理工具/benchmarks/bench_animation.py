@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+动画逐帧处理基准测试
+
+对比两种给动画GIF缩放并加水印的方式:
+    逐帧循环: 把每一帧单独导出，走单张图片的处理流程（解码、缩放、加水印、编码），再重新合成动画，
+              每帧重新生成水印图层和调色板
+    动画路径: ImageProcessor 的动画处理，水印图层只生成一次，所有帧共用一个调色板
+
+输出每秒处理的帧数和输出文件大小，并校验两者的帧数和帧时长一致。
+
+用法:
+    python benchmarks/bench_animation.py [--frames 300] [--size 480x360]
+"""
+import io
+import os
+import sys
+import time
+import argparse
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(script_dir, "..", "src"))
+
+from PIL import Image, ImageDraw
+from image_processor import ImageProcessor
+
+def make_animation(frame_count, size):
+    """生成一个带移动圆形和透明背景的合成GIF"""
+    width, height = size
+    frames = []
+    for index in range(frame_count):
+        frame = Image.new('RGBA', size, (0, 0, 0, 0))
+        draw = ImageDraw.Draw(frame)
+        x = index * (width - height // 3) // max(frame_count - 1, 1)
+        draw.ellipse((x, height // 3, x + height // 3, height * 2 // 3), fill=(255, index % 256, 40, 255))
+        draw.rectangle((0, height * 5 // 6, width, height), fill=(30, 60, 200, 255))
+        frames.append(frame)
+    buffer = io.BytesIO()
+    durations = [40 + index % 3 * 10 for index in range(frame_count)]
+    frames[0].save(buffer, 'GIF', save_all=True, append_images=frames[1:], duration=durations, loop=0, disposal=2)
+    return buffer.getvalue()
+
+def per_frame_loop(processor, data, steps, output):
+    """旧做法：逐帧导出后按单张图片处理，再合成动画"""
+    with Image.open(io.BytesIO(data)) as img:
+        loop = img.info.get('loop')
+        frames = []
+        durations = []
+        for index in range(img.n_frames):
+            img.seek(index)
+            exported = io.BytesIO()
+            img.convert('RGBA').save(exported, 'PNG')
+            durations.append(img.info.get('duration', 100))
+
+            encoded = io.BytesIO()
+            processor._run_pipeline('frame.png', 'frame.png', steps, source=io.BytesIO(exported.getvalue()), target=encoded)
+            frames.append(Image.open(io.BytesIO(encoded.getvalue())))
+    frames[0].save(output, 'GIF', save_all=True, append_images=frames[1:], duration=durations, loop=loop, disposal=2)
+
+def frame_durations(data):
+    with Image.open(io.BytesIO(data)) as img:
+        durations = []
+        for index in range(img.n_frames):
+            img.seek(index)
+            durations.append(img.info.get('duration'))
+        return durations
+
+def main():
+    parser = argparse.ArgumentParser(description='动画逐帧处理基准测试')
+    parser.add_argument('--frames', type=int, default=300, help='动画帧数')
+    parser.add_argument('--size', default='480x360', help='动画尺寸 (宽x高)')
+    args = parser.parse_args()
+
+    size = tuple(map(int, args.size.lower().split('x')))
+    data = make_animation(args.frames, size)
+    steps = [
+        {'op': 'resize', 'size': (size[0] // 2, size[1] // 2)},
+        {'op': 'watermark', 'watermark_text': '© 2025', 'position': 'center', 'opacity': 0.5},
+    ]
+
+    results = {}
+    for name in ('逐帧循环', '动画路径'):
+        # 每种方式使用新的处理器，避免共享缓存
+        processor = ImageProcessor()
+        output = io.BytesIO()
+        start = time.perf_counter()
+        if name == '逐帧循环':
+            per_frame_loop(processor, data, steps, output)
+        else:
+            processor._run_pipeline('input.gif', 'output.gif', steps,
+                                    source=io.BytesIO(data), target=output)
+        results[name] = (time.perf_counter() - start, output.getvalue())
+
+    print(f"{args.frames} 帧 {size[0]}x{size[1]} GIF，缩放到一半并添加文本水印")
+    print(f"{'方式':>8} {'耗时(s)':>10} {'帧/秒':>10} {'输出(KB)':>10}")
+    for name, (elapsed, output) in results.items():
+        print(f"{name:>8} {elapsed:>10.2f} {args.frames / elapsed:>10.1f} {len(output) / 1024:>10.1f}")
+
+    baseline, animated = (results[name][1] for name in ('逐帧循环', '动画路径'))
+    same = frame_durations(baseline) == frame_durations(animated)
+    print(f"加速比: {results['逐帧循环'][0] / results['动画路径'][0]:.1f}x，帧数和帧时长一致: {'是' if same else '否'}")
+    return 0 if same else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+分布式批处理扩展性基准测试
+
+在本机启动协调器和不同数量的工作进程，处理同一批合成图片（缩小并转换为WEBP），
+输出每种工作进程数下的吞吐量、相对单个工作进程的加速比和并行效率。
+工作进程数超过CPU核心数时加速比不会继续增长。
+
+用法:
+    python benchmarks/bench_distributed.py [--workers 1 2 4] [--count 48] [--size 1600x1200] [--lease-size 4]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(script_dir, "..", "src"))
+sys.path.append(script_dir)
+
+from bench_encode import make_photo
+from distributed import Coordinator
+from image_processor import ImageProcessor
+
+def main():
+    parser = argparse.ArgumentParser(description='分布式批处理扩展性基准测试')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='工作进程数列表')
+    parser.add_argument('--count', type=int, default=48, help='图片数量')
+    parser.add_argument('--size', default='1600x1200', help='图片尺寸 (宽x高)')
+    parser.add_argument('--lease-size', type=int, default=4, help='每个租约的文件数')
+    args = parser.parse_args()
+
+    size = tuple(map(int, args.size.lower().split('x')))
+    work_dir = tempfile.mkdtemp(prefix='bench_distributed_')
+    input_dir = os.path.join(work_dir, 'input')
+    os.makedirs(input_dir)
+    for index in range(args.count):
+        make_photo(size, index % 7).save(os.path.join(input_dir, f"photo{index:04d}.jpg"), quality=90)
+
+    steps = [{'op': 'resize', 'size': (size[0] // 2, size[1] // 2)}, {'op': 'convert', 'format_name': 'webp'}]
+    print(f"{args.count} 张 {size[0]}x{size[1]} 图片，每个租约 {args.lease_size} 张，CPU核心数 {os.cpu_count()}")
+    print(f"{'工作进程':>8} {'耗时(s)':>10} {'张/秒':>10} {'加速比':>8} {'效率':>8}")
+    try:
+        baseline = None
+        for workers in args.workers:
+            output_dir = os.path.join(work_dir, f"output_{workers}")
+            coordinator = Coordinator(ImageProcessor(), input_dir, output_dir, 'pipeline',
+                                      lease_size=args.lease_size, steps=steps)
+            start = time.perf_counter()
+            # 协调器结束时会等待一个轮询间隔，从耗时中扣除
+            results = coordinator.serve(f"unix:{os.path.join(work_dir, 'coordinator.sock')}",
+                                        local_workers=workers)
+            elapsed = time.perf_counter() - start - Coordinator.WAIT_INTERVAL
+            if results['success'] != args.count:
+                print(f"处理失败: {results}")
+                return 1
+            rate = args.count / elapsed
+            baseline = baseline or rate
+            print(f"{workers:>8} {elapsed:>10.2f} {rate:>10.1f} {rate / baseline:>7.2f}x "
+                  f"{rate / baseline / workers * args.workers[0]:>7.0%}")
+    finally:
+        shutil.rmtree(work_dir)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
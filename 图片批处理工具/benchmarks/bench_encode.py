@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+编码档位基准测试
+
+对合成的照片类图片，按每个编码档位和输出格式统计平均编码耗时和输出大小，
+并测试按目标大小搜索质量时的额外耗时。
+
+用法:
+    python benchmarks/bench_encode.py [--size 1600x1200] [--count 5] [--max-bytes 150000]
+"""
+import io
+import os
+import sys
+import time
+import argparse
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(script_dir, "..", "src"))
+
+from PIL import Image, ImageFilter
+from image_processor import ImageProcessor, ENCODER_PROFILES
+
+def make_photo(size, seed):
+    """生成带有平滑渐变和细节噪声的合成照片"""
+    width, height = size
+    base = Image.merge('RGB', [
+        Image.linear_gradient('L').rotate(seed * 37 % 360).resize(size),
+        Image.radial_gradient('L').resize(size),
+        Image.linear_gradient('L').transpose(Image.Transpose.ROTATE_90).resize(size),
+    ])
+    noise = Image.effect_noise(size, 40 + seed * 5).filter(ImageFilter.GaussianBlur(1))
+    return Image.blend(base, Image.merge('RGB', [noise] * 3), 0.3)
+
+def main():
+    parser = argparse.ArgumentParser(description='编码档位基准测试')
+    parser.add_argument('--size', default='1600x1200', help='图片尺寸 (宽x高)')
+    parser.add_argument('--count', type=int, default=5, help='图片数量')
+    parser.add_argument('--formats', nargs='+', default=['JPEG', 'WEBP', 'PNG'], help='输出格式')
+    parser.add_argument('--max-bytes', type=int, default=150000, help='按目标大小编码时的上限 (字节)')
+    args = parser.parse_args()
+
+    size = tuple(map(int, args.size.lower().split('x')))
+    images = [make_photo(size, seed) for seed in range(args.count)]
+    processor = ImageProcessor()
+
+    print(f"{'档位':>10} {'格式':>6} {'编码(ms/张)':>12} {'平均大小(KB)':>14}")
+    for format_name in args.formats:
+        runs = [(profile, None) for profile in ENCODER_PROFILES]
+        runs.append(('web-small', args.max_bytes))
+        for profile, max_bytes in runs:
+            total_time = 0.0
+            total_bytes = 0
+            for img in images:
+                buffer = io.BytesIO()
+                start = time.perf_counter()
+                processor.encode_image(img, buffer, format_name, profile, max_bytes)
+                total_time += time.perf_counter() - start
+                total_bytes += buffer.tell()
+            label = profile if max_bytes is None else f"<={max_bytes // 1000}K"
+            print(f"{label:>10} {format_name:>6} {total_time / len(images) * 1000:>12.1f} "
+                  f"{total_bytes / len(images) / 1024:>14.1f}")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+ImageProcessor 综合基准测试
+
+在本地生成固定随机种子的合成图片集（多种尺寸、模式和格式），分别测量
+resize_image、convert_format、add_watermark（文本/图片）和 batch_process 的
+每秒处理图片数、每秒读取的MB数和峰值内存（RSS）。
+
+每个测试项在独立的子进程中运行，峰值内存互不影响（多进程测试项只统计主进程）。结果保存为JSON，
+两次结果可以直接对比，速度下降或内存增长超过阈值时标记为性能回退。
+
+用法:
+    python benchmarks/bench_suite.py [--quick] [--repeat 3] [-o results.json]
+    python benchmarks/bench_suite.py -o new.json --baseline old.json [--threshold 0.1]
+    python benchmarks/bench_suite.py --diff old.json new.json [--threshold 0.1]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(script_dir, "..", "src"))
+
+import PIL
+from PIL import Image
+from image_processor import ImageProcessor
+from bench_encode import make_photo
+
+try:
+    import resource
+except ImportError:
+    # Windows 上没有 resource 模块，不统计峰值内存
+    resource = None
+
+# 合成图片集: 名称 -> (尺寸列表, 每种尺寸和格式的图片数)
+CORPORA = {
+    'quick': ([(640, 480), (1920, 1080)], 2),
+    'full': ([(640, 480), (1920, 1080), (4000, 3000)], 4),
+}
+
+# (格式, 扩展名, 图片模式)
+CORPUS_FORMATS = [
+    ('JPEG', '.jpg', 'RGB'),
+    ('PNG', '.png', 'RGBA'),
+    ('PNG', '.png', 'P'),
+    ('WEBP', '.webp', 'RGB'),
+    ('BMP', '.bmp', 'L'),
+]
+
+# 测试项: 名称 -> 说明
+CASES = {
+    'resize': 'resize_image 缩放到 800x600',
+    'resize_fit_fast': 'resize_image fit模式最长边800，fast档位',
+    'convert_webp': 'convert_format 转换为WEBP',
+    'convert_jpeg': 'convert_format 转换为JPEG',
+    'watermark_text': 'add_watermark 文本水印',
+    'watermark_image': 'add_watermark 图片水印',
+    'batch_resize': 'batch_process 单进程缩放',
+    'batch_resize_parallel': 'batch_process 多进程缩放 (全部CPU核心)',
+}
+
+def make_image(size, mode, seed):
+    """生成指定模式的合成照片"""
+    photo = make_photo(size, seed)
+    if mode == 'RGBA':
+        photo.putalpha(Image.radial_gradient('L').resize(size))
+    elif mode == 'L':
+        photo = photo.convert('L')
+    elif mode == 'P':
+        photo = photo.quantize(256)
+    return photo
+
+def ensure_corpus(corpus_dir, name):
+    """生成合成图片集，已存在且规格相同时直接复用"""
+    sizes, count = CORPORA[name]
+    spec = json.dumps([name, sizes, count, CORPUS_FORMATS, PIL.__version__])
+    marker = os.path.join(corpus_dir, 'spec.json')
+    if os.path.exists(marker):
+        with open(marker, encoding='utf-8') as f:
+            if f.read() == spec:
+                return
+        shutil.rmtree(corpus_dir)
+
+    images_dir = os.path.join(corpus_dir, 'images')
+    os.makedirs(images_dir)
+    seed = 0
+    for width, height in sizes:
+        for format_name, ext, mode in CORPUS_FORMATS:
+            for index in range(count):
+                img = make_image((width, height), mode, seed)
+                img.save(os.path.join(images_dir, f"{width}x{height}_{mode}_{index}{ext}"), format_name)
+                seed += 1
+
+    logo = Image.new('RGBA', (300, 120), (200, 30, 90, 255))
+    logo.putalpha(Image.linear_gradient('L').rotate(90).resize((300, 120)))
+    logo.save(os.path.join(corpus_dir, 'logo.png'))
+    with open(marker, 'w', encoding='utf-8') as f:
+        f.write(spec)
+
+def peak_rss_mb():
+    """当前进程的峰值内存（MB），无法统计时返回None"""
+    try:
+        # Linux 上 ru_maxrss 会继承 fork 前父进程的峰值，VmHWM 只统计当前程序
+        with open('/proc/self/status', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 以字节为单位，Linux 以KB为单位
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+def run_case(case, corpus_dir, repeat):
+    """在当前进程中运行一个测试项，多次运行取最短耗时"""
+    processor = ImageProcessor()
+    images_dir = os.path.join(corpus_dir, 'images')
+    files = sorted(os.path.join(images_dir, name) for name in os.listdir(images_dir))
+    total_bytes = sum(os.path.getsize(path) for path in files)
+    logo = os.path.join(corpus_dir, 'logo.png')
+
+    best = None
+    for _ in range(repeat):
+        output_dir = tempfile.mkdtemp(prefix='bench_out_')
+        try:
+            start = time.perf_counter()
+            if case.startswith('batch_resize'):
+                workers = 0 if case == 'batch_resize_parallel' else None
+                result = processor.batch_process(images_dir, output_dir, 'resize', workers=workers, size=(800, 600))
+                if result['fail']:
+                    raise RuntimeError(f"{result['fail']} 张图片处理失败")
+            else:
+                for path in files:
+                    ok = run_single(processor, case, path, output_dir, logo)
+                    if not ok:
+                        raise RuntimeError(f"处理失败: {path}")
+            elapsed = time.perf_counter() - start
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+        best = elapsed if best is None else min(best, elapsed)
+
+    return {
+        'images': len(files),
+        'bytes': total_bytes,
+        'seconds': best,
+        'images_per_sec': len(files) / best,
+        'mb_per_sec': total_bytes / 1024 / 1024 / best,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+def run_single(processor, case, path, output_dir, logo):
+    """对单张图片执行测试项对应的操作"""
+    base, ext = os.path.splitext(os.path.basename(path))
+    if case == 'resize':
+        return processor.resize_image(path, os.path.join(output_dir, base + ext), (800, 600))
+    if case == 'resize_fit_fast':
+        return processor.resize_image(path, os.path.join(output_dir, base + ext), (800, 800), 'fast', 'fit')
+    if case == 'convert_webp':
+        return processor.convert_format(path, os.path.join(output_dir, base + '.webp'), 'WEBP')
+    if case == 'convert_jpeg':
+        return processor.convert_format(path, os.path.join(output_dir, base + '.jpg'), 'JPEG')
+    if case == 'watermark_text':
+        return processor.add_watermark(path, os.path.join(output_dir, base + ext), watermark_text='© 2025 Benchmark',
+                                       position='center', opacity=0.5)
+    if case == 'watermark_image':
+        return processor.add_watermark(path, os.path.join(output_dir, base + ext), watermark_image=logo,
+                                       position='center', opacity=0.5)
+    raise ValueError(f"未知的测试项: {case}")
+
+def run_suite(cases, corpus_dir, repeat):
+    """逐个在子进程中运行测试项，返回结果字典"""
+    results = {}
+    for case in cases:
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--case', case, '--corpus-dir', corpus_dir,
+             '--repeat', str(repeat)],
+            capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            error = completed.stderr.strip().splitlines()
+            print(f"{case:<24} 失败: {error[-1] if error else completed.returncode}")
+            continue
+        results[case] = json.loads(completed.stdout.strip().splitlines()[-1])
+        print_result(case, results[case])
+    return results
+
+def print_result(case, result):
+    rss = result['peak_rss_mb']
+    rss_text = f"{rss:>10.1f}" if rss is not None else f"{'-':>10}"
+    print(f"{case:<24} {result['images_per_sec']:>10.1f} {result['mb_per_sec']:>10.2f} {rss_text}")
+
+def compare(baseline, current, threshold):
+    """
+    对比两次结果，打印变化并返回回退的测试项列表
+
+    每秒处理图片数下降超过 threshold，或峰值内存增长超过 threshold 时视为回退。
+    """
+    regressions = []
+    print(f"{'测试项':<24} {'旧(张/秒)':>10} {'新(张/秒)':>10} {'速度变化':>9} {'内存变化':>9}")
+    for case, new in current['results'].items():
+        old = baseline['results'].get(case)
+        if old is None:
+            print(f"{case:<24} {'-':>10} {new['images_per_sec']:>10.1f} {'新增':>9}")
+            continue
+        speed = new['images_per_sec'] / old['images_per_sec'] - 1
+        memory = None
+        if new['peak_rss_mb'] and old['peak_rss_mb']:
+            memory = new['peak_rss_mb'] / old['peak_rss_mb'] - 1
+        flags = []
+        if speed < -threshold:
+            flags.append('速度回退')
+        if memory is not None and memory > threshold:
+            flags.append('内存回退')
+        memory_text = f"{memory:>+9.1%}" if memory is not None else f"{'-':>9}"
+        print(f"{case:<24} {old['images_per_sec']:>10.1f} {new['images_per_sec']:>10.1f} {speed:>+9.1%} {memory_text}"
+              f"  {' '.join(flags)}")
+        if flags:
+            regressions.append(case)
+    return regressions
+
+def load_results(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description='ImageProcessor 综合基准测试')
+    parser.add_argument('--quick', action='store_true', help='使用较小的图片集 (不含4000x3000的大图)')
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES), help='要运行的测试项')
+    parser.add_argument('--repeat', type=int, default=3, help='每项重复次数，取最短耗时')
+    parser.add_argument('--corpus-dir', help='合成图片集目录 (默认在系统临时目录中，生成后复用)')
+    parser.add_argument('-o', '--output', help='把结果保存为JSON文件')
+    parser.add_argument('--baseline', help='与之对比的历史结果JSON')
+    parser.add_argument('--diff', nargs=2, metavar=('OLD', 'NEW'), help='只对比两个结果文件，不运行测试')
+    parser.add_argument('--threshold', type=float, default=0.1, help='判定回退的相对变化阈值 (默认0.1，即10%%)')
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.diff:
+        regressions = compare(load_results(args.diff[0]), load_results(args.diff[1]), args.threshold)
+        if regressions:
+            print(f"性能回退: {', '.join(regressions)}")
+            return 1
+        return 0
+
+    if args.case:
+        # 子进程: 运行单个测试项并以JSON输出结果
+        print(json.dumps(run_case(args.case, args.corpus_dir, args.repeat)))
+        return 0
+
+    corpus = 'quick' if args.quick else 'full'
+    corpus_dir = args.corpus_dir or os.path.join(tempfile.gettempdir(), f'image_bench_corpus_{corpus}')
+    ensure_corpus(corpus_dir, corpus)
+    print(f"图片集: {corpus_dir} ({len(os.listdir(os.path.join(corpus_dir, 'images')))} 张)")
+    print(f"{'测试项':<24} {'张/秒':>10} {'MB/秒':>10} {'峰值内存(MB)':>10}")
+    results = run_suite(args.cases, corpus_dir, args.repeat)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'pillow': PIL.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'corpus': corpus,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到: {args.output}")
+
+    if args.baseline:
+        print()
+        regressions = compare(load_results(args.baseline), report, args.threshold)
+        if regressions:
+            print(f"性能回退: {', '.join(regressions)}")
+            return 1
+    return 0 if len(results) == len(args.cases) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
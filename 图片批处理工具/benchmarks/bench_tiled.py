@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+分条处理与整图处理的对比测试
+
+用不同模式（L、RGB、RGBA、P、1）的BMP和未压缩TIFF合成图片，分别以整图方式和分条方式
+（--strip-size 很小，强制切成多条）执行缩放、格式转换和文本水印，输出两者的耗时，
+并校验分条结果与整图结果一致。分条依赖Pillow内部属性，升级Pillow后应运行一次。
+
+缩放时条与条的接缝处会因浮点舍入出现个别 ±1 的差异，允许的最大差值由 --tolerance 指定，
+带透明通道的图片在Pillow中以预乘alpha缩放，还原时的舍入再允许多1；格式转换和水印必须逐像素一致。
+P和1模式的图片不分条缩放，结果应完全一致。有不一致时以非零状态退出。
+
+用法:
+    python benchmarks/bench_tiled.py [--size 3000x2000] [--strip-size 1M] [--tolerance 1]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(script_dir, "..", "src"))
+
+from PIL import Image, ImageChops
+from image_processor import ImageProcessor
+from tiling import row_reads_supported
+
+MODES = ['L', 'RGB', 'RGBA', 'P', '1']
+
+def make_source(size, mode):
+    """生成带噪声和渐变的合成图片，缩放时每个像素都会被重采样"""
+    noise = Image.effect_noise(size, 60)
+    gradient = Image.linear_gradient('L').resize(size)
+    img = Image.merge('RGB', (noise, gradient, gradient.transpose(Image.FLIP_LEFT_RIGHT)))
+    if mode == 'RGBA':
+        img.putalpha(gradient)
+        return img
+    if mode == 'P':
+        return img.quantize(64)
+    return img.convert(mode)
+
+def max_difference(a, b):
+    """
+    返回两张图片的最大像素差值，尺寸不同时返回None
+
+    分条写出只使用L/RGB/RGBA模式（P和1模式的源图片会展开），因此按显示效果比较：
+    带透明通道的图片比较预乘alpha后的值，几乎透明的像素在接缝处的舍入差异不会被放大。
+    """
+    if a.size != b.size:
+        return None
+    if a.mode == b.mode == 'P':
+        return 0 if a.tobytes() == b.tobytes() and a.getpalette() == b.getpalette() else None
+    alpha = any('A' in img.mode or 'transparency' in img.info for img in (a, b))
+    mode = 'RGBa' if alpha else 'RGB'
+    extrema = ImageChops.difference(a.convert('RGBA').convert(mode), b.convert('RGBA').convert(mode)).getextrema()
+    return max(high for _, high in extrema)
+
+def main():
+    parser = argparse.ArgumentParser(description='分条处理与整图处理的对比测试')
+    parser.add_argument('--size', default='3000x2000', help='源图片尺寸 (宽x高)')
+    parser.add_argument('--strip-size', type=float, default=1.0, help='每条源数据的大小上限 (MB)')
+    parser.add_argument('--tolerance', type=int, default=1, help='缩放结果允许的最大像素差值')
+    args = parser.parse_args()
+
+    size = tuple(map(int, args.size.lower().split('x')))
+    strip_bytes = int(args.strip_size * 1024 * 1024)
+    processor = ImageProcessor()
+    cases = [
+        ('resize', '', {'size': (size[0] // 3, size[1] // 3)}, args.tolerance),
+        ('convert', '.png', {'format_name': 'png'}, 0),
+        ('convert', '.tif', {'format_name': 'tiff'}, 0),
+        ('watermark', '', {'watermark_text': 'Tiled', 'position': 'center', 'opacity': 0.5}, 0),
+    ]
+
+    print(f"分段解码可用: {'是' if row_reads_supported() else '否 (全部退回整图处理)'}")
+    print(f"{'源图片':>10} {'操作':>14} {'整图(s)':>10} {'分条(s)':>10} {'最大差值':>10}")
+    work_dir = tempfile.mkdtemp(prefix='bench_tiled_')
+    failed = 0
+    try:
+        for mode in MODES:
+            img = make_source(size, mode)
+            for ext in ('.bmp', '.tif'):
+                source = os.path.join(work_dir, f"source_{mode}{ext}")
+                img.save(source)
+                for operation, output_ext, kwargs, tolerance in cases:
+                    output_ext = output_ext or ('.png' if ext == '.bmp' else ext)
+                    whole_path = os.path.join(work_dir, f"whole{output_ext}")
+                    tiled_path = os.path.join(work_dir, f"tiled{output_ext}")
+                    start = time.perf_counter()
+                    whole = processor.process_file(source, whole_path, operation, kwargs)
+                    whole_time = time.perf_counter() - start
+                    start = time.perf_counter()
+                    tiled = processor.process_file(source, tiled_path, operation,
+                                                   dict(kwargs, tiled=True, strip_bytes=strip_bytes))
+                    tiled_time = time.perf_counter() - start
+
+                    difference = None
+                    if whole['status'] == tiled['status'] == 'success':
+                        with Image.open(whole_path) as a, Image.open(tiled_path) as b:
+                            difference = max_difference(a, b)
+                    limit = tolerance + (1 if tolerance and mode == 'RGBA' else 0)
+                    ok = difference is not None and difference <= limit
+                    failed += not ok
+                    label = f"{operation}{output_ext if operation == 'convert' else ''}"
+                    print(f"{mode + ext:>10} {label:>14} {whole_time:>10.2f} {tiled_time:>10.2f} "
+                          f"{'不一致' if difference is None else difference:>10}{'' if ok else '  ✗'}")
+    finally:
+        shutil.rmtree(work_dir)
+
+    if failed:
+        print(f"{failed} 项分条结果与整图结果不一致")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
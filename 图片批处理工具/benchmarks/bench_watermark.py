@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+图片水印透明度处理基准测试
+
+对比逐像素Python循环（旧实现）与波段查找表（ImageProcessor.apply_opacity）
+在不同尺寸水印图片上的耗时，并校验两者输出逐像素一致。
+
+用法:
+    python benchmarks/bench_watermark.py [--sizes 250 500 1000] [--repeat 3]
+"""
+import os
+import sys
+import time
+import argparse
+import warnings
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(script_dir, "..", "src"))
+
+from PIL import Image
+from image_processor import ImageProcessor
+
+def legacy_apply_opacity(mark_img, opacity):
+    """旧版逐像素实现，仅用于对比"""
+    mark_img = mark_img.copy()
+    new_data = []
+    with warnings.catch_warnings():
+        # 新版Pillow已弃用getdata，这里保留原样以复现旧实现
+        warnings.simplefilter('ignore', DeprecationWarning)
+        mark_data = mark_img.getdata()
+    for item in mark_data:
+        new_data.append((item[0], item[1], item[2], int(item[3] * opacity) if len(item) > 3 else int(255 * opacity)))
+    mark_img.putdata(new_data)
+    return mark_img
+
+def make_logo(size):
+    """生成带有渐变alpha通道的合成水印图片"""
+    gradient = Image.linear_gradient('L').resize((size, size))
+    logo = Image.new('RGBA', (size, size), (200, 30, 90, 255))
+    logo.putalpha(gradient)
+    return logo
+
+def best_time(func, repeat):
+    """多次运行取最短耗时"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description='水印透明度处理基准测试')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[250, 500, 1000], help='水印边长列表')
+    parser.add_argument('--opacity', type=float, default=0.5, help='水印透明度 (0.0-1.0)')
+    parser.add_argument('--repeat', type=int, default=3, help='每项重复次数')
+    args = parser.parse_args()
+
+    print(f"{'尺寸':>12} {'旧实现(ms)':>12} {'新实现(ms)':>12} {'加速比':>10} {'一致':>6}")
+    for size in args.sizes:
+        logo = make_logo(size)
+        legacy_time, legacy_img = best_time(lambda: legacy_apply_opacity(logo, args.opacity), args.repeat)
+        new_time, new_img = best_time(lambda: ImageProcessor.apply_opacity(logo, args.opacity), args.repeat)
+        identical = legacy_img.tobytes() == new_img.tobytes()
+        print(f"{size}x{size:<7} {legacy_time * 1000:>12.2f} {new_time * 1000:>12.2f} "
+              f"{legacy_time / new_time:>9.0f}x {'是' if identical else '否':>6}")
+        if not identical:
+            return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
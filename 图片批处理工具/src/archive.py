@@ -0,0 +1,158 @@
+import os
+import io
+import time
+import tarfile
+import zipfile
+from journal import atomic_write, durable_replace
+
+# 归档扩展名 -> tarfile 写入模式（zip 单独处理）
+TAR_MODES = {
+    '.tar': 'w',
+    '.tar.gz': 'w:gz',
+    '.tgz': 'w:gz',
+    '.tar.bz2': 'w:bz2',
+    '.tar.xz': 'w:xz',
+}
+
+def archive_type(path):
+    """
+    根据扩展名判断归档类型
+
+    参数:
+        path (str): 文件路径
+
+    返回:
+        str: 'zip'、tarfile写入模式（如 'w:gz'），不是归档时返回None
+    """
+    name = path.lower()
+    if name.endswith('.zip'):
+        return 'zip'
+    for ext, mode in TAR_MODES.items():
+        if name.endswith(ext):
+            return mode
+    return None
+
+def is_archive(path):
+    """判断路径是否为zip或tar归档（输入须是已存在的文件，输出只看扩展名）"""
+    if os.path.isdir(path):
+        return False
+    return archive_type(path) is not None
+
+def safe_member_name(name):
+    """
+    规范化成员路径，拒绝绝对路径和指向归档外部的路径
+
+    参数:
+        name (str): 归档中的成员路径
+
+    返回:
+        str: 使用 / 分隔的相对路径，不安全时返回None
+    """
+    name = name.replace('\\', '/')
+    parts = [part for part in name.split('/') if part not in ('', '.')]
+    if name.startswith('/') or not parts or '..' in parts or ':' in parts[0]:
+        return None
+    return '/'.join(parts)
+
+def iter_members(path):
+    """
+    依次读取归档中的文件
+
+    tar 以流模式顺序读取，zip 逐个解压成员，任何时候内存中只有当前成员的内容。
+
+    参数:
+        path (str): 归档路径
+
+    返回:
+        generator: 依次产出 (成员路径, 文件内容)
+    """
+    if archive_type(path) == 'zip':
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    yield info.filename, archive.read(info)
+        return
+
+    with tarfile.open(path, 'r|*') as archive:
+        for member in archive:
+            if member.isfile():
+                yield member.name, archive.extractfile(member).read()
+
+def count_members(path):
+    """统计归档中的文件数（压缩的tar需要完整解压一遍）"""
+    if archive_type(path) == 'zip':
+        with zipfile.ZipFile(path) as archive:
+            return sum(1 for info in archive.infolist() if not info.is_dir())
+    with tarfile.open(path, 'r:*') as archive:
+        return sum(1 for member in archive if member.isfile())
+
+class ArchiveWriter:
+    """把文件内容直接写入zip或tar归档，先写入临时文件，完成后再替换为目标文件"""
+
+    def __init__(self, path):
+        """
+        创建归档
+
+        参数:
+            path (str): 归档路径，类型由扩展名决定
+        """
+        self.path = path
+        self.tmp_path = path + '.tmp'
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.kind = archive_type(path)
+        if self.kind == 'zip':
+            # 图片本身已经压缩，不再做deflate压缩
+            self.archive = zipfile.ZipFile(self.tmp_path, 'w', zipfile.ZIP_STORED, allowZip64=True)
+        else:
+            self.archive = tarfile.open(self.tmp_path, self.kind)
+
+    def write(self, name, data):
+        """
+        写入一个成员
+
+        参数:
+            name (str): 成员路径（使用 / 分隔）
+            data (bytes): 文件内容
+        """
+        if self.kind == 'zip':
+            self.archive.writestr(name, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = time.time()
+            self.archive.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        """完成归档并替换目标文件"""
+        self.archive.close()
+        durable_replace(self.tmp_path, self.path)
+
+    def abort(self):
+        """放弃写入并删除临时文件"""
+        self.archive.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+class DirectoryWriter:
+    """与 ArchiveWriter 接口相同，把成员写为输出目录下的文件（每个文件先写入临时文件再替换）"""
+
+    def __init__(self, path):
+        self.path = path
+        self.created_dirs = set()
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, name, data):
+        target = os.path.join(self.path, *name.split('/'))
+        directory = os.path.dirname(target)
+        if directory not in self.created_dirs:
+            os.makedirs(directory, exist_ok=True)
+            self.created_dirs.add(directory)
+        atomic_write(target, data)
+
+    def close(self):
+        pass
+
+    def abort(self):
+        pass
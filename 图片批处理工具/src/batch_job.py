@@ -0,0 +1,160 @@
+import time
+import queue
+import threading
+from archive import count_members, is_archive
+from scanner import scan_files
+
+class BatchJob:
+    """在后台线程中运行批处理任务，支持暂停、取消和进度查询"""
+
+    def __init__(self, processor, input_dir, output_dir, operation, **kwargs):
+        """
+        初始化批处理任务
+
+        参数:
+            processor (ImageProcessor): 图片处理器
+            input_dir (str): 输入目录
+            output_dir (str): 输出目录
+            operation (str): 操作类型
+            **kwargs: 传给 ImageProcessor.iter_batch 的其余参数
+        """
+        self.processor = processor
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.operation = operation
+        self.kwargs = kwargs
+
+        self.results = {'success': 0, 'fail': 0, 'skipped': 0, 'up_to_date': 0, 'duplicate': 0}
+        self.total = None
+        self.completed = 0
+        self.error = None
+        self.cancelled = False
+
+        self._records = queue.Queue()
+        self._resume_event = threading.Event()
+        self._resume_event.set()
+        self._cancel_event = threading.Event()
+        self._done_event = threading.Event()
+        self._start_time = None
+        self._paused_at = None
+        self._paused_total = 0.0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._counter = threading.Thread(target=self._count, daemon=True)
+
+    def start(self):
+        """启动后台处理线程和文件计数线程"""
+        self._start_time = time.perf_counter()
+        self._counter.start()
+        self._thread.start()
+
+    def pause(self):
+        """暂停处理：不再提交新的图片，已提交的图片照常处理完，其记录仍会产出"""
+        if self._resume_event.is_set():
+            self._paused_at = time.perf_counter()
+            self._resume_event.clear()
+
+    def resume(self):
+        """继续处理"""
+        if not self._resume_event.is_set():
+            self._paused_total += time.perf_counter() - self._paused_at
+            self._paused_at = None
+            self._resume_event.set()
+
+    def cancel(self):
+        """取消任务，正在处理的图片完成后停止"""
+        self._cancel_event.set()
+        self._resume_event.set()
+
+    @property
+    def paused(self):
+        return not self._resume_event.is_set()
+
+    @property
+    def finished(self):
+        """后台线程已结束且所有记录都已被取走"""
+        return self._done_event.is_set() and self._records.empty()
+
+    def drain(self, max_records=1000):
+        """
+        取出后台线程产生的处理记录，供界面线程批量更新
+
+        参数:
+            max_records (int): 本次最多取出的记录数
+
+        返回:
+            list: 处理记录列表
+        """
+        records = []
+        while len(records) < max_records:
+            try:
+                records.append(self._records.get_nowait())
+            except queue.Empty:
+                break
+        for record in records:
+            self.results[record['status']] += 1
+        self.completed += len(records)
+        return records
+
+    def elapsed(self):
+        """不含暂停时间的已运行秒数"""
+        if self._start_time is None:
+            return 0.0
+        now = self._paused_at or time.perf_counter()
+        return now - self._start_time - self._paused_total
+
+    def rate(self):
+        """每秒处理的文件数"""
+        elapsed = self.elapsed()
+        return self.completed / elapsed if elapsed > 0 else 0.0
+
+    def eta(self):
+        """预计剩余秒数，总数未知或尚无速度时返回None"""
+        rate = self.rate()
+        if self.total is None or rate <= 0:
+            return None
+        return max(self.total - self.completed, 0) / rate
+
+    def _count(self):
+        """在独立线程中统计输入文件总数，用于计算进度和剩余时间"""
+        try:
+            if is_archive(self.input_dir):
+                self.total = count_members(self.input_dir)
+                return
+            total = 0
+            for _ in scan_files(self.input_dir, self.kwargs.get('recursive', False), self.kwargs.get('include'),
+                                self.kwargs.get('exclude'), skip_dirs=[self.output_dir]):
+                if self._cancel_event.is_set():
+                    return
+                total += 1
+            self.total = total
+        except Exception:
+            self.total = None
+
+    def _run(self):
+        """后台线程主体，逐个取出处理记录放入队列"""
+        records = None
+        try:
+            records = self.processor.iter_batch(self.input_dir, self.output_dir, self.operation,
+                                                resume_event=self._resume_event, **self.kwargs)
+            for record in records:
+                self._records.put(record)
+                if self._cancel_event.is_set():
+                    self.cancelled = True
+                    break
+        except Exception as e:
+            self.error = e
+        finally:
+            if records is not None:
+                # 关闭生成器以保存清单并结束进程池
+                records.close()
+            self._done_event.set()
+
+def format_eta(seconds):
+    """将剩余秒数格式化为 时:分:秒"""
+    if seconds is None:
+        return "--:--"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
@@ -0,0 +1,76 @@
+import os
+import shutil
+from journal import durable_replace, temp_path
+from manifest import file_hash
+
+class ContentIndex:
+    """按文件内容查找重复文件：先按大小筛选，只有大小相同的文件才计算内容摘要"""
+
+    def __init__(self):
+        # (分组, 文件大小) -> [尚未计算摘要的第一个文件 (路径, 值), {摘要: 值}]
+        self.by_size = {}
+
+    def add(self, path, value, group=None):
+        """
+        登记一个文件
+
+        参数:
+            path (str): 文件路径
+            value: 与该文件关联的值（如输出路径）
+            group (optional): 分组，只在同一组内查找重复文件（如按输出扩展名分组，
+                内容相同但输出格式不同的文件不能复用输出）
+
+        返回:
+            同组内容相同的已登记文件的值，没有重复时登记该文件并返回None
+        """
+        size = os.path.getsize(path)
+        entry = self.by_size.get((group, size))
+        if entry is None:
+            self.by_size[(group, size)] = [(path, value), {}]
+            return None
+
+        first, digests = entry
+        if first is not None:
+            # 出现第二个同样大小的文件时才为第一个文件计算摘要
+            digests.setdefault(file_hash(first[0]), first[1])
+            entry[0] = None
+        digest = file_hash(path)
+        if digest in digests:
+            return digests[digest]
+        digests[digest] = value
+        return None
+
+def link_or_copy(source, target, mode='link'):
+    """
+    让 target 与 source 内容相同
+
+    参数:
+        source (str): 已存在的文件
+        target (str): 目标路径，已存在时会被替换
+        mode (str): 'link' 优先创建硬链接（跨文件系统等情况下退回复制），'copy' 直接复制
+    """
+    # 在临时路径上创建链接或副本，完成后原子地替换目标
+    tmp_path = temp_path(target)
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        if mode == 'link':
+            try:
+                os.link(source, tmp_path)
+            except OSError:
+                shutil.copyfile(source, tmp_path)
+        else:
+            shutil.copyfile(source, tmp_path)
+        durable_replace(tmp_path, target)
+    finally:
+        # 出错时，或目标已是指向 source 的硬链接（此时 rename 不做任何事）时，删除临时文件
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+
+def break_link(path):
+    """输出文件是硬链接时先删除，避免覆盖写入时同时改写了链接到它的其他输出"""
+    try:
+        if os.stat(path).st_nlink > 1:
+            os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,431 @@
+import os
+import json
+import time
+import socket
+import threading
+import socketserver
+import multiprocessing
+from collections import deque
+from archive import safe_member_name
+from image_processor import ImageProcessor
+from journal import JobJournal
+from manifest import params_fingerprint
+from scanner import scan_files
+
+# 通过JSON传输后需要还原为元组的参数
+_TUPLE_KEYS = ('size', 'position')
+
+def parse_address(text):
+    """
+    解析监听或连接地址
+
+    参数:
+        text (str): 'host:port'（TCP），或 'unix:/路径'、包含 / 的路径（Unix套接字）
+
+    返回:
+        tuple: (地址族, 地址)
+    """
+    if text.startswith('unix:'):
+        return socket.AF_UNIX, text[5:]
+    if '/' in text:
+        return socket.AF_UNIX, text
+    host, _, port = text.rpartition(':')
+    if not port.isdigit():
+        raise ValueError(f"无效的地址: {text} (应为 host:port 或 unix:/路径)")
+    return socket.AF_INET, (host or '127.0.0.1', int(port))
+
+def format_address(family, address):
+    if family == socket.AF_UNIX:
+        return f"unix:{address}"
+    return f"{address[0]}:{address[1]}"
+
+def _restore_tuples(value):
+    """把JSON解码后的尺寸、位置等列表还原为元组"""
+    if isinstance(value, dict):
+        return {key: tuple(item) if key in _TUPLE_KEYS and isinstance(item, list) else _restore_tuples(item)
+                for key, item in value.items()}
+    if isinstance(value, list):
+        return [_restore_tuples(item) for item in value]
+    return value
+
+class _Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+class _Handler(socketserver.StreamRequestHandler):
+    """每个连接一个线程，逐行读取JSON请求并回复"""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                break
+            reply = self.server.coordinator.dispatch(message)
+            self.wfile.write((json.dumps(reply, ensure_ascii=False) + '\n').encode('utf-8'))
+
+class Coordinator:
+    """
+    分布式批处理的协调器
+
+    流式扫描输入目录，把文件按 lease_size 个一组作为租约分发给工作进程。工作进程处理完一个租约后回报
+    处理记录；租约在 lease_timeout 秒内没有续约或回报时视为失败，重新分配给其他工作进程。
+    超时的多文件租约拆成单文件租约重新分配，同一个文件超时 max_attempts 次后记为失败，
+    避免导致工作进程崩溃的图片反复拖垮整组文件。每个文件的结果记入输出目录的作业日志，可以用 resume 继续。
+
+    协议为逐行JSON，工作进程的请求:
+        {'op': 'hello'}                                 -> 输入/输出目录、操作类型和参数
+        {'op': 'lease', 'worker': 名称}                 -> {'lease': 编号, 'files': [[相对路径, 输出相对路径], ...],
+                                                            'timeout': 秒} / {'wait': 秒} / {'done': True}
+        {'op': 'renew', 'lease': 编号}                  -> {'ok': 是否仍持有该租约}
+        {'op': 'report', 'lease': 编号, 'records': [...]} -> {'ok': True}
+    """
+
+    # 暂时没有可分配的租约（都在其他工作进程手中）时，让工作进程等待的秒数
+    WAIT_INTERVAL = 0.2
+
+    def __init__(self, processor, input_dir, output_dir, operation, lease_size=16, lease_timeout=120.0,
+                 max_attempts=3, recursive=False, include=None, exclude=None, resume=False, **kwargs):
+        """
+        初始化协调器
+
+        参数:
+            processor (ImageProcessor): 图片处理器，用于确定支持的格式和输出文件名
+            input_dir (str): 输入目录，工作进程须能以相同路径（或各自指定的挂载路径）访问
+            output_dir (str): 输出目录，作业日志保存在其中
+            operation (str): 操作类型 ('resize', 'convert', 'watermark', 'pipeline', 'renditions')
+            lease_size (int): 每个租约包含的文件数，越大通信开销越小，但工作进程失败时需要重做的文件越多
+            lease_timeout (float): 租约超时秒数，须明显大于单个文件的处理时间
+            max_attempts (int): 单个文件最多分配的次数
+            recursive (bool): 是否递归处理子目录
+            include (list, optional): 包含的通配符模式
+            exclude (list, optional): 排除的通配符模式
+            resume (bool): 继续上次中断的作业，见 ImageProcessor.iter_batch
+            **kwargs: 操作特定的参数
+        """
+        self.processor = processor
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.operation = operation
+        self.kwargs = kwargs
+        self.lease_size = max(1, lease_size)
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max(1, max_attempts)
+        self.recursive = recursive
+        self.include = include
+        self.exclude = exclude
+        self.resume = resume
+        self.results = {'success': 0, 'fail': 0, 'skipped': 0, 'up_to_date': 0, 'duplicate': 0}
+        # 每个工作进程完成的文件数
+        self.workers = {}
+        self.reassigned = 0
+
+    def serve(self, address, on_record=None, local_workers=0):
+        """
+        监听地址并分发租约，直到所有文件处理完成
+
+        参数:
+            address (str): 监听地址，见 parse_address；TCP端口为0时自动选择
+            on_record (callable, optional): 每收到一个文件的处理记录调用一次（在服务线程中调用），
+                记录额外包含 key（相对输入目录的路径）和 worker（工作进程名称）
+            local_workers (int): 在本机启动的工作进程数
+
+        返回:
+            dict: 处理结果统计
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.on_record = on_record
+        self.journal = JobJournal(self.output_dir, params_fingerprint(self.operation, self.kwargs), self.resume)
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._files = self._iter_files()
+        self._exhausted = False
+        self._next_id = 0
+        # 租约编号 -> {'files', 'attempts', 'deadline', 'worker'}，deadline 为None表示等待分配
+        self.leases = {}
+        self._pending = deque()
+        self._completed = set()
+
+        family, bind_address = parse_address(address)
+        if family == socket.AF_UNIX:
+            if os.path.exists(bind_address):
+                os.remove(bind_address)
+            server = _UnixServer(bind_address, _Handler)
+        else:
+            server = _Server(bind_address, _Handler)
+        server.coordinator = self
+        self.address = format_address(family, server.server_address)
+        print(f"协调器监听 {self.address}")
+
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        processes = start_workers(self.address, local_workers)
+        try:
+            while not self._done.wait(self.WAIT_INTERVAL):
+                with self._lock:
+                    self._expire_leases()
+                    # 提前准备好下一个租约；没有需要处理的文件时无需等待工作进程连接即可结束
+                    if not self._pending:
+                        self._prefetch()
+                    self._check_done()
+            # 稍等片刻，让仍在请求租约的工作进程收到结束通知
+            time.sleep(self.WAIT_INTERVAL)
+        finally:
+            server.shutdown()
+            server.server_close()
+            if family == socket.AF_UNIX and os.path.exists(bind_address):
+                os.remove(bind_address)
+            self.journal.close()
+            for process in processes:
+                process.join()
+        return self.results
+
+    def _iter_files(self):
+        """流式产出需要处理的 (相对路径, 输出相对路径)"""
+        for rel_path, input_path in scan_files(self.input_dir, self.recursive, self.include, self.exclude,
+                                               skip_dirs=[self.output_dir]):
+            key = rel_path.replace(os.sep, '/')
+            directory, filename = os.path.split(key)
+            if os.path.splitext(filename)[1].lower() not in self.processor.supported_formats:
+                self.results['skipped'] += 1
+                continue
+            out_key = '/'.join(filter(None, [directory, self.processor.output_filename(filename, self.operation,
+                                                                                       self.kwargs)]))
+            output_path = os.path.join(self.output_dir, *out_key.split('/'))
+            if self.journal.is_done(key, input_path,
+                                    self.processor.output_paths(output_path, self.operation, self.kwargs)):
+                self.results['up_to_date'] += 1
+                continue
+            yield [key, out_key]
+
+    def dispatch(self, message):
+        """处理一个工作进程请求，返回回复"""
+        op = message.get('op')
+        with self._lock:
+            if op == 'hello':
+                return {'input': os.path.abspath(self.input_dir), 'output': os.path.abspath(self.output_dir),
+                        'operation': self.operation, 'kwargs': self.kwargs}
+            if op == 'lease':
+                return self._grant(message.get('worker'))
+            if op == 'renew':
+                lease = self.leases.get(message.get('lease'))
+                if lease is None or lease['deadline'] is None:
+                    return {'ok': False}
+                lease['deadline'] = time.monotonic() + self.lease_timeout
+                return {'ok': True}
+            if op == 'report':
+                self._report(message.get('lease'), message.get('worker'), message.get('records', []))
+                return {'ok': True}
+        return {'error': f"未知的请求: {op}"}
+
+    def _grant(self, worker):
+        """分配一个租约：优先重新分配超时的租约，再从扫描结果中取新文件"""
+        self._expire_leases()
+        if not self._pending:
+            self._prefetch()
+        lease_id = None
+        while self._pending:
+            candidate = self._pending.popleft()
+            lease = self.leases.get(candidate)
+            if lease is None:
+                continue
+            # 超时拆分后原工作进程仍可能回报结果，已完成的文件不再分配
+            lease['files'] = [item for item in lease['files'] if item[0] not in self._completed]
+            if not lease['files']:
+                del self.leases[candidate]
+                continue
+            lease_id = candidate
+            break
+
+        if lease_id is None:
+            self._check_done()
+            if self._done.is_set():
+                return {'done': True}
+            return {'wait': self.WAIT_INTERVAL}
+
+        lease = self.leases[lease_id]
+        lease['attempts'] += 1
+        lease['deadline'] = time.monotonic() + self.lease_timeout
+        lease['worker'] = worker
+        return {'lease': lease_id, 'files': lease['files'], 'timeout': self.lease_timeout}
+
+    def _prefetch(self):
+        """从扫描结果中取出下一组文件作为等待分配的租约，扫描结束时标记为已取完"""
+        if self._exhausted:
+            return
+        files = []
+        for item in self._files:
+            files.append(item)
+            if len(files) >= self.lease_size:
+                break
+        else:
+            self._exhausted = True
+        if files:
+            self._pending.append(self._new_lease(files))
+
+    def _new_lease(self, files, attempts=0):
+        self._next_id += 1
+        self.leases[self._next_id] = {'files': files, 'attempts': attempts, 'deadline': None, 'worker': None}
+        return self._next_id
+
+    def _expire_leases(self):
+        """回收超时的租约，多文件租约拆为单文件租约，超过最大次数的文件记为失败"""
+        now = time.monotonic()
+        for lease_id, lease in list(self.leases.items()):
+            if lease['deadline'] is None or lease['deadline'] > now:
+                continue
+            del self.leases[lease_id]
+            self.reassigned += 1
+            files = [item for item in lease['files'] if item[0] not in self._completed]
+            if len(files) > 1:
+                for item in files:
+                    self._pending.append(self._new_lease([item], lease['attempts']))
+            elif files and lease['attempts'] < self.max_attempts:
+                lease['deadline'] = None
+                self.leases[lease_id] = lease
+                self._pending.append(lease_id)
+            elif files:
+                key, out_key = files[0]
+                record = self.processor._make_record(os.path.join(self.input_dir, *key.split('/')),
+                                                     os.path.join(self.output_dir, *out_key.split('/')), 'fail')
+                record['error'] = f"租约超时 {lease['attempts']} 次，处理该文件时工作进程可能崩溃或卡住"
+                record['key'] = key
+                record['worker'] = lease['worker']
+                self._finish(record)
+
+    def _report(self, lease_id, worker, records):
+        """接收租约的处理记录；租约已超时并重新分配时，仍接受尚未完成的文件的结果"""
+        self.leases.pop(lease_id, None)
+        for record in records:
+            if record.get('key') in self._completed:
+                continue
+            record['worker'] = worker
+            self._finish(record)
+            self.workers[worker] = self.workers.get(worker, 0) + 1
+        self._check_done()
+
+    def _finish(self, record):
+        self._completed.add(record['key'])
+        self.results[record['status']] += 1
+        if record['status'] in ('success', 'fail'):
+            self.journal.record(record['key'], os.path.join(self.input_dir, *record['key'].split('/')),
+                                record['status'])
+        if self.on_record:
+            self.on_record(record)
+
+    def _check_done(self):
+        if self._exhausted and not self.leases and not self._pending:
+            self._done.set()
+
+class _Connection:
+    """到协调器的连接，一问一答"""
+
+    def __init__(self, address):
+        family, connect_address = parse_address(address)
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.connect(connect_address)
+        self.file = self.sock.makefile('rwb')
+
+    def request(self, message):
+        self.file.write((json.dumps(message, ensure_ascii=False) + '\n').encode('utf-8'))
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("协调器已关闭连接")
+        return json.loads(line)
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+def run_worker(address, input_dir=None, output_dir=None, name=None):
+    """
+    连接协调器，循环领取租约、处理并回报结果，直到协调器通知全部完成
+
+    参数:
+        address (str): 协调器地址，见 parse_address
+        input_dir (str, optional): 本机上输入目录的路径，默认与协调器相同
+        output_dir (str, optional): 本机上输出目录的路径，默认与协调器相同
+        name (str, optional): 工作进程名称，默认为 主机名:进程号
+
+    返回:
+        int: 处理的文件数
+    """
+    name = name or f"{socket.gethostname()}:{os.getpid()}"
+    processor = ImageProcessor()
+    processed = 0
+    try:
+        connection = _Connection(address)
+    except OSError as e:
+        print(f"[{name}] 无法连接协调器 {address}: {e}")
+        return processed
+
+    try:
+        info = connection.request({'op': 'hello', 'worker': name})
+        input_root = input_dir or info['input']
+        output_root = output_dir or info['output']
+        operation = info['operation']
+        kwargs = _restore_tuples(info['kwargs'])
+        created_dirs = set()
+
+        while True:
+            reply = connection.request({'op': 'lease', 'worker': name})
+            if reply.get('done'):
+                break
+            if 'wait' in reply:
+                time.sleep(reply['wait'])
+                continue
+
+            records = []
+            last_renew = time.monotonic()
+            for key, out_key in reply['files']:
+                # 不信任协调器给出的路径，拒绝指向目录外部的路径
+                if safe_member_name(key) != key or safe_member_name(out_key) != out_key:
+                    record = processor._make_record(key, out_key, 'fail')
+                    record['error'] = "不安全的路径"
+                else:
+                    input_path = os.path.join(input_root, *key.split('/'))
+                    output_path = os.path.join(output_root, *out_key.split('/'))
+                    directory = os.path.dirname(output_path)
+                    if directory not in created_dirs:
+                        os.makedirs(directory, exist_ok=True)
+                        created_dirs.add(directory)
+                    record = processor.run_task((input_path, output_path, operation, kwargs))
+                record['key'] = key
+                records.append(record)
+                processed += 1
+
+                # 处理时间较长时续约，避免租约被判定为失败
+                if time.monotonic() - last_renew > reply['timeout'] / 3:
+                    connection.request({'op': 'renew', 'lease': reply['lease']})
+                    last_renew = time.monotonic()
+            connection.request({'op': 'report', 'lease': reply['lease'], 'worker': name, 'records': records})
+    except (OSError, ConnectionError) as e:
+        # 协调器退出时连接断开，已完成的租约都已回报
+        print(f"[{name}] 与协调器的连接中断: {e}")
+    finally:
+        connection.close()
+    return processed
+
+def start_workers(address, count, input_dir=None, output_dir=None):
+    """
+    在本机启动多个工作进程
+
+    参数:
+        address (str): 协调器地址
+        count (int): 进程数
+        input_dir (str, optional): 本机上输入目录的路径
+        output_dir (str, optional): 本机上输出目录的路径
+
+    返回:
+        list: multiprocessing.Process 列表，调用方负责 join
+    """
+    processes = []
+    for _ in range(count):
+        process = multiprocessing.Process(target=run_worker, args=(address, input_dir, output_dir), daemon=True)
+        process.start()
+        processes.append(process)
+    return processes
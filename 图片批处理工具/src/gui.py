@@ -2,13 +2,17 @@ import os
 import sys
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from image_processor import ImageProcessor
+from image_processor import ImageProcessor, resize_target
+from batch_job import BatchJob, format_eta
+
+# 结果区域最多显示的失败文件数
+MAX_FAILURE_LINES = 200
 
 class ImageProcessorGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("图片批处理工具")
-        self.root.geometry("600x700")
+        self.root.geometry("600x800")
         self.root.resizable(True, True)
         
         self.processor = ImageProcessor()
@@ -31,6 +35,31 @@ class ImageProcessorGUI:
         self.status_var.set("准备就绪")
         self.status_bar = tk.Label(root, textvariable=self.status_var, bd=1, relief=tk.SUNKEN, anchor=tk.W)
         self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        
+        # 批处理进度
+        self.job = None
+        self.create_progress_frame()
+    
+    def create_progress_frame(self):
+        """创建批处理进度区域"""
+        progress_frame = ttk.LabelFrame(self.root, text="批处理进度", padding=5)
+        progress_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=10)
+        
+        self.progress_bar = ttk.Progressbar(progress_frame, mode="determinate", maximum=100)
+        self.progress_bar.grid(row=0, column=0, columnspan=5, sticky="we", pady=5)
+        progress_frame.columnconfigure(0, weight=1)
+        
+        self.progress_var = tk.StringVar(value="空闲")
+        tk.Label(progress_frame, textvariable=self.progress_var, anchor=tk.W).grid(row=1, column=0, sticky="we")
+        
+        tk.Label(progress_frame, text="并行进程数:").grid(row=1, column=1, padx=5)
+        self.workers_var = tk.IntVar(value=1)
+        tk.Spinbox(progress_frame, from_=1, to=os.cpu_count() or 1, textvariable=self.workers_var, width=4).grid(row=1, column=2)
+        
+        self.pause_button = tk.Button(progress_frame, text="暂停", command=self.toggle_pause_job, width=8, state=tk.DISABLED)
+        self.pause_button.grid(row=1, column=3, padx=5)
+        self.cancel_button = tk.Button(progress_frame, text="取消", command=self.cancel_job, width=8, state=tk.DISABLED)
+        self.cancel_button.grid(row=1, column=4)
     
     def create_resize_tab(self):
         """创建调整大小选项卡"""
@@ -77,13 +106,19 @@ class ImageProcessorGUI:
         size_frame.grid(row=3, column=0, columnspan=3, sticky="we", pady=10)
         
         tk.Label(size_frame, text="宽度:").grid(row=0, column=0, sticky="w", pady=5)
-        self.width_var = tk.IntVar(value=800)
+        self.width_var = tk.StringVar(value="800")
         tk.Entry(size_frame, textvariable=self.width_var, width=10).grid(row=0, column=1, pady=5)
         
         tk.Label(size_frame, text="高度:").grid(row=1, column=0, sticky="w", pady=5)
-        self.height_var = tk.IntVar(value=600)
+        self.height_var = tk.StringVar(value="600")
         tk.Entry(size_frame, textvariable=self.height_var, width=10).grid(row=1, column=1, pady=5)
         
+        # 缩放模式，适应模式下宽或高可以留空，最长边模式使用宽度中填写的值
+        self.resize_fit_var = tk.StringVar(value="exact")
+        fit_modes = [("拉伸", "exact"), ("适应", "fit"), ("填充裁剪", "fill"), ("最长边", "max-edge")]
+        for i, (text, value) in enumerate(fit_modes):
+            tk.Radiobutton(size_frame, text=text, variable=self.resize_fit_var, value=value).grid(row=2, column=i, padx=5)
+        
         # 执行按钮
         tk.Button(resize_frame, text="开始处理", command=self.resize_images, width=20).grid(row=4, column=0, columnspan=3, pady=20)
         
@@ -387,7 +422,7 @@ class ImageProcessorGUI:
             # 根据操作类型执行相应的处理
             success = False
             if operation == 'resize' and 'size' in kwargs:
-                success = self.processor.resize_image(input_file, output_path, kwargs['size'])
+                success = self.processor.resize_image(input_file, output_path, kwargs['size'], mode=kwargs.get('mode', 'exact'))
             elif operation == 'convert' and 'format_name' in kwargs:
                 success = self.processor.convert_format(input_file, output_path, kwargs['format_name'])
             elif operation == 'watermark':
@@ -400,8 +435,17 @@ class ImageProcessorGUI:
     
     def resize_images(self):
         """调整图片大小"""
-        width = self.width_var.get()
-        height = self.height_var.get()
+        try:
+            width = int(self.width_var.get()) if self.width_var.get().strip() else None
+            height = int(self.height_var.get()) if self.height_var.get().strip() else None
+            fit_mode = self.resize_fit_var.get()
+            if fit_mode == 'max-edge':
+                size, fit_mode = resize_target(None, None, 'max-edge', max_edge=width)
+            else:
+                size, fit_mode = resize_target(width, height, fit_mode)
+        except ValueError as e:
+            messagebox.showerror("错误", f"尺寸设置无效: {e}")
+            return
         output_dir = self.resize_output_var.get()
         
         if not output_dir:
@@ -424,14 +468,8 @@ class ImageProcessorGUI:
                     messagebox.showerror("错误", "输入目录不存在")
                     return
                 
-                results = self.processor.batch_process(
-                    input_dir, 
-                    output_dir, 
-                    'resize', 
-                    size=(width, height)
-                )
-                
-                self.display_results(self.resize_result_text, results)
+                self.start_batch_job(self.resize_result_text, input_dir, output_dir, 'resize', size=size, mode=fit_mode)
+                return
             else:
                 input_file = self.resize_input_file_var.get()
                 if not input_file:
@@ -442,7 +480,8 @@ class ImageProcessorGUI:
                     'resize',
                     input_file,
                     output_dir,
-                    size=(width, height)
+                    size=size,
+                    mode=fit_mode
                 )
                 
                 if success:
@@ -484,14 +523,8 @@ class ImageProcessorGUI:
                     messagebox.showerror("错误", "输入目录不存在")
                     return
                 
-                results = self.processor.batch_process(
-                    input_dir, 
-                    output_dir, 
-                    'convert', 
-                    format_name=format_name
-                )
-                
-                self.display_results(self.convert_result_text, results)
+                self.start_batch_job(self.convert_result_text, input_dir, output_dir, 'convert', format_name=format_name)
+                return
             else:
                 input_file = self.convert_input_file_var.get()
                 if not input_file:
@@ -568,17 +601,17 @@ class ImageProcessorGUI:
                     messagebox.showerror("错误", "输入目录不存在")
                     return
                 
-                results = self.processor.batch_process(
-                    input_dir, 
-                    output_dir, 
-                    'watermark', 
+                self.start_batch_job(
+                    self.watermark_result_text,
+                    input_dir,
+                    output_dir,
+                    'watermark',
                     watermark_text=watermark_text,
                     watermark_image=watermark_image,
                     position=position,
                     opacity=opacity
                 )
-                
-                self.display_results(self.watermark_result_text, results)
+                return
             else:
                 input_file = self.watermark_input_file_var.get()
                 if not input_file:
@@ -609,6 +642,88 @@ class ImageProcessorGUI:
             messagebox.showerror("错误", f"处理时出错: {e}")
             self.status_var.set("处理失败")
     
+    def start_batch_job(self, text_widget, input_dir, output_dir, operation, **kwargs):
+        """在后台线程中启动批处理任务，界面保持响应"""
+        if self.job and not self.job.finished:
+            messagebox.showwarning("提示", "已有批处理任务正在运行，请等待完成或取消后再试")
+            self.status_var.set("正在处理中...")
+            return
+        try:
+            workers = max(self.workers_var.get(), 1)
+        except tk.TclError as e:
+            messagebox.showerror("错误", f"并行进程数设置无效: {e}")
+            return
+        
+        self.job = BatchJob(self.processor, input_dir, output_dir, operation, workers=workers, **kwargs)
+        self.job_text_widget = text_widget
+        # 已显示的失败信息行数
+        self.job_failure_lines = 0
+        text_widget.delete(1.0, tk.END)
+        
+        self.progress_bar.configure(mode="indeterminate", value=0)
+        self.progress_bar.start(20)
+        self.pause_button.configure(state=tk.NORMAL, text="暂停")
+        self.cancel_button.configure(state=tk.NORMAL)
+        
+        self.job.start()
+        self.root.after(100, self.poll_job)
+    
+    def poll_job(self):
+        """定时从后台任务取回处理记录并批量更新界面"""
+        job = self.job
+        for record in job.drain():
+            # 只显示前若干条失败信息，避免大批量任务中文本框无限增长
+            if record['status'] == 'fail' and self.job_failure_lines < MAX_FAILURE_LINES:
+                self.job_text_widget.insert(tk.END, f"失败: {os.path.basename(record['input'])}: {record['error']}\n")
+                self.job_failure_lines += 1
+        
+        if job.total is not None and str(self.progress_bar['mode']) == "indeterminate":
+            self.progress_bar.stop()
+            self.progress_bar.configure(mode="determinate")
+        if job.total:
+            self.progress_bar.configure(value=min(job.completed * 100 / job.total, 100))
+        
+        total = job.total if job.total is not None else "?"
+        state = "已暂停 | " if job.paused else ""
+        self.progress_var.set(f"{state}{job.completed}/{total} | {job.rate():.1f} 张/秒 | 剩余 {format_eta(job.eta())}")
+        
+        if not job.finished:
+            self.root.after(100, self.poll_job)
+            return
+        
+        self.progress_bar.stop()
+        self.progress_bar.configure(mode="determinate", value=100 if not job.cancelled else self.progress_bar['value'])
+        self.pause_button.configure(state=tk.DISABLED, text="暂停")
+        self.cancel_button.configure(state=tk.DISABLED)
+        
+        if job.error:
+            messagebox.showerror("错误", f"处理时出错: {job.error}")
+            self.status_var.set("处理失败")
+            return
+        
+        self.display_results(self.job_text_widget, job.results, job.output_dir)
+        self.status_var.set("已取消" if job.cancelled else "处理完成")
+    
+    def toggle_pause_job(self):
+        """暂停或继续当前批处理任务"""
+        if not self.job or self.job.finished:
+            return
+        if self.job.paused:
+            self.job.resume()
+            self.pause_button.configure(text="暂停")
+            self.status_var.set("正在处理中...")
+        else:
+            self.job.pause()
+            self.pause_button.configure(text="继续")
+            self.status_var.set("已暂停，正在处理的图片完成后停止")
+    
+    def cancel_job(self):
+        """取消当前批处理任务"""
+        if self.job and not self.job.finished:
+            self.job.cancel()
+            self.cancel_button.configure(state=tk.DISABLED)
+            self.status_var.set("正在取消...")
+    
     def validate_directories(self, input_dir, output_dir):
         """验证输入和输出目录"""
         if not input_dir:
@@ -632,25 +747,25 @@ class ImageProcessorGUI:
         
         return True
     
-    def display_results(self, text_widget, results):
+    def display_results(self, text_widget, results, output_path=None):
         """显示处理结果"""
-        text_widget.delete(1.0, tk.END)
-        text_widget.insert(tk.END, f"处理完成!\n\n")
+        text_widget.insert(tk.END, f"\n处理完成!\n\n")
         text_widget.insert(tk.END, f"成功: {results['success']} 张图片\n")
         text_widget.insert(tk.END, f"失败: {results['fail']} 张图片\n")
         text_widget.insert(tk.END, f"跳过: {results['skipped']} 个文件 (非支持的图片格式)\n")
         
-        # 根据当前活动的选项卡获取正确的输出目录
-        current_tab = self.notebook.select()
-        tab_index = self.notebook.index(current_tab)
-        
-        output_path = ""
-        if tab_index == 0:  # 调整大小选项卡
-            output_path = self.resize_output_var.get()
-        elif tab_index == 1:  # 格式转换选项卡
-            output_path = self.convert_output_var.get()
-        elif tab_index == 2:  # 添加水印选项卡
-            output_path = self.watermark_output_var.get()
+        # 未指定时根据当前活动的选项卡获取正确的输出目录
+        if output_path is None:
+            current_tab = self.notebook.select()
+            tab_index = self.notebook.index(current_tab)
+            
+            output_path = ""
+            if tab_index == 0:  # 调整大小选项卡
+                output_path = self.resize_output_var.get()
+            elif tab_index == 1:  # 格式转换选项卡
+                output_path = self.convert_output_var.get()
+            elif tab_index == 2:  # 添加水印选项卡
+                output_path = self.watermark_output_var.get()
         
         if results['success'] > 0:
             text_widget.insert(tk.END, f"\n处理完成的图片已保存到: {os.path.abspath(output_path)}")
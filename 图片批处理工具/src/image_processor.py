@@ -1,54 +1,358 @@
+import io
 import os
+import math
+import posixpath
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from PIL import Image, ImageDraw, ImageFont
+from archive import ArchiveWriter, DirectoryWriter, is_archive, iter_members, safe_member_name
+from dedup import ContentIndex, break_link, link_or_copy
+from journal import JobJournal, durable_replace, temp_path
+from manifest import BatchManifest, params_fingerprint
+from scanner import path_selected, scan_files
+from scheduler import MemoryScheduler, estimate_footprint
+from staged import BUFFERED_OPERATIONS
+from tiling import DEFAULT_STRIP_BYTES, RowReader, STRIP_WRITERS, iter_row_bands, stream_mode, strip_rows
+
+# 缩放质量档位: 名称 -> reducing_gap
+# None 表示完整解码后直接LANCZOS缩放；数值越小，解码和预缩小越激进，速度越快
+RESIZE_QUALITIES = {
+    'high': None,
+    'balanced': 3.0,
+    'fast': 1.0,
+}
+
+# 缩放模式: exact 拉伸到指定尺寸；fit 保持宽高比缩小到指定范围内（宽或高可省略）；
+# fill/cover 保持宽高比铺满指定尺寸并居中裁剪；max-edge 最长边不超过指定值
+RESIZE_MODES = ('exact', 'fit', 'fill', 'cover', 'max-edge')
+
+def resize_target(width, height, mode='exact', max_edge=None):
+    """
+    检查缩放参数
+    
+    指定了 max_edge 时使用 'max-edge' 模式；'fit' 模式只需宽或高之一，其余模式需要同时指定宽和高。
+    
+    参数:
+        width (int): 目标宽度，可以为None
+        height (int): 目标高度，可以为None
+        mode (str): 缩放模式，见 RESIZE_MODES
+        max_edge (int, optional): 最长边尺寸
+    
+    返回:
+        tuple: (目标尺寸, 缩放模式)，参数不完整时抛出 ValueError
+    """
+    if max_edge is not None:
+        return (max_edge, max_edge), 'max-edge'
+    if mode not in RESIZE_MODES:
+        raise ValueError(f"未知的缩放模式: {mode}")
+    if mode == 'max-edge':
+        raise ValueError("max-edge 模式需要指定最长边尺寸")
+    if mode == 'fit':
+        if not width and not height:
+            raise ValueError("fit 模式至少需要指定宽度或高度")
+    elif not width or not height:
+        raise ValueError(f"{mode} 模式需要同时指定宽度和高度")
+    return (width, height), mode
+
+# 编码档位: 名称 -> {格式: 保存参数}，未列出的格式使用Pillow默认参数
+ENCODER_PROFILES = {
+    'default': {},
+    # 编码最快，适合实时生成
+    'web-fast': {
+        'JPEG': {'quality': 80, 'subsampling': '4:2:0'},
+        'WEBP': {'quality': 80, 'method': 0},
+        'PNG': {'compress_level': 1},
+    },
+    # 体积最小，适合CDN分发
+    'web-small': {
+        'JPEG': {'quality': 75, 'optimize': True, 'progressive': True, 'subsampling': '4:2:0'},
+        'WEBP': {'quality': 75, 'method': 6},
+        'PNG': {'optimize': True},
+    },
+    # 高保真存档
+    'archive': {
+        'JPEG': {'quality': 95, 'optimize': True, 'subsampling': '4:4:4'},
+        'WEBP': {'lossless': True, 'quality': 100, 'method': 4},
+        'PNG': {'compress_level': 9},
+        'TIFF': {'compression': 'tiff_lzw'},
+    },
+}
+
+# 可以保存多帧动画的格式
+ANIMATED_FORMATS = ('GIF', 'WEBP', 'PNG')
+
+# 可以通过质量参数控制输出大小的格式，以及按目标大小搜索时的质量范围
+QUALITY_FORMATS = ('JPEG', 'WEBP')
+MIN_QUALITY = 10
+MAX_QUALITY = 95
+
+@lru_cache(maxsize=16)
+def load_font(font_name="arial.ttf", font_size=36):
+    """
+    加载字体，同一字体和字号只加载一次
+    
+    参数:
+        font_name (str): 字体文件名或路径
+        font_size (int): 字号
+    
+    返回:
+        ImageFont: 字体对象，加载失败时返回相同字号的默认字体
+    """
+    try:
+        return ImageFont.truetype(font_name, font_size)
+    except IOError:
+        # Pillow 10.1 起默认字体可以指定字号，更早的版本只有固定大小的位图字体
+        try:
+            return ImageFont.load_default(font_size)
+        except TypeError:
+            return ImageFont.load_default()
+
+# 仅用于测量文本尺寸的绘图对象
+_measure_draw = ImageDraw.Draw(Image.new('RGBA', (1, 1)))
+
+# 文本水印的字体和默认字号
+WATERMARK_FONT = "arial.ttf"
+WATERMARK_FONT_SIZE = 36
+# 按图片宽度计算字号时，字号取相邻约9%（每倍频程8档）的档位，分辨率相近的图片共用同一个预渲染文本图块
+FONT_SIZE_STEPS = 8
 
 class ImageProcessor:
     """图片处理类，提供调整大小、格式转换和添加水印功能"""
     
     def __init__(self):
         """初始化图片处理器"""
-        self.supported_formats = ['.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp']
+        self.supported_formats = ['.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp', '.tif', '.tiff']
+        # 已准备好的水印图片缓存 (LRU)，批处理时每种尺寸的水印只生成一次
+        self.watermark_cache_size = 16
+        self._watermark_sources = OrderedDict()
+        self._watermark_cache = OrderedDict()
+        # 预渲染的文本水印图块缓存 (LRU)，文本、字号和透明度相同的图片只需粘贴图块
+        self._text_stamps = OrderedDict()
     
-    def resize_image(self, image_path, output_path, size):
+    def resize_image(self, image_path, output_path, size, quality='high', mode='exact'):
         """
-        调整图片大小
+        调整图片大小，动画图片的每一帧都会被缩放
         
         参数:
             image_path (str): 原图片路径
             output_path (str): 输出图片路径
-            size (tuple): 目标尺寸 (宽, 高)
+            size (tuple): 目标尺寸 (宽, 高)，'fit' 模式下宽或高可以为None
+            quality (str): 缩放质量档位 ('high', 'balanced', 'fast')，见 RESIZE_QUALITIES
+            mode (str): 缩放模式 ('exact', 'fit', 'fill', 'cover', 'max-edge')，见 RESIZE_MODES
         """
         try:
-            with Image.open(image_path) as img:
-                resized_img = img.resize(size, Image.LANCZOS)
-                resized_img.save(output_path)
-                return True
+            steps = self.operation_steps('resize', {'size': size, 'quality': quality, 'mode': mode})
+            self._run_pipeline(image_path, output_path, steps)
+            return True
         except Exception as e:
             print(f"调整图片大小时出错: {e}")
             return False
     
-    def convert_format(self, image_path, output_path, format_name):
+    @staticmethod
+    def resize_plan(src_size, size, mode='exact'):
+        """
+        根据缩放模式计算输出尺寸和需要从原图中取用的区域
+        
+        参数:
+            src_size (tuple): 原图尺寸 (宽, 高)
+            size (tuple): 目标尺寸 (宽, 高)，'fit' 模式下宽或高可以为None表示不限制
+            mode (str): 缩放模式，见 RESIZE_MODES
+        
+        返回:
+            tuple: (输出尺寸, 原图裁剪框)，不需要裁剪时裁剪框为None
+        """
+        width, height = src_size
+        target_width, target_height = size
+        if mode == 'exact':
+            return (target_width, target_height), None
+        
+        if mode in ('fit', 'max-edge'):
+            # 与 thumbnail 一致，只缩小不放大
+            ratios = [1.0]
+            if target_width:
+                ratios.append(target_width / width)
+            if target_height:
+                ratios.append(target_height / height)
+            ratio = min(ratios)
+            return (max(1, round(width * ratio)), max(1, round(height * ratio))), None
+        
+        if mode in ('fill', 'cover'):
+            # 铺满目标尺寸后居中裁剪：只对原图中保留的区域做重采样
+            ratio = max(target_width / width, target_height / height)
+            box_width, box_height = target_width / ratio, target_height / ratio
+            left, top = (width - box_width) / 2, (height - box_height) / 2
+            return (target_width, target_height), (left, top, left + box_width, top + box_height)
+        
+        raise ValueError(f"未知的缩放模式: {mode}")
+    
+    @classmethod
+    def prepare_decode(cls, img, size, quality='high', mode='exact'):
+        """
+        在解码前为缩小操作设置JPEG草稿模式
+        
+        JPEG解码器可以直接以1/2、1/4或1/8的比例解码，必须在图片数据加载前调用。
+        'high' 档位以及非JPEG图片不做任何处理。
+        
+        参数:
+            img (PIL.Image.Image): 尚未加载像素数据的图片
+            size (tuple): 目标尺寸 (宽, 高)
+            quality (str): 缩放质量档位
+            mode (str): 缩放模式
+        """
+        reducing_gap = RESIZE_QUALITIES[quality]
+        if reducing_gap is None or img.format != 'JPEG':
+            return
+        (width, height), box = cls.resize_plan(img.size, size, mode)
+        if box:
+            # 裁剪时按保留区域的缩小比例换算整幅图需要的解码尺寸
+            width *= img.width / (box[2] - box[0])
+            height *= img.height / (box[3] - box[1])
+        img.draft(None, (int(width * reducing_gap), int(height * reducing_gap)))
+    
+    @classmethod
+    def apply_resize(cls, img, size, quality='high', mode='exact'):
+        """
+        缩放内存中的图片
+        
+        非 'high' 档位先用整数倍 reduce() 快速缩小到目标尺寸的 reducing_gap 倍以内，
+        再用LANCZOS完成最终缩放（与 Image.thumbnail 相同的做法）。
+        裁剪模式下只对保留区域重采样。
+        
+        参数:
+            img (PIL.Image.Image): 原图片
+            size (tuple): 目标尺寸 (宽, 高)
+            quality (str): 缩放质量档位
+            mode (str): 缩放模式，见 RESIZE_MODES
+        
+        返回:
+            PIL.Image.Image: 缩放后的图片
+        """
+        size, box = cls.resize_plan(img.size, size, mode)
+        return img.resize(size, Image.LANCZOS, box=box, reducing_gap=RESIZE_QUALITIES[quality])
+    
+    def convert_format(self, image_path, output_path, format_name, profile=None, max_bytes=None):
         """
         转换图片格式
         
         参数:
             image_path (str): 原图片路径
             output_path (str): 输出图片路径
-            format_name (str): 目标格式 ('JPEG', 'PNG', 'BMP', 'GIF', 'WEBP')
+            format_name (str): 目标格式 ('JPEG', 'PNG', 'BMP', 'GIF', 'WEBP', 'TIFF')
+            profile (str, optional): 编码档位，见 ENCODER_PROFILES
+            max_bytes (int, optional): 输出大小上限（字节），JPEG和WEBP会在内存中搜索满足上限的最高质量
         """
         try:
-            with Image.open(image_path) as img:
-                # 如果转换为JPEG, 确保图片是RGB模式
-                if format_name.upper() == 'JPEG' and img.mode == 'RGBA':
-                    img = img.convert('RGB')
-                img.save(output_path, format_name.upper())
-                return True
+            steps = self.operation_steps('convert', {'format_name': format_name, 'profile': profile, 'max_bytes': max_bytes})
+            self._run_pipeline(image_path, output_path, steps)
+            return True
         except Exception as e:
             print(f"转换图片格式时出错: {e}")
             return False
     
-    def add_watermark(self, image_path, output_path, watermark_text=None, watermark_image=None, position=(0, 0), opacity=0.5):
+    @staticmethod
+    def prepare_for_format(img, format_name):
         """
-        添加水印
+        使图片模式与目标格式兼容
+        
+        参数:
+            img (PIL.Image.Image): 图片
+            format_name (str): 目标格式
+        
+        返回:
+            PIL.Image.Image: 可以直接保存为目标格式的图片
+        """
+        # 如果转换为JPEG, 确保图片是RGB模式（调色板和带透明通道的图片都无法直接保存为JPEG）
+        if format_name.upper() == 'JPEG' and img.mode not in ('RGB', 'L', 'CMYK'):
+            img = img.convert('RGB')
+        return img
+    
+    @staticmethod
+    def encoder_options(format_name, profile=None):
+        """
+        查询编码档位中某种格式的保存参数
+        
+        参数:
+            format_name (str): 输出格式
+            profile (str, optional): 编码档位名称，None表示Pillow默认参数
+        
+        返回:
+            dict: 传给 Image.save 的参数
+        """
+        if profile is not None and profile not in ENCODER_PROFILES:
+            raise ValueError(f"未知的编码档位: {profile}")
+        return dict(ENCODER_PROFILES[profile or 'default'].get((format_name or '').upper(), {}))
+    
+    def encode_image(self, img, target, format_name, profile=None, max_bytes=None):
+        """
+        按编码档位保存图片
+        
+        参数:
+            img (PIL.Image.Image): 要保存的图片
+            target (str 或 文件对象): 输出路径或文件对象
+            format_name (str): 输出格式
+            profile (str, optional): 编码档位
+            max_bytes (int, optional): 输出大小上限，仅对JPEG和WEBP有效，其他格式按档位参数保存
+        """
+        options = self.encoder_options(format_name, profile)
+        if not max_bytes or (format_name or '').upper() not in QUALITY_FORMATS:
+            img.save(target, format_name, **options)
+            return
+        
+        data = self.encode_to_size(img, format_name, max_bytes, options)
+        if isinstance(target, str):
+            with open(target, 'wb') as f:
+                f.write(data)
+        else:
+            target.write(data)
+    
+    @staticmethod
+    def encode_to_size(img, format_name, max_bytes, options=None):
+        """
+        在内存中二分搜索质量参数，返回不超过 max_bytes 的最高质量编码结果
+        
+        档位中的质量作为搜索上限；最低质量仍超出上限时返回最低质量的结果。
+        
+        参数:
+            img (PIL.Image.Image): 要编码的图片
+            format_name (str): 'JPEG' 或 'WEBP'
+            max_bytes (int): 输出大小上限（字节）
+            options (dict, optional): 其余保存参数
+        
+        返回:
+            bytes: 编码后的内容
+        """
+        options = dict(options or {})
+        # 有损搜索时忽略无损参数
+        options.pop('lossless', None)
+        low, high = MIN_QUALITY, min(options.pop('quality', MAX_QUALITY), MAX_QUALITY)
+        
+        def encode(quality):
+            buffer = io.BytesIO()
+            img.save(buffer, format_name, quality=quality, **options)
+            return buffer.getvalue()
+        
+        # 上限质量已满足时无需搜索
+        data = encode(high)
+        if len(data) <= max_bytes:
+            return data
+        best = None
+        high -= 1
+        while low <= high:
+            quality = (low + high) // 2
+            data = encode(quality)
+            if len(data) <= max_bytes:
+                best = data
+                low = quality + 1
+            else:
+                high = quality - 1
+        return best if best is not None else encode(MIN_QUALITY)
+    
+    def add_watermark(self, image_path, output_path, watermark_text=None, watermark_image=None, position=(0, 0), opacity=0.5,
+                      font_scale=None):
+        """
+        添加水印，动画图片的每一帧都会添加水印
         
         参数:
             image_path (str): 原图片路径
@@ -57,129 +361,1143 @@ class ImageProcessor:
             watermark_image (str, optional): 水印图片路径
             position (tuple): 水印位置 (x, y) 或 'center'
             opacity (float): 水印透明度 (0.0-1.0)
+            font_scale (float, optional): 文本水印字号与图片宽度之比，None表示固定字号
         """
         try:
-            with Image.open(image_path) as img:
-                # 确保图片是RGB或RGBA
-                if img.mode != 'RGBA' and img.mode != 'RGB':
-                    img = img.convert('RGBA')
-                
-                # 创建一个透明的图层用于添加水印
-                watermark_layer = Image.new('RGBA', img.size, (0, 0, 0, 0))
-                draw = ImageDraw.Draw(watermark_layer)
-                
-                if watermark_text:
-                    # 尝试加载字体，如果失败则使用默认字体
-                    try:
-                        font = ImageFont.truetype("arial.ttf", 36)
-                    except IOError:
-                        font = ImageFont.load_default()
-                    
-                    # 计算文本大小
-                    text_size = draw.textbbox((0, 0), watermark_text, font=font)[2:]
-                    
-                    # 确定水印位置
-                    if position == 'center':
-                        position = ((img.width - text_size[0]) // 2, (img.height - text_size[1]) // 2)
-                    
-                    # 绘制文本水印
-                    draw.text(position, watermark_text, font=font, fill=(255, 255, 255, int(255 * opacity)))
-                
-                elif watermark_image:
-                    # 添加图片水印
-                    with Image.open(watermark_image) as mark_img:
-                        # 调整水印图片大小
-                        mark_width, mark_height = mark_img.size
-                        if mark_width > img.width // 3:
-                            ratio = (img.width // 3) / mark_width
-                            mark_width = int(mark_width * ratio)
-                            mark_height = int(mark_height * ratio)
-                            mark_img = mark_img.resize((mark_width, mark_height), Image.LANCZOS)
-                        
-                        # 确定水印位置
-                        if position == 'center':
-                            position = ((img.width - mark_width) // 2, (img.height - mark_height) // 2)
-                        
-                        # 将水印图片粘贴到透明层
-                        if mark_img.mode != 'RGBA':
-                            mark_img = mark_img.convert('RGBA')
-                        
-                        # 调整水印图片透明度
-                        mark_data = mark_img.getdata()
-                        new_data = []
-                        for item in mark_data:
-                            # 修改alpha通道的值
-                            new_data.append((item[0], item[1], item[2], int(item[3] * opacity) if len(item) > 3 else int(255 * opacity)))
-                        
-                        mark_img.putdata(new_data)
-                        watermark_layer.paste(mark_img, position, mark_img)
-                
-                # 将水印层与原图合并
-                result = Image.alpha_composite(img.convert('RGBA'), watermark_layer)
-                
-                # 保存结果
-                if os.path.splitext(output_path)[1].lower() == '.jpg' or os.path.splitext(output_path)[1].lower() == '.jpeg':
-                    result = result.convert('RGB')
-                
-                result.save(output_path)
-                return True
+            steps = self.operation_steps('watermark', {
+                'watermark_text': watermark_text,
+                'watermark_image': watermark_image,
+                'position': position,
+                'opacity': opacity,
+                'font_scale': font_scale
+            })
+            self._run_pipeline(image_path, output_path, steps)
+            return True
         except Exception as e:
             print(f"添加水印时出错: {e}")
             return False
     
-    def batch_process(self, input_dir, output_dir, operation, **kwargs):
+    def apply_watermark(self, img, watermark_text=None, watermark_image=None, position='center', opacity=0.5, mode=None,
+                        font_scale=None):
         """
-        批量处理图片
+        在内存中的图片上添加水印
+        
+        只在水印覆盖的矩形区域内进行alpha合成，内存占用和耗时与水印大小而非原图大小成正比。
+        RGB和RGBA图片会被直接修改，其他模式先转换为RGBA。
+        
+        参数:
+            img (PIL.Image.Image): 原图片
+            watermark_text (str, optional): 水印文字
+            watermark_image (str, optional): 水印图片路径
+            position (tuple): 水印位置 (x, y) 或 'center'
+            opacity (float): 水印透明度 (0.0-1.0)
+            mode (str, optional): 结果图片模式，默认RGB图片保持RGB，其余为RGBA
+            font_scale (float, optional): 文本水印字号与图片宽度之比，None表示固定字号
+        
+        返回:
+            PIL.Image.Image: 添加水印后的图片
+        """
+        # 确保图片是RGB或RGBA
+        if img.mode != 'RGBA' and img.mode != 'RGB':
+            img = img.convert('RGBA')
+        
+        tile, position = self.watermark_tile(img.size, watermark_text, watermark_image, position, opacity, font_scale)
+        if tile is not None:
+            self._composite_region(img, tile, position)
+        
+        if mode and img.mode != mode:
+            img = img.convert(mode)
+        return img
+    
+    def watermark_tile(self, size, watermark_text=None, watermark_image=None, position='center', opacity=0.5,
+                       font_scale=None):
+        """
+        生成水印图块及其在目标图片中的位置
         
         参数:
-            input_dir (str): 输入目录
-            output_dir (str): 输出目录
+            size (tuple): 目标图片尺寸 (宽, 高)
+            watermark_text (str, optional): 水印文字
+            watermark_image (str, optional): 水印图片路径
+            position (tuple): 水印位置 (x, y) 或 'center'
+            opacity (float): 水印透明度 (0.0-1.0)
+            font_scale (float, optional): 文本水印字号与图片宽度之比，None表示固定字号
+        
+        返回:
+            tuple: (RGBA水印图块, 图块左上角坐标)，没有水印时图块为None。文本水印图块为缓存中的共享对象，调用方不应修改
+        """
+        tile = None
+        if watermark_text:
+            font_size = self.font_size_for(size[0], font_scale) if font_scale else WATERMARK_FONT_SIZE
+            tile, (left, top), text_size = self.text_stamp(watermark_text, font_size, opacity)
+            
+            # 确定水印位置
+            if position == 'center':
+                position = ((size[0] - text_size[0]) // 2, (size[1] - text_size[1]) // 2)
+            position = (position[0] + left, position[1] + top)
+        
+        elif watermark_image:
+            # 添加图片水印 (缩放和透明度处理结果在批处理中复用)
+            mark_img = self.prepare_watermark(watermark_image, size[0] // 3, opacity)
+            mark_width, mark_height = mark_img.size
+            
+            # 确定水印位置
+            if position == 'center':
+                position = ((size[0] - mark_width) // 2, (size[1] - mark_height) // 2)
+            
+            # 将水印图片粘贴到水印大小的透明图块
+            tile = Image.new('RGBA', mark_img.size, (0, 0, 0, 0))
+            tile.paste(mark_img, (0, 0), mark_img)
+        
+        return tile, position
+    
+    def text_stamp(self, text, font_size, opacity):
+        """
+        获取预渲染的文本水印图块
+        
+        结果按 (文本, 字体, 字号, 透明度) 缓存，批处理中每种字号的文本只测量和光栅化一次。
+        
+        参数:
+            text (str): 水印文字
+            font_size (int): 字号
+            opacity (float): 水印透明度 (0.0-1.0)
+        
+        返回:
+            tuple: (文本包围盒大小的RGBA图块, 在原点绘制时包围盒左上角的偏移, 在原点绘制时文本的右下角坐标)
+        """
+        key = (text, WATERMARK_FONT, font_size, opacity)
+        stamp = self._cache_get(self._text_stamps, key)
+        if stamp is not None:
+            return stamp
+        
+        # 尝试加载字体，如果失败则使用默认字体
+        font = load_font(WATERMARK_FONT, font_size)
+        # 整数坐标处绘制的文本包围盒只是原点处包围盒的平移，因此图块与绘制位置无关
+        left, top, right, bottom = _measure_draw.textbbox((0, 0), text, font=font)
+        tile = Image.new('RGBA', (max(right - left, 1), max(bottom - top, 1)), (0, 0, 0, 0))
+        ImageDraw.Draw(tile).text((-left, -top), text, font=font, fill=(255, 255, 255, int(255 * opacity)))
+        stamp = (tile, (left, top), (right, bottom))
+        self._cache_put(self._text_stamps, key, stamp)
+        return stamp
+    
+    @staticmethod
+    def font_size_for(width, font_scale):
+        """
+        按图片宽度计算文本水印字号，取最接近的档位（见 FONT_SIZE_STEPS）
+        
+        参数:
+            width (int): 图片宽度
+            font_scale (float): 字号与图片宽度之比
+        
+        返回:
+            int: 字号
+        """
+        target = max(width * font_scale, 1)
+        bucket = round(math.log2(target) * FONT_SIZE_STEPS)
+        return max(1, round(2 ** (bucket / FONT_SIZE_STEPS)))
+    
+    @staticmethod
+    def _composite_region(img, tile, position):
+        """将RGBA图块alpha合成到图片的对应区域，超出图片的部分被裁掉"""
+        x, y = position
+        box = (max(x, 0), max(y, 0), min(x + tile.width, img.width), min(y + tile.height, img.height))
+        if box[2] <= box[0] or box[3] <= box[1]:
+            return
+        
+        if box != (x, y, x + tile.width, y + tile.height):
+            tile = tile.crop((box[0] - x, box[1] - y, box[2] - x, box[3] - y))
+        
+        region = img.crop(box)
+        if region.mode == 'RGBA':
+            region = Image.alpha_composite(region, tile)
+        else:
+            region = Image.alpha_composite(region.convert('RGBA'), tile).convert(region.mode)
+        img.paste(region, box[:2])
+    
+    def prepare_watermark(self, watermark_image, max_width, opacity):
+        """
+        获取缩放并调整透明度后的RGBA水印图片
+        
+        结果按 (水印路径, 修改时间, 目标宽度, 透明度) 缓存，水印宽度不超过
+        max_width 时所有尺寸的原图共用同一个缓存项。返回的图片为共享对象，调用方不应修改。
+        
+        参数:
+            watermark_image (str): 水印图片路径
+            max_width (int): 水印允许的最大宽度
+            opacity (float): 水印透明度 (0.0-1.0)
+        
+        返回:
+            PIL.Image.Image: 处理好的RGBA水印图片
+        """
+        source_key = (os.path.abspath(watermark_image), os.stat(watermark_image).st_mtime_ns)
+        source = self._cache_get(self._watermark_sources, source_key)
+        if source is None:
+            with Image.open(watermark_image) as mark_img:
+                mark_img.load()
+                source = mark_img.copy()
+            self._cache_put(self._watermark_sources, source_key, source)
+        
+        # 只有需要缩小时目标宽度才影响结果
+        target_width = max_width if source.width > max_width else None
+        key = source_key + (target_width, opacity)
+        mark_img = self._cache_get(self._watermark_cache, key)
+        if mark_img is not None:
+            return mark_img
+        
+        mark_img = source
+        if target_width is not None:
+            ratio = target_width / mark_img.width
+            mark_width = int(mark_img.width * ratio)
+            mark_height = int(mark_img.height * ratio)
+            mark_img = mark_img.resize((mark_width, mark_height), Image.LANCZOS)
+        
+        if mark_img.mode != 'RGBA':
+            mark_img = mark_img.convert('RGBA')
+        
+        mark_img = self.apply_opacity(mark_img, opacity)
+        self._cache_put(self._watermark_cache, key, mark_img)
+        return mark_img
+    
+    def _cache_get(self, cache, key):
+        """从LRU缓存中取值，命中时移到末尾"""
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+    
+    def _cache_put(self, cache, key, value):
+        """写入LRU缓存，超出容量时淘汰最久未使用的项"""
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > self.watermark_cache_size:
+            cache.popitem(last=False)
+    
+    @staticmethod
+    def apply_opacity(mark_img, opacity):
+        """
+        按比例缩放RGBA图片的alpha通道
+        
+        在alpha波段上通过256项查找表一次完成变换，而不是逐像素构造元组，
+        结果与逐像素计算 int(a * opacity) 完全一致。
+        
+        参数:
+            mark_img (PIL.Image.Image): RGBA模式的图片
+            opacity (float): 透明度 (0.0-1.0)
+        
+        返回:
+            PIL.Image.Image: 调整透明度后的新图片
+        """
+        lut = [int(a * opacity) for a in range(256)]
+        r, g, b, a = mark_img.split()
+        return Image.merge('RGBA', (r, g, b, a.point(lut)))
+    
+    def process_pipeline(self, image_path, output_path, steps):
+        """
+        只解码一次、在内存中依次执行多个操作、最后只编码一次
+        
+        参数:
+            image_path (str): 原图片路径
+            output_path (str): 输出图片路径
+            steps (list): 按顺序执行的操作列表，每项为字典，'op' 指定操作类型:
+                {'op': 'resize', 'size': (宽, 高), 'quality': 'high', 'mode': 'fit'}
+                {'op': 'watermark', 'watermark_text': ..., 'watermark_image': ..., 'position': ..., 'opacity': ...}
+                {'op': 'convert', 'format_name': 'webp', 'profile': 'web-small', 'max_bytes': 200000}
+        
+        返回:
+            bool: 是否处理成功
+        """
+        try:
+            self._run_pipeline(image_path, output_path, steps)
+            return True
+        except Exception as e:
+            print(f"执行处理流水线时出错: {e}")
+            return False
+    
+    def _run_pipeline(self, image_path, output_path, steps, timings=None, source=None, target=None):
+        """
+        执行处理流水线，并把解码、处理、编码各阶段耗时（秒）记录到 timings
+        
+        source/target 为文件对象时从内存中解码、编码到内存，此时 image_path/output_path
+        只用于确定输出格式。出错时直接抛出异常。
+        """
+        timings = {} if timings is None else timings
+        start = time.perf_counter()
+        with Image.open(image_path if source is None else source) as img:
+            # 动画输出为支持多帧的格式时逐帧处理，否则只处理第一帧
+            convert = next((step for step in reversed(steps) if step['op'] == 'convert'), None)
+            if convert:
+                output_format = convert['format_name'].upper()
+            else:
+                output_format = Image.registered_extensions().get(os.path.splitext(output_path)[1].lower())
+            if getattr(img, 'is_animated', False) and output_format in ANIMATED_FORMATS:
+                self._run_animated(img, output_path if target is None else target, steps, output_format,
+                                   convert and convert.get('profile'), timings, convert and convert.get('max_bytes'))
+                return
+            
+            if steps and steps[0]['op'] == 'resize':
+                # 第一步就是缩放时可以在解码阶段直接缩小
+                first = steps[0]
+                self.prepare_decode(img, first['size'], first.get('quality', 'high'), first.get('mode', 'exact'))
+            img.load()
+            decoded = time.perf_counter()
+            timings['decode'] = decoded - start
+            
+            format_name = None
+            profile = max_bytes = None
+            for step in steps:
+                op = step['op']
+                if op == 'resize':
+                    img = self.apply_resize(img, step['size'], step.get('quality', 'high'), step.get('mode', 'exact'))
+                elif op == 'watermark':
+                    img = self.apply_watermark(
+                        img,
+                        step.get('watermark_text'),
+                        step.get('watermark_image'),
+                        step.get('position', 'center'),
+                        step.get('opacity', 0.5),
+                        font_scale=step.get('font_scale')
+                    )
+                elif op == 'convert':
+                    format_name = step['format_name'].upper()
+                    profile = step.get('profile')
+                    max_bytes = step.get('max_bytes')
+                else:
+                    raise ValueError(f"不支持的操作: {op}")
+            
+            # 最后统一编码一次
+            ext = os.path.splitext(output_path)[1].lower()
+            if format_name is None and ext in ('.jpg', '.jpeg'):
+                format_name = 'JPEG'
+            if format_name:
+                img = self.prepare_for_format(img, format_name)
+            processed = time.perf_counter()
+            timings['process'] = processed - decoded
+            
+            self.encode_image(img, output_path if target is None else target,
+                              format_name or Image.registered_extensions().get(ext), profile, max_bytes)
+            timings['encode'] = time.perf_counter() - processed
+    
+    def _run_animated(self, img, target, steps, format_name, profile=None, timings=None, max_bytes=None):
+        """
+        对动画的每一帧执行处理步骤，保留每帧时长和循环设置
+        
+        每个水印步骤只生成一次水印图层，GIF输出的所有帧共用一个调色板。
+        
+        参数:
+            img (PIL.Image.Image): 已打开的动画图片
+            target (str 或 文件对象): 输出路径或文件对象
+            steps (list): 处理步骤，见 process_pipeline
+            format_name (str): 输出格式 ('GIF'、'WEBP' 或 'PNG')
+            profile (str, optional): 编码档位
+            max_bytes (int, optional): 输出大小上限，与静态图片相同，仅对WEBP有效
+        """
+        timings = {} if timings is None else timings
+        timings.update(decode=0.0, process=0.0, encode=0.0)
+        loop = img.info.get('loop')
+        tiles = {}
+        frames = []
+        durations = []
+        
+        for index in range(img.n_frames):
+            started = time.perf_counter()
+            img.seek(index)
+            frame = img.convert('RGBA')
+            # WEBP在解码后才填入当前帧的时长
+            durations.append(img.info.get('duration', 100))
+            decoded = time.perf_counter()
+            
+            for step_index, step in enumerate(steps):
+                op = step['op']
+                if op == 'resize':
+                    frame = self.apply_resize(frame, step['size'], step.get('quality', 'high'),
+                                              step.get('mode', 'exact'))
+                elif op == 'watermark':
+                    key = (step_index, frame.size)
+                    if key not in tiles:
+                        tiles[key] = self.watermark_tile(frame.size, step.get('watermark_text'),
+                                                         step.get('watermark_image'), step.get('position', 'center'),
+                                                         step.get('opacity', 0.5), step.get('font_scale'))
+                    tile, position = tiles[key]
+                    if tile is not None:
+                        self._composite_region(frame, tile, position)
+                elif op != 'convert':
+                    raise ValueError(f"不支持的操作: {op}")
+            frames.append(frame)
+            timings['decode'] += decoded - started
+            timings['process'] += time.perf_counter() - decoded
+        
+        started = time.perf_counter()
+        options = self.encoder_options(format_name, profile)
+        if format_name == 'GIF':
+            frames, transparent = self.shared_palette(frames)
+            # 帧之间不叠加，透明区域不会露出上一帧
+            options.update(disposal=2, optimize=False)
+            if transparent:
+                options['transparency'] = 255
+        if loop is not None:
+            options['loop'] = loop
+        options.update(save_all=True, append_images=frames[1:], duration=durations)
+        if max_bytes and format_name in QUALITY_FORMATS:
+            # 对整个动画搜索质量参数，与静态图片的大小上限一致
+            data = self.encode_to_size(frames[0], format_name, max_bytes, options)
+            if isinstance(target, str):
+                with open(target, 'wb') as f:
+                    f.write(data)
+            else:
+                target.write(data)
+        else:
+            frames[0].save(target, format_name, **options)
+        timings['encode'] = time.perf_counter() - started
+    
+    @staticmethod
+    def shared_palette(frames, samples=8):
+        """
+        用若干采样帧生成一个共用调色板，并把所有帧量化到该调色板
+        
+        比逐帧生成自适应调色板快，也避免了帧间颜色跳动。调色板索引255留作透明色。
+        
+        参数:
+            frames (list): RGBA帧列表
+            samples (int): 生成调色板时采样的帧数
+        
+        返回:
+            tuple: (P模式帧列表, 是否包含透明像素)
+        """
+        step = max(1, len(frames) // samples)
+        sampled = frames[::step][:samples]
+        width, height = sampled[0].size
+        montage = Image.new('RGB', (width, height * len(sampled)))
+        for index, frame in enumerate(sampled):
+            montage.paste(frame.convert('RGB'), (0, index * height))
+        palette = montage.quantize(255)
+        
+        transparent = False
+        quantized = []
+        for frame in frames:
+            result = frame.convert('RGB').quantize(palette=palette, dither=Image.NONE)
+            mask = frame.getchannel('A').point(lambda a: 255 if a < 128 else 0)
+            if mask.getbbox():
+                result.paste(255, mask=mask)
+                transparent = True
+            quantized.append(result)
+        return quantized, transparent
+    
+    @staticmethod
+    def operation_steps(operation, kwargs):
+        """
+        将单一操作转换为等价的流水线步骤
+        
+        参数:
+            operation (str): 操作类型 ('resize', 'convert', 'watermark', 'pipeline')
+            kwargs (dict): 操作特定的参数
+        
+        返回:
+            list: 流水线步骤列表
+        """
+        if operation == 'resize' and 'size' in kwargs:
+            return [{'op': 'resize', 'size': kwargs['size'], 'quality': kwargs.get('quality', 'high'),
+                     'mode': kwargs.get('mode', 'exact')}]
+        elif operation == 'convert' and 'format_name' in kwargs:
+            return [{'op': 'convert', 'format_name': kwargs['format_name'],
+                     'profile': kwargs.get('profile'), 'max_bytes': kwargs.get('max_bytes')}]
+        elif operation == 'watermark':
+            return [{
+                'op': 'watermark',
+                'watermark_text': kwargs.get('watermark_text'),
+                'watermark_image': kwargs.get('watermark_image'),
+                'position': kwargs.get('position', 'center'),
+                'opacity': kwargs.get('opacity', 0.5),
+                'font_scale': kwargs.get('font_scale')
+            }]
+        elif operation == 'pipeline' and 'steps' in kwargs:
+            return kwargs['steps']
+        raise ValueError(f"不支持的操作或缺少参数: {operation}")
+    
+    def create_renditions(self, image_path, output_path, sizes, layout='suffix', quality='high'):
+        """
+        一次解码生成多个尺寸的版本（缩略图金字塔）
+        
+        各尺寸按从大到小的顺序生成，每一级都从上一级（更大的）结果缩小而来，
+        而不是每次都从原图缩放。不会放大比目标尺寸小的原图。
+        
+        参数:
+            image_path (str): 原图片路径
+            output_path (str): 输出图片基础路径，各尺寸的实际路径见 rendition_path
+            sizes (list): 最长边尺寸列表，如 [2048, 1024, 512]
+            layout (str): 输出命名方式，'suffix' 为 name_1024.jpg，'dir' 为 1024/name.jpg
+            quality (str): 缩放质量档位，见 RESIZE_QUALITIES
+        
+        返回:
+            bool: 是否全部生成成功
+        """
+        try:
+            self._run_renditions(image_path, output_path, sizes, layout, quality)
+            return True
+        except Exception as e:
+            print(f"生成多尺寸版本时出错: {e}")
+            return False
+    
+    def _run_renditions(self, image_path, output_path, sizes, layout='suffix', quality='high', timings=None):
+        """
+        生成多尺寸版本，并把解码、处理、编码各阶段耗时（秒）记录到 timings
+        
+        出错时直接抛出异常。
+        """
+        timings = {} if timings is None else timings
+        timings.update(decode=0.0, process=0.0, encode=0.0)
+        sizes = sorted(set(sizes), reverse=True)
+        start = time.perf_counter()
+        with Image.open(image_path) as img:
+            # 目标尺寸都按原图计算，避免逐级缩小时宽高比的舍入误差累积
+            original_size = img.size
+            # 按最大的版本设置解码缩放
+            self.prepare_decode(img, self.fit_size(original_size, sizes[0]), quality)
+            img.load()
+            timings['decode'] = time.perf_counter() - start
+            
+            level = img
+            for max_edge in sizes:
+                started = time.perf_counter()
+                level = self.apply_resize(level, self.fit_size(original_size, max_edge), quality)
+                path = self.rendition_path(output_path, max_edge, layout)
+                os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+                resized = time.perf_counter()
+                level.save(path)
+                timings['process'] += resized - started
+                timings['encode'] += time.perf_counter() - resized
+    
+    def process_tiled(self, image_path, output_path, operation, **kwargs):
+        """
+        以分条方式处理超大图片，峰值内存有上限
+        
+        源图片必须能按行分段解码（BMP、PPM、未压缩的TIFF），否则退回整图处理。
+        'resize' 逐条缩小后拼接为目标尺寸的图片；'convert' 和 'watermark' 逐条解码、
+        处理并写出，输出格式须为TIFF（未压缩）或PNG，否则同样退回整图处理。
+        
+        峰值内存约为 3 × strip_bytes，缩放时再加上输出图片本身的大小，与原图尺寸无关。
+        
+        参数:
+            image_path (str): 原图片路径
+            output_path (str): 输出图片路径
             operation (str): 操作类型 ('resize', 'convert', 'watermark')
+            **kwargs: 操作特定的参数，strip_bytes 指定每条源数据的字节上限（默认64MB）
+        
+        返回:
+            bool: 是否处理成功
+        """
+        try:
+            if not self._run_tiled(image_path, output_path, operation, kwargs):
+                # 编解码器无法分条处理时退回整图处理
+                self._run_pipeline(image_path, output_path, self.operation_steps(operation, kwargs))
+            return True
+        except Exception as e:
+            print(f"分条处理图片时出错: {e}")
+            return False
+    
+    def _run_tiled(self, image_path, output_path, operation, kwargs, timings=None):
+        """
+        分条处理图片，并把解码、处理、编码各阶段耗时（秒）记录到 timings
+        
+        返回:
+            bool: 源图片或输出格式无法分条处理时返回False，调用方应退回整图处理
+        """
+        timings = {} if timings is None else timings
+        max_strip_bytes = kwargs.get('strip_bytes') or DEFAULT_STRIP_BYTES
+        reader = RowReader(image_path)
+        if not reader.streamable:
+            return False
+        
+        if operation == 'resize':
+            size, box = self.resize_plan(reader.size, kwargs['size'], kwargs.get('mode', 'exact'))
+            if box or reader.mode in ('1', 'P'):
+                # 裁剪模式不分条处理；1和P模式在Pillow中按最近邻缩放，逐条缩放后与整图结果不一致
+                return False
+            self._tiled_resize(reader, output_path, size, max_strip_bytes, timings)
+            return True
+        
+        if operation == 'convert':
+            format_name = kwargs['format_name'].upper()
+        elif operation == 'watermark':
+            format_name = Image.registered_extensions().get(os.path.splitext(output_path)[1].lower())
+        else:
+            return False
+        writer_class = STRIP_WRITERS.get(format_name)
+        if writer_class is None:
+            return False
+        
+        mode = stream_mode(reader.mode)
+        tile = None
+        if operation == 'watermark':
+            # 与整图处理一致，非RGB图片在RGBA模式下合成
+            if mode != 'RGB':
+                mode = 'RGBA'
+            tile, position = self.watermark_tile(reader.size, kwargs.get('watermark_text'), kwargs.get('watermark_image'),
+                                                  kwargs.get('position', 'center'), kwargs.get('opacity', 0.5),
+                                                  kwargs.get('font_scale'))
+        
+        timings.update(decode=0.0, process=0.0, encode=0.0)
+        writer = writer_class(output_path, reader.size, mode)
+        try:
+            for top, bottom in iter_row_bands(reader.size[1], strip_rows(reader.size[0], max_strip_bytes)):
+                started = time.perf_counter()
+                strip = reader.read(top, bottom)
+                decoded = time.perf_counter()
+                if strip.mode != mode:
+                    strip = strip.convert(mode)
+                if tile is not None:
+                    self._composite_region(strip, tile, (position[0], position[1] - top))
+                processed = time.perf_counter()
+                writer.write(strip)
+                timings['decode'] += decoded - started
+                timings['process'] += processed - decoded
+                timings['encode'] += time.perf_counter() - processed
+            writer.close()
+        except Exception:
+            writer.abort()
+            raise
+        return True
+    
+    def _tiled_resize(self, reader, output_path, size, max_strip_bytes, timings):
+        """逐条缩放：每条输出行只解码计算所需的源行（含滤波器半径的重叠部分）"""
+        timings.update(decode=0.0, process=0.0, encode=0.0)
+        in_width, in_height = reader.size
+        out_width, out_height = size
+        scale = in_height / out_height
+        # LANCZOS滤波器半径为3个输出像素
+        support = math.ceil(3 * max(scale, 1)) + 1
+        in_rows = strip_rows(in_width, max_strip_bytes)
+        out_rows = max(1, int((in_rows - 2 * support) / scale))
+        
+        result = None
+        for out_top, out_bottom in iter_row_bands(out_height, out_rows):
+            started = time.perf_counter()
+            box_top, box_bottom = out_top * scale, out_bottom * scale
+            top = max(0, math.floor(box_top) - support)
+            bottom = min(in_height, math.ceil(box_bottom) + support)
+            band = reader.read(top, bottom)
+            decoded = time.perf_counter()
+            
+            part = band.resize((out_width, out_bottom - out_top), Image.LANCZOS,
+                               box=(0, box_top - top, in_width, box_bottom - top))
+            if result is None:
+                result = Image.new(part.mode, size)
+                if part.mode == 'P':
+                    result.putpalette(part.getpalette())
+            result.paste(part, (0, out_top))
+            timings['decode'] += decoded - started
+            timings['process'] += time.perf_counter() - decoded
+        
+        started = time.perf_counter()
+        if os.path.splitext(output_path)[1].lower() in ('.jpg', '.jpeg'):
+            result = self.prepare_for_format(result, 'JPEG')
+        result.save(output_path)
+        timings['encode'] = time.perf_counter() - started
+    
+    @staticmethod
+    def fit_size(size, max_edge):
+        """
+        计算保持宽高比、最长边不超过 max_edge 的尺寸
+        
+        参数:
+            size (tuple): 原尺寸 (宽, 高)
+            max_edge (int): 最长边上限
+        
+        返回:
+            tuple: 新尺寸 (宽, 高)，原图已足够小时返回原尺寸
+        """
+        width, height = size
+        if max(width, height) <= max_edge:
+            return size
+        ratio = max_edge / max(width, height)
+        return (max(1, round(width * ratio)), max(1, round(height * ratio)))
+    
+    @staticmethod
+    def rendition_path(output_path, max_edge, layout='suffix'):
+        """
+        计算某个尺寸版本的输出路径
+        
+        参数:
+            output_path (str): 输出图片基础路径
+            max_edge (int): 版本的最长边尺寸
+            layout (str): 'suffix' 或 'dir'
+        
+        返回:
+            str: 该版本的输出路径
+        """
+        directory, filename = os.path.split(output_path)
+        if layout == 'dir':
+            return os.path.join(directory, str(max_edge), filename)
+        base, ext = os.path.splitext(filename)
+        return os.path.join(directory, f"{base}_{max_edge}{ext}")
+    
+    def output_filename(self, filename, operation, kwargs):
+        """
+        根据操作类型确定输出文件名
+        
+        参数:
+            filename (str): 输入文件名
+            operation (str): 操作类型
+            kwargs (dict): 操作特定的参数
+        
+        返回:
+            str: 输出文件名
+        """
+        format_name = None
+        if operation == 'convert':
+            format_name = kwargs.get('format_name')
+        elif operation == 'pipeline':
+            for step in kwargs.get('steps', []):
+                if step['op'] == 'convert':
+                    format_name = step['format_name']
+        
+        if format_name:
+            return os.path.splitext(filename)[0] + '.' + format_name.lower()
+        return filename
+    
+    def batch_process(self, input_dir, output_dir, operation, workers=None, incremental=False, use_hash=False,
+                      recursive=False, include=None, exclude=None, memory_budget=None, staged=None, dedup=None,
+                      resume=False, files=None, **kwargs):
+        """
+        批量处理图片
+        
+        参数与 iter_batch 相同。
+        
+        返回:
+            dict: 处理结果统计，'up_to_date' 为增量模式下因已是最新、或继续作业时上次已完成而跳过的图片数，
+                  'duplicate' 为去重模式下与其他文件内容相同、直接复用其输出的图片数
+        """
+        result = {'success': 0, 'fail': 0, 'skipped': 0, 'up_to_date': 0, 'duplicate': 0}
+        for record in self.iter_batch(input_dir, output_dir, operation, workers, incremental, use_hash,
+                                      recursive, include, exclude, memory_budget, staged, dedup, resume, files,
+                                      **kwargs):
+            result[record['status']] += 1
+        return result
+    
+    def iter_batch(self, input_dir, output_dir, operation, workers=None, incremental=False, use_hash=False,
+                   recursive=False, include=None, exclude=None, memory_budget=None, staged=None, dedup=None,
+                   resume=False, files=None, resume_event=None, **kwargs):
+        """
+        批量处理图片，逐个产出每个文件的处理记录
+        
+        输入目录以流式方式扫描，扫描尚未结束时就开始处理已发现的图片。
+        输入或输出可以是zip/tar归档，此时文件在内存中解码、处理、编码后直接写入输出归档或目录，不产生临时文件。
+        记录按文件被扫描到的顺序产出，结构见 process_file，status 为
+        'success'、'fail'、'skipped'（非支持的图片格式）、'up_to_date'（增量模式下已是最新，或继续作业时上次已完成）
+        或 'duplicate'（去重模式下与之前的文件内容相同）。
+        
+        输出为目录时，每个输出先写入同目录下的临时文件，完整写出后才替换目标文件；每处理完一个文件
+        就在输出目录的作业日志中追加一行，进程中途退出后可以用 resume=True 从中断处继续。
+        
+        参数:
+            input_dir (str): 输入目录，或zip/tar归档
+            output_dir (str): 输出目录，或zip/tar归档（.zip、.tar、.tar.gz、.tgz、.tar.bz2、.tar.xz）
+            operation (str): 操作类型 ('resize', 'convert', 'watermark', 'pipeline', 'renditions')
+            workers (int, optional): 并行进程数，None或1表示在当前进程中顺序处理，0表示使用全部CPU核心
+            incremental (bool): 增量模式，根据输出目录中的清单跳过源文件和参数都未变化的图片
+            use_hash (bool): 增量模式下源文件修改时间变化时再比较内容摘要
+            recursive (bool): 是否递归处理子目录，输出目录中会重建相同的目录结构
+            include (list, optional): 包含的通配符模式，如 ['*.jpg', 'photos/*']
+            exclude (list, optional): 排除的通配符模式，匹配的子目录整个跳过
+            memory_budget (int, optional): 并行处理时的内存预算（字节）。提交前只读取文件头估算每张图片
+                解码后的内存占用，超出预算的任务等待，单张超出预算的大图单独处理
+            staged (StagedExecutor, optional): 单进程处理时使用分阶段流水线，读取线程预取文件内容、
+                写出线程写入结果，使磁盘/网络I/O与解码和编码重叠；处理结束后可从中读取各阶段利用率
+            dedup (str, optional): 去重模式，'link' 或 'copy'。内容相同的输入只处理第一个，
+                其余文件的输出以硬链接（'link'，失败时退回复制）或复制（'copy'）的方式复用第一个文件的输出
+            resume (bool): 继续上次中断的作业，跳过作业日志中已成功处理、源文件未再变化且输出存在的图片，
+                操作参数必须与上次相同；为False时清空作业日志，开始新作业
+            files (iterable, optional): 代替扫描输入目录的 (相对路径, 完整路径) 序列，如 iter_inventory 从
+                scan 生成的清单中读取的文件列表，不再重复列目录
+            resume_event (threading.Event, optional): 用于暂停，事件未设置时不再提交新文件，
+                已提交的文件照常处理完并产出记录，事件被设置后继续
             **kwargs: 操作特定的参数
         
         返回:
-            dict: 处理结果统计
+            generator: 依次产出每个文件的处理记录 (dict)
         """
+        if files is not None and is_archive(input_dir):
+            raise ValueError("文件清单不支持归档输入")
+        if is_archive(input_dir) or is_archive(output_dir):
+            if incremental or dedup or resume or staged:
+                raise ValueError("增量模式、去重模式、继续作业和分阶段流水线不支持归档输入或输出")
+            yield from self._iter_archive_batch(input_dir, output_dir, operation, workers, recursive,
+                                                include, exclude, memory_budget, kwargs, files, resume_event)
+            return
+        
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
         
-        result = {'success': 0, 'fail': 0, 'skipped': 0}
+        manifest = BatchManifest(output_dir, use_hash) if incremental else None
+        fingerprint = params_fingerprint(operation, kwargs)
+        journal = JobJournal(output_dir, fingerprint, resume)
+        content_index = ContentIndex() if dedup else None
+        # 去重模式下: 重复文件的输出路径 -> 原始文件的输出路径，以及已处理文件的状态
+        duplicate_of = {}
+        statuses = {}
         
-        for filename in os.listdir(input_dir):
-            input_path = os.path.join(input_dir, filename)
-            
-            # 检查是否为图片文件
-            ext = os.path.splitext(filename)[1].lower()
-            if ext not in self.supported_formats:
-                result['skipped'] += 1
-                continue
-            
-            # 根据操作类型确定输出文件名
-            if operation == 'convert' and 'format_name' in kwargs:
-                output_filename = os.path.splitext(filename)[0] + '.' + kwargs['format_name'].lower()
+        def iter_tasks():
+            created_dirs = {output_dir}
+            if files is None:
+                sources = scan_files(input_dir, recursive, include, exclude, skip_dirs=[output_dir])
             else:
-                output_filename = filename
+                sources = files
+            for rel_path, input_path in sources:
+                # 检查是否为图片文件
+                rel_dir, filename = os.path.split(rel_path)
+                ext = os.path.splitext(filename)[1].lower()
+                if ext not in self.supported_formats:
+                    yield None, None, self._make_record(input_path, None, 'skipped')
+                    continue
                 
-            output_path = os.path.join(output_dir, output_filename)
-            
-            # 根据操作类型执行相应的处理
-            success = False
-            if operation == 'resize' and 'size' in kwargs:
-                success = self.resize_image(input_path, output_path, kwargs['size'])
-            elif operation == 'convert' and 'format_name' in kwargs:
-                success = self.convert_format(input_path, output_path, kwargs['format_name'])
-            elif operation == 'watermark':
-                watermark_args = {
-                    'watermark_text': kwargs.get('watermark_text'),
-                    'watermark_image': kwargs.get('watermark_image'),
-                    'position': kwargs.get('position', 'center'),
-                    'opacity': kwargs.get('opacity', 0.5)
-                }
-                success = self.add_watermark(input_path, output_path, **watermark_args)
-            
-            if success:
-                result['success'] += 1
+                # 根据操作类型确定输出文件名，并在输出目录中重建子目录结构
+                target_dir = os.path.join(output_dir, rel_dir)
+                if target_dir not in created_dirs:
+                    os.makedirs(target_dir, exist_ok=True)
+                    created_dirs.add(target_dir)
+                output_path = os.path.join(target_dir, self.output_filename(filename, operation, kwargs))
+                
+                key = rel_path.replace(os.sep, '/')
+                outputs = self.output_paths(output_path, operation, kwargs)
+                if journal.is_done(key, input_path, outputs) or \
+                        manifest and manifest.is_current(key, input_path, fingerprint, outputs):
+                    yield key, None, self._make_record(input_path, output_path, 'up_to_date')
+                    continue
+                
+                if content_index:
+                    # 输出格式可能由各自的扩展名决定，只复用扩展名相同的输出
+                    original = content_index.add(input_path, output_path, os.path.splitext(output_path)[1].lower())
+                    if original is not None:
+                        duplicate_of[output_path] = original
+                        yield key, None, self._make_record(input_path, output_path, 'duplicate')
+                        continue
+                for path in outputs:
+                    break_link(path)
+                
+                yield key, (input_path, output_path, operation, kwargs), None
+        
+        try:
+            for key, task, record in self._run_tasks(iter_tasks(), workers, memory_budget, staged, resume_event):
+                if task and content_index:
+                    statuses[task[1]] = record['status']
+                elif record['status'] == 'duplicate':
+                    # 原始文件的记录总是先于重复文件产出，此时其输出已经写完
+                    original = duplicate_of.pop(record['output'])
+                    self._reuse_output(record, original, statuses.get(original), operation, kwargs, dedup)
+                if record['status'] in ('success', 'fail', 'duplicate'):
+                    journal.record(key, record['input'], record['status'])
+                if manifest and record['status'] in ('success', 'duplicate'):
+                    manifest.record(key, record['input'], fingerprint)
+                yield record
+        finally:
+            # 即使调用方提前停止迭代，也保存已完成部分的清单
+            journal.close()
+            if manifest:
+                manifest.save()
+    
+    def _reuse_output(self, record, original, original_status, operation, kwargs, mode):
+        """让重复文件的输出复用原始文件的输出，原始文件处理失败时记录为失败"""
+        try:
+            if original_status != 'success':
+                raise ValueError(f"内容相同的文件处理失败: {original}")
+            record['bytes_in'] = os.path.getsize(record['input'])
+            for source, target in zip(self.output_paths(original, operation, kwargs),
+                                      self.output_paths(record['output'], operation, kwargs)):
+                os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+                link_or_copy(source, target, mode)
+                record['bytes_out'] += os.path.getsize(target)
+        except Exception as e:
+            record['status'] = 'fail'
+            record['error'] = str(e) or e.__class__.__name__
+    
+    def _iter_archive_batch(self, input_dir, output_dir, operation, workers, recursive, include, exclude,
+                            memory_budget, kwargs, files=None, resume_event=None):
+        """
+        处理归档输入或输出的批处理，逐个产出处理记录
+        
+        归档成员按在归档中的顺序读取，归档中的所有文件都会被处理（相当于递归）。
+        输出为归档时，成员路径与输入中的相对路径一致；处理结束（包括提前停止迭代）时归档才会替换目标文件。
+        """
+        if operation not in BUFFERED_OPERATIONS:
+            raise ValueError(f"归档输入或输出不支持的操作: {operation}")
+        
+        def iter_sources():
+            if is_archive(input_dir):
+                for name, data in iter_members(input_dir):
+                    if path_selected(name, include, exclude):
+                        yield name, os.path.join(input_dir, name), data
+            else:
+                if files is None:
+                    sources = scan_files(input_dir, recursive, include, exclude, skip_dirs=[output_dir])
+                else:
+                    sources = files
+                for rel_path, input_path in sources:
+                    yield rel_path.replace(os.sep, '/'), input_path, None
+        
+        def iter_tasks():
+            for name, input_path, data in iter_sources():
+                if os.path.splitext(name)[1].lower() not in self.supported_formats:
+                    yield None, None, self._make_record(input_path, None, 'skipped')
+                    continue
+                member = safe_member_name(name)
+                if member is None:
+                    record = self._make_record(input_path, None, 'fail')
+                    record['error'] = "不安全的成员路径"
+                    yield None, None, record
+                    continue
+                
+                directory, filename = posixpath.split(member)
+                out_name = posixpath.join(directory, self.output_filename(filename, operation, kwargs))
+                if data is None:
+                    with open(input_path, 'rb') as f:
+                        data = f.read()
+                output_path = os.path.join(output_dir, *out_name.split('/'))
+                yield out_name, (input_path, output_path, operation, kwargs, data), None
+        
+        writer = ArchiveWriter(output_dir) if is_archive(output_dir) else DirectoryWriter(output_dir)
+        try:
+            for out_name, task, result in self._run_tasks(iter_tasks(), workers, memory_budget,
+                                                          resume_event=resume_event):
+                if task is None:
+                    yield result
+                    continue
+                record, encoded = result
+                if encoded is not None:
+                    writer.write(out_name, encoded)
+                yield record
+        except GeneratorExit:
+            # 提前停止时保留已完成的部分
+            writer.close()
+            raise
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close()
+    
+    def _run_tasks(self, keyed_tasks, workers=None, memory_budget=None, staged=None, resume_event=None):
+        """
+        执行任务并按提交顺序产出处理记录
+        
+        并行时只保持有限数量的任务在途，任务来源可以是惰性的生成器。
+        resume_event 未设置时不再从任务来源取新任务，在途任务的记录全部产出后等待事件被设置。
+        
+        参数:
+            keyed_tasks (iterable): 产出 (键, 任务参数元组, 记录) 的可迭代对象，
+                记录不为None时表示无需处理，按原顺序直接产出
+            workers (int, optional): 并行进程数，0表示使用全部CPU核心
+            memory_budget (int, optional): 并行任务的内存预算（字节），见 MemoryScheduler
+            staged (StagedExecutor, optional): 单进程处理时使用的分阶段流水线
+            resume_event (threading.Event, optional): 用于暂停，见上
+        
+        返回:
+            generator: 依次产出 (键, 任务参数元组, 处理记录)
+        """
+        if workers == 0:
+            workers = os.cpu_count() or 1
+        
+        if not workers or workers <= 1:
+            keyed_tasks = _gated(keyed_tasks, resume_event)
+            if staged is not None:
+                yield from staged.run(self, keyed_tasks)
+                return
+            for key, task, record in keyed_tasks:
+                yield key, task, record if task is None else self.run_task(task)
+            return
+        
+        # 多进程并行处理，PIL的解码/编码在每个核心上独立进行
+        # 按提交顺序取回结果，保证记录顺序确定
+        max_pending = workers * 4
+        pending = deque()
+        scheduler = MemoryScheduler(memory_budget, workers) if memory_budget else None
+        keyed_tasks = iter(keyed_tasks)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            while True:
+                if resume_event is not None and not resume_event.is_set():
+                    # 暂停时不再提交新任务，先产出在途任务的记录
+                    while pending:
+                        yield self._resolve(*pending.popleft())
+                    resume_event.wait()
+                item = next(keyed_tasks, None)
+                if item is None:
+                    break
+                key, task, record = item
+                if task is not None:
+                    if scheduler:
+                        # 根据文件头估算内存，预算不足时等待已运行的任务完成
+                        source = io.BytesIO(task[4]) if len(task) == 5 else task[0]
+                        cost = estimate_footprint(source, task[2], task[3])
+                        while not scheduler.admit(cost):
+                            scheduler.wait()
+                            while pending and self._ready(pending[0]):
+                                yield self._resolve(*pending.popleft())
+                    record = executor.submit(_run_task, task)
+                    if scheduler:
+                        scheduler.track(record, cost)
+                pending.append((key, task, record))
+                if len(pending) >= max_pending:
+                    yield self._resolve(*pending.popleft())
+            while pending:
+                yield self._resolve(*pending.popleft())
+    
+    @staticmethod
+    def _ready(item):
+        """判断队首任务的结果是否已可取"""
+        key, task, record = item
+        return task is None or record.done()
+    
+    @staticmethod
+    def _resolve(key, task, record):
+        """等待并行任务完成，返回 (键, 任务参数元组, 处理记录)"""
+        if task is not None:
+            record = record.result()
+        return key, task, record
+    
+    def output_paths(self, output_path, operation, kwargs):
+        """
+        列出一个任务实际生成的全部输出文件
+        
+        参数:
+            output_path (str): 任务的输出路径
+            operation (str): 操作类型
+            kwargs (dict): 操作特定的参数
+        
+        返回:
+            list: 输出文件路径列表
+        """
+        if operation == 'renditions':
+            layout = kwargs.get('layout', 'suffix')
+            return [self.rendition_path(output_path, size, layout) for size in kwargs.get('sizes', [])]
+        return [output_path]
+    
+    def process_file(self, input_path, output_path, operation, kwargs):
+        """
+        对单个文件执行指定操作
+        
+        参数:
+            input_path (str): 输入图片路径
+            output_path (str): 输出图片路径
+            operation (str): 操作类型 ('resize', 'convert', 'watermark', 'pipeline', 'renditions')
+            kwargs (dict): 操作特定的参数
+        
+        返回:
+            dict: 处理记录，包含 input、output、status ('success' 或 'fail')、error、
+                  bytes_in、bytes_out，以及 decode_time、process_time、encode_time（秒）
+        """
+        record = self._make_record(input_path, output_path, 'success')
+        timings = {}
+        # 先写入临时文件，全部输出完整写出并刷到磁盘后再替换目标文件，中途崩溃或断电不会留下看似完整的输出
+        staging = temp_path(output_path)
+        try:
+            record['bytes_in'] = os.path.getsize(input_path)
+            if kwargs.get('tiled') and operation in ('resize', 'convert', 'watermark') \
+                    and self._run_tiled(input_path, staging, operation, kwargs, timings):
+                pass
+            elif operation == 'renditions' and 'sizes' in kwargs:
+                self._run_renditions(input_path, staging, kwargs['sizes'], kwargs.get('layout', 'suffix'),
+                                     kwargs.get('quality', 'high'), timings)
             else:
-                result['fail'] += 1
+                self._run_pipeline(input_path, staging, self.operation_steps(operation, kwargs), timings)
+            outputs = self.output_paths(output_path, operation, kwargs)
+            for source, target in zip(self.output_paths(staging, operation, kwargs), outputs):
+                durable_replace(source, target)
+            record['bytes_out'] = sum(os.path.getsize(path) for path in outputs)
+        except Exception as e:
+            record['status'] = 'fail'
+            record['error'] = str(e) or e.__class__.__name__
+            for path in self.output_paths(staging, operation, kwargs):
+                if os.path.exists(path):
+                    os.remove(path)
+        
+        record['decode_time'] = timings.get('decode', 0.0)
+        record['process_time'] = timings.get('process', 0.0)
+        record['encode_time'] = timings.get('encode', 0.0)
+        return record
+    
+    def run_task(self, task):
+        """
+        执行一个批处理任务
+        
+        参数:
+            task (tuple): (输入路径, 输出路径, 操作类型, 参数) 时调用 process_file，
+                附带第五项文件内容时调用 process_bytes
+        
+        返回:
+            dict 或 tuple: process_file 或 process_bytes 的返回值
+        """
+        if len(task) == 5:
+            return self.process_bytes(*task)
+        return self.process_file(*task)
+    
+    def process_bytes(self, input_path, output_path, operation, kwargs, data):
+        """
+        在内存中处理已读入的文件内容，不访问磁盘
+        
+        供分阶段流水线使用：读取和写出由其他线程完成，这里只做解码、处理和编码。
+        
+        参数:
+            input_path (str): 输入图片路径（仅用于记录）
+            output_path (str): 输出图片路径，用于确定输出格式
+            operation (str): 操作类型 ('resize', 'convert', 'watermark', 'pipeline')
+            kwargs (dict): 操作特定的参数
+            data (bytes): 输入文件内容
         
-        return result 
\ No newline at end of file
+        返回:
+            tuple: (处理记录, 编码后的输出内容)，失败时输出内容为None
+        """
+        record = self._make_record(input_path, output_path, 'success')
+        record['bytes_in'] = len(data)
+        timings = {}
+        encoded = None
+        try:
+            buffer = io.BytesIO()
+            self._run_pipeline(input_path, output_path, self.operation_steps(operation, kwargs), timings,
+                               source=io.BytesIO(data), target=buffer)
+            encoded = buffer.getvalue()
+            record['bytes_out'] = len(encoded)
+        except Exception as e:
+            record['status'] = 'fail'
+            record['error'] = str(e) or e.__class__.__name__
+        
+        record['decode_time'] = timings.get('decode', 0.0)
+        record['process_time'] = timings.get('process', 0.0)
+        record['encode_time'] = timings.get('encode', 0.0)
+        return record, encoded
+    
+    @staticmethod
+    def _make_record(input_path, output_path, status):
+        """创建空的文件处理记录"""
+        return {
+            'input': input_path,
+            'output': output_path,
+            'status': status,
+            'error': None,
+            'bytes_in': 0,
+            'bytes_out': 0,
+            'read_time': 0.0,
+            'decode_time': 0.0,
+            'process_time': 0.0,
+            'encode_time': 0.0,
+            'write_time': 0.0
+        }
+
+
+# 工作进程中复用的处理器实例
+_worker_processor = None
+
+def _init_worker():
+    """进程池工作进程初始化，每个进程只创建一次处理器"""
+    global _worker_processor
+    _worker_processor = ImageProcessor()
+
+def _run_task(task):
+    """在工作进程中处理单个任务"""
+    return _worker_processor.run_task(task)
+
+def _gated(items, resume_event):
+    """依次产出任务，resume_event 未设置时在取下一个任务前等待"""
+    items = iter(items)
+    while True:
+        if resume_event is not None:
+            resume_event.wait()
+        item = next(items, None)
+        if item is None:
+            return
+        yield item
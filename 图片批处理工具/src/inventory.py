@@ -0,0 +1,206 @@
+import os
+import json
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+from archive import safe_member_name
+from scanner import path_selected, scan_files
+from tiling import open_unchecked
+
+# 尺寸分布按最长边分档
+SIZE_BUCKETS = (640, 1280, 2048, 4096, 8192)
+
+# 每个并行任务读取的文件数，减少进程间通信次数
+CHUNK_SIZE = 64
+
+def read_header(path):
+    """
+    只读取文件头获取图片信息，不解码像素
+
+    文件头无法识别时记为损坏；像素数据本身的截断或损坏要到解码时才能发现。
+
+    参数:
+        path (str): 图片路径
+
+    返回:
+        dict: format、mode、width、height、animated、status（'ok' 或 'corrupt'）和 error
+    """
+    info = {'format': None, 'mode': None, 'width': None, 'height': None, 'animated': False,
+            'status': 'ok', 'error': None}
+    try:
+        # 超大图片也只读取文件头，不受解压炸弹检查限制
+        with open_unchecked(path) as img:
+            info.update(format=img.format, mode=img.mode, width=img.width, height=img.height,
+                        animated=bool(getattr(img, 'is_animated', False)))
+    except Exception as e:
+        info['status'] = 'corrupt'
+        info['error'] = str(e) or e.__class__.__name__
+    return info
+
+def _read_headers(paths):
+    """在工作进程中读取一组文件头"""
+    return [read_header(path) for path in paths]
+
+def scan_inventory(input_dir, supported_formats, workers=None, recursive=False, include=None, exclude=None):
+    """
+    并行读取目录中所有图片的文件头，按扫描顺序逐个产出清单记录
+
+    参数:
+        input_dir (str): 输入目录
+        supported_formats (list): 支持的扩展名，其他文件记为 'skipped'，不读取
+        workers (int, optional): 并行进程数，None或1表示在当前进程中顺序读取，0表示使用全部CPU核心
+        recursive (bool): 是否递归扫描子目录
+        include (list, optional): 包含的通配符模式
+        exclude (list, optional): 排除的通配符模式
+
+    返回:
+        generator: 依次产出记录 (dict)，包含 path（相对输入目录、以 / 分隔的路径）、bytes 和 read_header 的各项，
+            status 为 'ok'、'corrupt' 或 'skipped'
+    """
+    if workers == 0:
+        workers = os.cpu_count() or 1
+
+    def iter_chunks():
+        chunk = []
+        for rel_path, path in scan_files(input_dir, recursive, include, exclude):
+            chunk.append((rel_path, path))
+            if len(chunk) >= CHUNK_SIZE:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def build(chunk, headers):
+        headers = iter(headers)
+        for rel_path, path in chunk:
+            record = {'path': rel_path.replace(os.sep, '/')}
+            try:
+                record['bytes'] = os.path.getsize(path)
+            except OSError:
+                record['bytes'] = None
+            if os.path.splitext(path)[1].lower() in supported_formats:
+                record.update(next(headers))
+            else:
+                record['status'] = 'skipped'
+            yield record
+
+    def image_paths(chunk):
+        return [path for _, path in chunk if os.path.splitext(path)[1].lower() in supported_formats]
+
+    if not workers or workers <= 1:
+        for chunk in iter_chunks():
+            yield from build(chunk, _read_headers(image_paths(chunk)))
+        return
+
+    # 文件头读取以I/O等待为主，进程数可以多于CPU核心数；按提交顺序取回结果
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        for chunk in iter_chunks():
+            pending.append((chunk, executor.submit(_read_headers, image_paths(chunk))))
+            if len(pending) >= workers * 2:
+                chunk, future = pending.popleft()
+                yield from build(chunk, future.result())
+        while pending:
+            chunk, future = pending.popleft()
+            yield from build(chunk, future.result())
+
+def _init_worker():
+    """工作进程只读取文件头，直接关闭解压炸弹检查"""
+    Image.MAX_IMAGE_PIXELS = None
+
+class InventorySummary:
+    """汇总扫描清单：数量、像素数、格式、模式、尺寸分布和损坏文件"""
+
+    def __init__(self):
+        self.counts = Counter()
+        self.formats = Counter()
+        self.modes = Counter()
+        self.sizes = Counter()
+        self.total_bytes = 0
+        self.total_pixels = 0
+        self.animated = 0
+        self.largest = None
+        self.corrupt = []
+
+    def add(self, record):
+        """
+        汇总一条清单记录
+
+        参数:
+            record (dict): scan_inventory 产出的记录
+        """
+        status = record['status']
+        self.counts[status] += 1
+        if status == 'corrupt':
+            self.corrupt.append((record['path'], record['error']))
+        if status != 'ok':
+            return
+
+        self.total_bytes += record['bytes'] or 0
+        pixels = record['width'] * record['height']
+        self.total_pixels += pixels
+        self.formats[record['format']] += 1
+        self.modes[record['mode']] += 1
+        self.sizes[size_bucket(max(record['width'], record['height']))] += 1
+        if record['animated']:
+            self.animated += 1
+        if self.largest is None or pixels > self.largest[1]:
+            self.largest = (record['path'], pixels, (record['width'], record['height']))
+
+    def to_dict(self):
+        """返回可序列化为JSON的汇总结果"""
+        return {
+            'images': self.counts['ok'],
+            'corrupt': self.counts['corrupt'],
+            'skipped': self.counts['skipped'],
+            'total_bytes': self.total_bytes,
+            'total_pixels': self.total_pixels,
+            'animated': self.animated,
+            'formats': dict(self.formats.most_common()),
+            'modes': dict(self.modes.most_common()),
+            'sizes': {label: self.sizes[label] for label in size_labels() if self.sizes[label]},
+            'largest': self.largest and {'path': self.largest[0], 'size': list(self.largest[2])},
+            'corrupt_files': [{'path': path, 'error': error} for path, error in self.corrupt],
+        }
+
+def size_labels():
+    """尺寸分档的名称，按从小到大排列"""
+    return [f"<={edge}" for edge in SIZE_BUCKETS] + [f">{SIZE_BUCKETS[-1]}"]
+
+def size_bucket(max_edge):
+    """返回最长边所在的尺寸分档名称"""
+    for edge in SIZE_BUCKETS:
+        if max_edge <= edge:
+            return f"<={edge}"
+    return f">{SIZE_BUCKETS[-1]}"
+
+def iter_inventory(path, input_dir, include=None, exclude=None):
+    """
+    读取扫描清单，作为批处理的输入文件列表，代替重新扫描输入目录
+
+    只返回文件头可以正常读取的图片；损坏和非图片文件不再列出。清单中出现绝对路径或指向输入目录外部的路径时
+    （清单被手工修改或不可信），与归档成员相同的规则判定为不安全，抛出 ValueError。
+
+    参数:
+        path (str): scan 命令生成的JSONL清单
+        input_dir (str): 输入目录，须与扫描时相同（清单中的路径相对于它）
+        include (list, optional): 包含的通配符模式
+        exclude (list, optional): 排除的通配符模式
+
+    返回:
+        generator: 依次产出 (相对路径, 完整路径)，与 scan_files 相同
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get('status') != 'ok':
+                continue
+            rel_path = safe_member_name(record['path'])
+            if rel_path is None:
+                raise ValueError(f"清单第 {line_number} 行的路径不安全: {record['path']}")
+            if not path_selected(rel_path, include, exclude):
+                continue
+            parts = rel_path.split('/')
+            yield os.path.join(*parts), os.path.join(input_dir, *parts)
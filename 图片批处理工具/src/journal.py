@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import secrets
+
+JOURNAL_NAME = '.image_journal.jsonl'
+
+def temp_path(path):
+    """
+    计算写出时使用的临时路径
+
+    临时文件与目标在同一目录（保证 os.replace 是原子的），扩展名相同（按扩展名确定输出格式），
+    并以 . 开头，中途崩溃时留下的临时文件不会被当成输出。文件名中带随机串，多个线程或多台机器
+    同时写同一个目标时不会互相覆盖临时文件。
+
+    参数:
+        path (str): 目标路径
+
+    返回:
+        str: 临时文件路径
+    """
+    directory, filename = os.path.split(path)
+    base, ext = os.path.splitext(filename)
+    return os.path.join(directory, f".{base}.{secrets.token_hex(6)}.tmp{ext}")
+
+def sync_file(path):
+    """把已写入的文件内容刷到磁盘"""
+    # 硬链接的目标可能是只读文件；POSIX上只读打开也可以fsync，Windows则要求可写
+    fd = os.open(path, os.O_RDWR if os.name == 'nt' else os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def sync_dir(directory):
+    """把目录项（如刚完成的改名）刷到磁盘，不支持打开目录的系统（Windows）上跳过"""
+    try:
+        fd = os.open(directory or '.', os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def durable_replace(tmp_path, path, synced=False):
+    """
+    用临时文件替换目标文件，并保证断电或异常重启后目标文件要么是旧内容，要么是完整的新内容
+
+    参数:
+        tmp_path (str): 已完整写出的临时文件
+        path (str): 目标路径
+        synced (bool): 临时文件的内容已经刷到磁盘
+    """
+    if not synced:
+        sync_file(tmp_path)
+    os.replace(tmp_path, path)
+    sync_dir(os.path.dirname(path))
+
+def atomic_write(path, data):
+    """
+    先写入临时文件并刷到磁盘，再替换目标文件，即使断电，目标文件也要么是旧内容，要么是完整的新内容
+
+    参数:
+        path (str): 目标路径
+        data (bytes): 文件内容
+    """
+    tmp_path = temp_path(path)
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        durable_replace(tmp_path, path, synced=True)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class JobJournal:
+    """批处理作业日志，每处理完一个文件追加一行，进程中途退出后可以从中断处继续"""
+
+    def __init__(self, output_dir, fingerprint, resume=False):
+        """
+        打开作业日志
+
+        参数:
+            output_dir (str): 输出目录，日志文件保存在其中
+            fingerprint (str): 操作参数指纹，继续作业时必须与日志中记录的一致
+            resume (bool): 继续上次的作业；否则清空日志开始新作业
+        """
+        self.path = os.path.join(output_dir, JOURNAL_NAME)
+        # 已完成的文件: 相对路径 -> 处理时的 (大小, 修改时间)
+        self.done = {}
+        started = resume and self._load(fingerprint)
+
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND
+        if started is False:
+            flags |= os.O_TRUNC
+        self.fd = os.open(self.path, flags, 0o644)
+        if started is None:
+            # 上次退出时最后一行没有写完整，另起一行
+            os.write(self.fd, b'\n')
+        if started is False:
+            self._append({'job': fingerprint, 'started': time.time()})
+
+    def _load(self, fingerprint):
+        """
+        读取已有的日志
+
+        返回:
+            True 表示可以继续，None 表示可以继续但最后一行不完整，False 表示没有可继续的日志
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return False
+
+        lines = data.decode('utf-8', 'replace').splitlines()
+        header = None
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # 进程在写入过程中退出时最后一行可能不完整
+                continue
+            if header is None:
+                header = entry
+                if header.get('job') != fingerprint:
+                    raise ValueError("作业日志中的处理参数与本次不同，请使用相同的参数继续，或去掉 --resume 重新开始")
+                continue
+            if entry.get('status') in ('success', 'duplicate'):
+                self.done[entry['key']] = (entry['size'], entry['mtime_ns'])
+            else:
+                self.done.pop(entry.get('key'), None)
+        if header is None:
+            return False
+        return True if data.endswith(b'\n') else None
+
+    def _append(self, entry):
+        # 每行用一次 write 追加（O_APPEND），进程被杀死时最多丢失正在写的这一行；
+        # 写入后立即刷到磁盘，断电后日志中记为成功的文件，其输出（已先行刷盘）一定完整
+        os.write(self.fd, (json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8'))
+        os.fsync(self.fd)
+
+    def is_done(self, key, input_path, output_paths):
+        """
+        判断文件在上次作业中是否已处理完成
+
+        参数:
+            key (str): 文件相对输入目录的路径
+            input_path (str): 源文件路径
+            output_paths (list): 该文件对应的全部输出路径
+
+        返回:
+            bool: 已处理成功、源文件未再变化且输出都存在时返回True
+        """
+        state = self.done.get(key)
+        if state is None:
+            return False
+        try:
+            stat = os.stat(input_path)
+        except OSError:
+            # 源文件已被删除或无法读取，交给处理流程记为失败
+            return False
+        if state != (stat.st_size, stat.st_mtime_ns):
+            return False
+        return all(os.path.exists(path) for path in output_paths)
+
+    def record(self, key, input_path, status):
+        """
+        记录一个文件的处理结果
+
+        参数:
+            key (str): 文件相对输入目录的路径
+            input_path (str): 源文件路径
+            status (str): 处理状态
+        """
+        try:
+            stat = os.stat(input_path)
+        except OSError:
+            return
+        self._append({'key': key, 'status': status, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns})
+
+    def close(self):
+        os.close(self.fd)
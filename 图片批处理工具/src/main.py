@@ -1,7 +1,362 @@
 import os
 import argparse
+import json
+import signal
 import sys
-from image_processor import ImageProcessor
+import time
+from archive import is_archive
+from image_processor import ImageProcessor, RESIZE_QUALITIES, RESIZE_MODES, ENCODER_PROFILES, resize_target
+from staged import StagedExecutor
+from watcher import Watcher
+from distributed import Coordinator, run_worker, start_workers
+from inventory import InventorySummary, scan_inventory, iter_inventory
+
+FORMATS = ['jpeg', 'png', 'bmp', 'gif', 'webp', 'tiff']
+
+def parse_position(value):
+    """解析水印位置参数，返回 'center' 或 (x, y)"""
+    if value == 'center':
+        return value
+    try:
+        x, y = map(int, value.split(','))
+    except ValueError:
+        raise ValueError("位置格式错误，应为 'x,y' 或 'center'")
+    return (x, y)
+
+def parse_step(spec):
+    """
+    解析流水线步骤描述
+    
+    格式为 "操作:参数"，多个参数之间用分号分隔，例如:
+        resize:800x600;quality=fast
+        resize:400x400;mode=fill
+        resize:800x;mode=fit
+        resize:1024              (最长边不超过1024)
+        watermark:text=© 2025;position=10,20;opacity=0.5
+        watermark:text=© 2025;scale=0.05  (字号为图片宽度的5%)
+        watermark:image=logo.png
+        convert:webp
+        convert:jpeg;profile=web-small;max_bytes=200K
+    
+    返回:
+        dict: ImageProcessor.process_pipeline 使用的步骤字典
+    """
+    op, _, arg_text = spec.partition(':')
+    args = [arg.strip() for arg in arg_text.split(';') if arg.strip()]
+    options = dict(arg.split('=', 1) for arg in args if '=' in arg)
+    positional = [arg for arg in args if '=' not in arg]
+    
+    try:
+        if op == 'resize':
+            quality = options.get('quality', 'high')
+            if quality not in RESIZE_QUALITIES:
+                raise ValueError(f"未知的缩放质量: {quality}")
+            if 'x' in positional[0].lower():
+                width, height = (int(value) if value else None for value in positional[0].lower().split('x'))
+                size, mode = resize_target(width, height, options.get('mode', 'exact'))
+            else:
+                size, mode = resize_target(None, None, max_edge=int(positional[0]))
+            return {'op': 'resize', 'size': size, 'quality': quality, 'mode': mode}
+        
+        if op == 'convert':
+            format_name = positional[0].lower()
+            if format_name not in FORMATS:
+                raise ValueError(f"不支持的格式: {format_name}")
+            profile = options.get('profile')
+            if profile is not None and profile not in ENCODER_PROFILES:
+                raise ValueError(f"未知的编码档位: {profile}")
+            max_bytes = parse_size(options['max_bytes']) if 'max_bytes' in options else None
+            return {'op': 'convert', 'format_name': format_name, 'profile': profile, 'max_bytes': max_bytes}
+        
+        if op == 'watermark':
+            if not options.get('text') and not options.get('image'):
+                raise ValueError("水印步骤需要 text= 或 image= 参数")
+            font_scale = float(options['scale']) if 'scale' in options else None
+            if font_scale is not None and font_scale <= 0:
+                raise ValueError("scale 必须大于0")
+            return {
+                'op': 'watermark',
+                'watermark_text': options.get('text'),
+                'watermark_image': options.get('image'),
+                'position': parse_position(options.get('position', 'center')),
+                'opacity': float(options.get('opacity', 0.5)),
+                'font_scale': font_scale
+            }
+    except (IndexError, ValueError, argparse.ArgumentTypeError) as e:
+        raise argparse.ArgumentTypeError(f"无效的步骤 '{spec}': {e}")
+    
+    raise argparse.ArgumentTypeError(f"未知的操作: {op} (可选 resize, watermark, convert)")
+
+def parse_size(value):
+    """解析带单位的字节数，如 512M、4G"""
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+    value = value.strip().upper().rstrip('B')
+    try:
+        if value and value[-1] in units:
+            return int(float(value[:-1]) * units[value[-1]])
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的大小: {value} (例如 512M、4G)")
+
+def add_batch_arguments(subparser):
+    """为批处理命令添加通用参数"""
+    subparser.add_argument('-j', '--jobs', type=int, default=1, help='并行进程数 (默认1，0表示使用全部CPU核心)')
+    subparser.add_argument('--incremental', action='store_true', help='增量模式，跳过源文件和参数都未变化的图片')
+    subparser.add_argument('--hash', action='store_true', help='增量模式下修改时间变化时再比较文件内容摘要')
+    subparser.add_argument('--resume', action='store_true',
+                           help='继续上次中断的作业，跳过作业日志中已完成的图片 (参数须与上次相同)')
+    subparser.add_argument('-r', '--recursive', action='store_true', help='递归处理子目录，并在输出目录中保持相同结构')
+    subparser.add_argument('--include', action='append', metavar='PATTERN', help='只处理匹配的文件 (通配符，可重复指定)')
+    subparser.add_argument('--exclude', action='append', metavar='PATTERN', help='排除匹配的文件或目录 (通配符，可重复指定)')
+    subparser.add_argument('--files', metavar='INVENTORY',
+                           help='使用 scan 命令生成的清单作为输入文件列表，不再扫描输入目录 (跳过其中损坏的文件)')
+    subparser.add_argument('--memory-budget', type=parse_size, metavar='SIZE',
+                           help='并行处理的内存预算 (如 4G)，按图片尺寸估算内存后调度，大图会单独处理')
+    subparser.add_argument('--dedup', nargs='?', const='link', choices=['link', 'copy'],
+                           help='去重模式，内容相同的图片只处理一次，其余输出以硬链接 (默认) 或复制的方式生成')
+    subparser.add_argument('--jsonl', metavar='FILE', help='将每个文件的处理记录以JSONL格式写入该文件')
+    subparser.add_argument('--staged', action='store_true',
+                           help='分阶段流水线：读取线程预取文件、写出线程写入结果，使I/O与解码编码重叠 (仅单进程)')
+    subparser.add_argument('--readers', type=int, default=2, help='分阶段流水线的读取线程数 (默认2)')
+    subparser.add_argument('--writers', type=int, default=2, help='分阶段流水线的写出线程数 (默认2)')
+    subparser.add_argument('--queue-depth', type=int, default=8, help='分阶段流水线预取和待写出队列的长度 (默认8)')
+
+def run_batch(processor, args, operation, **kwargs):
+    """
+    执行批处理，实时显示处理速度，并可将每个文件的处理记录写入JSONL文件
+    
+    参数:
+        processor (ImageProcessor): 图片处理器
+        args (argparse.Namespace): 命令行参数
+        operation (str): 操作类型
+        **kwargs: 操作特定的参数
+    
+    返回:
+        dict: 处理结果统计
+    """
+    results = {'success': 0, 'fail': 0, 'skipped': 0, 'up_to_date': 0, 'duplicate': 0}
+    processed = 0
+    bytes_in = 0
+    bytes_out = 0
+    encode_time = 0.0
+    start = time.perf_counter()
+    last_update = start
+    
+    def show_progress(now):
+        elapsed = max(now - start, 1e-9)
+        print(f"\r已处理 {processed} 张 | {processed / elapsed:.1f} 张/秒 | "
+              f"{bytes_in / elapsed / 1024 / 1024:.1f} MB/秒", end='', file=sys.stderr, flush=True)
+    
+    staged = StagedExecutor(args.readers, args.writers, args.queue_depth) if args.staged else None
+    report = open(args.jsonl, 'w', encoding='utf-8') if args.jsonl else None
+    try:
+        records = processor.iter_batch(
+            args.input,
+            args.output,
+            operation,
+            workers=args.jobs,
+            incremental=args.incremental,
+            use_hash=args.hash,
+            recursive=args.recursive,
+            include=args.include,
+            exclude=args.exclude,
+            memory_budget=args.memory_budget,
+            staged=staged,
+            dedup=args.dedup,
+            resume=args.resume,
+            files=iter_inventory(args.files, args.input, args.include, args.exclude) if args.files else None,
+            **kwargs
+        )
+        for record in records:
+            results[record['status']] += 1
+            if report:
+                report.write(json.dumps(record, ensure_ascii=False) + '\n')
+            
+            if record['status'] in ('success', 'fail'):
+                processed += 1
+                bytes_in += record['bytes_in']
+            if record['status'] == 'success':
+                bytes_out += record['bytes_out']
+                encode_time += record['encode_time']
+            if record['status'] == 'fail':
+                print(f"\r失败: {record['input']}: {record['error']}", file=sys.stderr)
+            
+            now = time.perf_counter()
+            if now - last_update >= 0.5:
+                show_progress(now)
+                last_update = now
+    finally:
+        if report:
+            report.close()
+    
+    show_progress(time.perf_counter())
+    print(file=sys.stderr)
+    if kwargs.get('profile') or kwargs.get('max_bytes'):
+        succeeded = max(results['success'], 1)
+        print(f"编码档位 {kwargs.get('profile') or 'default'}: 平均编码 {encode_time / succeeded * 1000:.1f} 毫秒/张 | "
+              f"平均输出 {bytes_out / succeeded / 1024:.1f} KB", file=sys.stderr)
+    if staged:
+        # 利用率接近100%的阶段是瓶颈，据此调整线程数和队列长度
+        usage = staged.utilization()
+        print(f"阶段利用率: 读取 {usage['read']:.0%} ({staged.readers}线程) | 处理 {usage['cpu']:.0%} | "
+              f"写出 {usage['write']:.0%} ({staged.writers}线程) | "
+              f"等待读取 {usage['read_wait']:.1f}秒 | 等待写出 {usage['write_wait']:.1f}秒", file=sys.stderr)
+    return results
+
+def run_watch(processor, args):
+    """
+    持续监视输入目录并处理新增或修改的图片，每处理完一个文件输出一行，直到 Ctrl+C 或 SIGTERM
+    
+    参数:
+        processor (ImageProcessor): 图片处理器
+        args (argparse.Namespace): 命令行参数
+    
+    返回:
+        dict: 处理结果统计
+    """
+    results = {'success': 0, 'fail': 0}
+    watcher = Watcher(
+        processor,
+        args.input,
+        args.output,
+        'pipeline',
+        workers=args.jobs,
+        recursive=args.recursive,
+        include=args.include,
+        exclude=args.exclude,
+        use_hash=args.hash,
+        settle=args.settle,
+        poll_interval=args.poll_interval,
+        use_inotify=not args.poll,
+        steps=args.steps
+    )
+    report = open(args.jsonl, 'a', encoding='utf-8') if args.jsonl else None
+    
+    def on_record(record):
+        results[record['status']] += 1
+        if report:
+            report.write(json.dumps(record, ensure_ascii=False) + '\n')
+            report.flush()
+        stamp = time.strftime('%H:%M:%S')
+        if record['status'] == 'success':
+            print(f"[{stamp}] 完成 {record['key']} -> {record['output']} (延迟 {record['latency']:.1f} 秒)")
+        else:
+            print(f"[{stamp}] 失败 {record['key']}: {record['error']}", file=sys.stderr)
+    
+    # SIGTERM 与 Ctrl+C 一样退出，退出前保存清单和待处理队列
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        watcher.run(on_record)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if report:
+            report.close()
+    return results
+
+def run_scan(processor, args):
+    """
+    只读取文件头扫描输入目录，写出逐文件的JSONL清单，并显示汇总报告
+    
+    参数:
+        processor (ImageProcessor): 图片处理器
+        args (argparse.Namespace): 命令行参数
+    
+    返回:
+        dict: 汇总结果，结构见 InventorySummary.to_dict
+    """
+    summary = InventorySummary()
+    records = scan_inventory(args.input, processor.supported_formats, args.jobs, args.recursive,
+                             args.include, args.exclude)
+    report = open(args.output, 'w', encoding='utf-8') if args.output else None
+    start = time.perf_counter()
+    last_update = start
+    try:
+        for record in records:
+            summary.add(record)
+            if report:
+                report.write(json.dumps(record, ensure_ascii=False) + '\n')
+            now = time.perf_counter()
+            if now - last_update >= 0.5:
+                print(f"\r已扫描 {sum(summary.counts.values())} 个文件", end='', file=sys.stderr, flush=True)
+                last_update = now
+    finally:
+        if report:
+            report.close()
+    elapsed = time.perf_counter() - start
+    
+    result = summary.to_dict()
+    scanned = sum(summary.counts.values())
+    print(f"\r扫描了 {scanned} 个文件，耗时 {elapsed:.1f} 秒 ({scanned / max(elapsed, 1e-9):.0f} 个/秒)", file=sys.stderr)
+    print(f"图片: {result['images']} 张，损坏: {result['corrupt']} 个，非图片: {result['skipped']} 个")
+    print(f"总大小: {result['total_bytes'] / 1024 / 1024:.1f} MB，总像素: {result['total_pixels'] / 1e6:.1f} 百万像素，"
+          f"动画: {result['animated']} 张")
+    if result['images']:
+        print("格式: " + ', '.join(f"{name} {count}" for name, count in result['formats'].items()))
+        print("模式: " + ', '.join(f"{name} {count}" for name, count in result['modes'].items()))
+        print("最长边分布: " + ', '.join(f"{label} {count}" for label, count in result['sizes'].items()))
+        largest = result['largest']
+        print(f"最大图片: {largest['path']} ({largest['size'][0]}x{largest['size'][1]})")
+    for entry in result['corrupt_files']:
+        print(f"损坏: {entry['path']}: {entry['error']}", file=sys.stderr)
+    return result
+
+def run_coordinator(processor, args):
+    """
+    运行分布式批处理的协调器，结束后显示吞吐量和各工作进程完成的文件数
+    
+    参数:
+        processor (ImageProcessor): 图片处理器
+        args (argparse.Namespace): 命令行参数
+    
+    返回:
+        dict: 处理结果统计
+    """
+    coordinator = Coordinator(
+        processor,
+        args.input,
+        args.output,
+        'pipeline',
+        lease_size=args.lease_size,
+        lease_timeout=args.lease_timeout,
+        recursive=args.recursive,
+        include=args.include,
+        exclude=args.exclude,
+        resume=args.resume,
+        steps=args.steps
+    )
+    report = open(args.jsonl, 'w', encoding='utf-8') if args.jsonl else None
+    processed = 0
+    start = time.perf_counter()
+    
+    def on_record(record):
+        nonlocal processed
+        processed += 1
+        if report:
+            report.write(json.dumps(record, ensure_ascii=False) + '\n')
+        if record['status'] == 'fail':
+            print(f"\r失败: {record['key']} ({record['worker']}): {record['error']}", file=sys.stderr)
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        print(f"\r已处理 {processed} 张 | {processed / elapsed:.1f} 张/秒", end='', file=sys.stderr, flush=True)
+    
+    try:
+        results = coordinator.serve(args.listen, on_record, args.local_workers)
+    finally:
+        if report:
+            report.close()
+    print(file=sys.stderr)
+    
+    elapsed = time.perf_counter() - start
+    print(f"耗时 {elapsed:.1f} 秒，{processed / max(elapsed, 1e-9):.1f} 张/秒，重新分配的租约: {coordinator.reassigned}")
+    for worker, count in sorted(coordinator.workers.items()):
+        print(f"  {worker}: {count} 张")
+    return results
+
+def add_tiled_arguments(subparser):
+    """为支持分条处理的命令添加参数"""
+    subparser.add_argument('--tiled', action='store_true',
+                           help='分条处理超大图片，内存占用有上限 (源图须为BMP/PPM/未压缩TIFF，否则自动退回整图处理)')
+    subparser.add_argument('--strip-size', type=parse_size, metavar='SIZE', help='分条处理时每条源数据的大小上限 (默认64M)')
 
 def main():
     """主函数，处理命令行参数并执行相应的操作"""
@@ -9,28 +364,119 @@ def main():
     subparsers = parser.add_subparsers(dest='command', help='操作命令')
     
     # 调整大小命令
-    resize_parser = subparsers.add_parser('resize', help='批量调整图片大小')
-    resize_parser.add_argument('-i', '--input', required=True, help='输入目录')
-    resize_parser.add_argument('-o', '--output', required=True, help='输出目录')
-    resize_parser.add_argument('-w', '--width', type=int, required=True, help='目标宽度')
-    resize_parser.add_argument('-h', '--height', type=int, required=True, help='目标高度')
+    resize_parser = subparsers.add_parser('resize', help='批量调整图片大小', conflict_handler='resolve')
+    resize_parser.add_argument('-i', '--input', required=True, help='输入目录或zip/tar归档')
+    resize_parser.add_argument('-o', '--output', required=True, help='输出目录或zip/tar归档')
+    resize_parser.add_argument('-w', '--width', type=int, help='目标宽度')
+    resize_parser.add_argument('-h', '--height', type=int, help='目标高度')
+    # -e 本身就是一种缩放模式，不能再与 -m 组合
+    resize_mode_group = resize_parser.add_mutually_exclusive_group()
+    resize_mode_group.add_argument('-m', '--mode', choices=[mode for mode in RESIZE_MODES if mode != 'max-edge'],
+                                   help='缩放模式 (默认exact。exact: 拉伸到指定尺寸, fit: 保持比例缩小到范围内, '
+                                        'fill/cover: 保持比例铺满并居中裁剪)')
+    resize_mode_group.add_argument('-e', '--max-edge', type=int, help='最长边尺寸，保持比例缩小 (代替 -w/-h 和 -m)')
+    resize_parser.add_argument('-q', '--quality', default='high', choices=list(RESIZE_QUALITIES),
+                               help='缩放质量/速度档位 (high: 完整解码后缩放, balanced: 近似无损的快速缩小, fast: 最快)')
+    add_batch_arguments(resize_parser)
+    add_tiled_arguments(resize_parser)
     
     # 格式转换命令
     convert_parser = subparsers.add_parser('convert', help='批量转换图片格式')
-    convert_parser.add_argument('-i', '--input', required=True, help='输入目录')
-    convert_parser.add_argument('-o', '--output', required=True, help='输出目录')
-    convert_parser.add_argument('-f', '--format', required=True, choices=['jpeg', 'png', 'bmp', 'gif', 'webp'], help='目标格式')
+    convert_parser.add_argument('-i', '--input', required=True, help='输入目录或zip/tar归档')
+    convert_parser.add_argument('-o', '--output', required=True, help='输出目录或zip/tar归档')
+    convert_parser.add_argument('-f', '--format', required=True, choices=FORMATS, help='目标格式')
+    convert_parser.add_argument('--profile', choices=list(ENCODER_PROFILES),
+                                help='编码档位 (web-fast: 编码最快, web-small: 体积最小, archive: 高保真存档)')
+    convert_parser.add_argument('--max-bytes', type=parse_size, metavar='SIZE',
+                                help='每个输出文件的大小上限 (如 200K)，JPEG/WEBP会自动搜索满足上限的最高质量')
+    add_batch_arguments(convert_parser)
+    add_tiled_arguments(convert_parser)
     
     # 添加水印命令
     watermark_parser = subparsers.add_parser('watermark', help='批量添加水印')
-    watermark_parser.add_argument('-i', '--input', required=True, help='输入目录')
-    watermark_parser.add_argument('-o', '--output', required=True, help='输出目录')
+    watermark_parser.add_argument('-i', '--input', required=True, help='输入目录或zip/tar归档')
+    watermark_parser.add_argument('-o', '--output', required=True, help='输出目录或zip/tar归档')
     # 水印文本和水印图片至少需要一个
     watermark_group = watermark_parser.add_mutually_exclusive_group(required=True)
     watermark_group.add_argument('-t', '--text', help='水印文本')
     watermark_group.add_argument('-m', '--image', help='水印图片路径')
     watermark_parser.add_argument('-p', '--position', default='center', help='水印位置 (x,y 或 center)')
     watermark_parser.add_argument('-a', '--opacity', type=float, default=0.5, help='水印透明度 (0.0-1.0)')
+    watermark_parser.add_argument('--font-scale', type=float, metavar='RATIO',
+                                  help='文本水印字号与图片宽度之比 (如 0.05)，不同分辨率的图片水印大小一致，默认固定36号字')
+    add_batch_arguments(watermark_parser)
+    add_tiled_arguments(watermark_parser)
+    
+    # 多步骤流水线命令
+    pipeline_parser = subparsers.add_parser('pipeline', help='单次解码依次执行多个操作')
+    pipeline_parser.add_argument('-i', '--input', required=True, help='输入目录或zip/tar归档')
+    pipeline_parser.add_argument('-o', '--output', required=True, help='输出目录或zip/tar归档')
+    pipeline_parser.add_argument('-s', '--step', dest='steps', action='append', required=True, type=parse_step,
+                                 help='处理步骤，可重复指定，按顺序执行 (如 resize:800x600、watermark:text=水印、convert:webp)')
+    add_batch_arguments(pipeline_parser)
+    
+    # 多尺寸版本命令
+    renditions_parser = subparsers.add_parser('renditions', help='一次解码生成多个尺寸的版本')
+    renditions_parser.add_argument('-i', '--input', required=True, help='输入目录或zip/tar归档')
+    renditions_parser.add_argument('-o', '--output', required=True, help='输出目录或zip/tar归档')
+    renditions_parser.add_argument('-s', '--sizes', type=int, nargs='+', default=[2048, 1024, 512, 256, 128],
+                                   help='各版本的最长边尺寸 (默认 2048 1024 512 256 128)')
+    renditions_parser.add_argument('-l', '--layout', default='suffix', choices=['suffix', 'dir'],
+                                   help='输出命名方式 (suffix: name_1024.jpg, dir: 1024/name.jpg)')
+    renditions_parser.add_argument('-q', '--quality', default='high', choices=list(RESIZE_QUALITIES), help='缩放质量/速度档位')
+    add_batch_arguments(renditions_parser)
+    
+    # 监视目录命令
+    watch_parser = subparsers.add_parser('watch', help='持续监视目录，自动处理新增或修改的图片')
+    watch_parser.add_argument('-i', '--input', required=True, help='监视的输入目录')
+    watch_parser.add_argument('-o', '--output', required=True, help='输出目录，增量清单和待处理队列也保存在其中')
+    watch_parser.add_argument('-s', '--step', dest='steps', action='append', required=True, type=parse_step,
+                              help='处理步骤，格式与 pipeline 命令相同，可重复指定')
+    watch_parser.add_argument('-j', '--jobs', type=int, default=1, help='并行进程数 (默认1，0表示使用全部CPU核心)')
+    watch_parser.add_argument('-r', '--recursive', action='store_true', help='监视子目录，并在输出目录中保持相同结构')
+    watch_parser.add_argument('--include', action='append', metavar='PATTERN', help='只处理匹配的文件 (通配符，可重复指定)')
+    watch_parser.add_argument('--exclude', action='append', metavar='PATTERN', help='排除匹配的文件或目录 (通配符，可重复指定)')
+    watch_parser.add_argument('--hash', action='store_true', help='修改时间变化时再比较文件内容摘要，内容未变的文件不重新处理')
+    watch_parser.add_argument('--settle', type=float, default=1.0,
+                              help='文件大小和修改时间保持不变多少秒后视为写入完成 (默认1.0)')
+    watch_parser.add_argument('--poll', action='store_true', help='不使用inotify，定期轮询目录')
+    watch_parser.add_argument('--poll-interval', type=float, default=2.0, help='轮询间隔秒数 (默认2.0)')
+    watch_parser.add_argument('--jsonl', metavar='FILE', help='将每个文件的处理记录以JSONL格式追加到该文件')
+    
+    # 扫描命令
+    scan_parser = subparsers.add_parser('scan', help='只读取文件头扫描目录，生成图片清单和汇总报告')
+    scan_parser.add_argument('-i', '--input', required=True, help='输入目录')
+    scan_parser.add_argument('-o', '--output', metavar='INVENTORY',
+                             help='将逐文件的清单以JSONL格式写入该文件，可用 --files 作为批处理的输入列表')
+    scan_parser.add_argument('-j', '--jobs', type=int, default=0,
+                             help='并行读取的进程数 (默认0表示CPU核心数，网络存储可以设得更大)')
+    scan_parser.add_argument('-r', '--recursive', action='store_true', help='递归扫描子目录')
+    scan_parser.add_argument('--include', action='append', metavar='PATTERN', help='只扫描匹配的文件 (通配符，可重复指定)')
+    scan_parser.add_argument('--exclude', action='append', metavar='PATTERN', help='排除匹配的文件或目录 (通配符，可重复指定)')
+    
+    # 分布式批处理命令
+    coordinator_parser = subparsers.add_parser('coordinator', help='分布式批处理: 把文件分成租约分发给工作进程')
+    coordinator_parser.add_argument('-i', '--input', required=True, help='输入目录 (工作进程须能访问)')
+    coordinator_parser.add_argument('-o', '--output', required=True, help='输出目录 (工作进程须能访问)')
+    coordinator_parser.add_argument('-s', '--step', dest='steps', action='append', required=True, type=parse_step,
+                                    help='处理步骤，格式与 pipeline 命令相同，可重复指定')
+    coordinator_parser.add_argument('--listen', default='127.0.0.1:5000',
+                                    help='监听地址 host:port 或 unix:/路径 (默认 127.0.0.1:5000)')
+    coordinator_parser.add_argument('--local-workers', type=int, default=0, help='同时在本机启动的工作进程数')
+    coordinator_parser.add_argument('--lease-size', type=int, default=16, help='每个租约包含的文件数 (默认16)')
+    coordinator_parser.add_argument('--lease-timeout', type=float, default=120.0,
+                                    help='租约超时秒数，超时未回报的租约会重新分配 (默认120)')
+    coordinator_parser.add_argument('-r', '--recursive', action='store_true', help='递归处理子目录')
+    coordinator_parser.add_argument('--include', action='append', metavar='PATTERN', help='只处理匹配的文件 (通配符，可重复指定)')
+    coordinator_parser.add_argument('--exclude', action='append', metavar='PATTERN', help='排除匹配的文件或目录 (通配符，可重复指定)')
+    coordinator_parser.add_argument('--resume', action='store_true', help='继续上次中断的作业')
+    coordinator_parser.add_argument('--jsonl', metavar='FILE', help='将每个文件的处理记录以JSONL格式写入该文件')
+    
+    worker_parser = subparsers.add_parser('worker', help='分布式批处理: 从协调器领取租约并处理')
+    worker_parser.add_argument('--connect', required=True, help='协调器地址 host:port 或 unix:/路径')
+    worker_parser.add_argument('-j', '--jobs', type=int, default=1, help='本机工作进程数 (默认1，0表示使用全部CPU核心)')
+    worker_parser.add_argument('-i', '--input', help='本机上输入目录的挂载路径 (默认与协调器相同)')
+    worker_parser.add_argument('-o', '--output', help='本机上输出目录的挂载路径 (默认与协调器相同)')
     
     args = parser.parse_args()
     
@@ -38,51 +484,129 @@ def main():
     if not args.command:
         parser.print_help()
         return
+    if getattr(args, 'staged', False) and args.jobs != 1:
+        parser.error("--staged 只能在单进程模式下使用 (-j 1)")
+    if getattr(args, 'staged', False) and (is_archive(args.input) or is_archive(args.output)):
+        parser.error("--staged 不支持归档输入或输出")
+    if args.command == 'watermark' and args.font_scale is not None and args.font_scale <= 0:
+        parser.error("--font-scale 必须大于0")
+    if args.command == 'resize':
+        if args.max_edge is not None and (args.width or args.height):
+            parser.error("-e/--max-edge 不能与 -w/-h 同时使用")
+        args.mode = args.mode or 'exact'
+        try:
+            resize_target(args.width, args.height, args.mode, args.max_edge)
+        except ValueError as e:
+            parser.error(str(e))
     
     processor = ImageProcessor()
     
+    if args.command == 'scan':
+        if not os.path.isdir(args.input):
+            parser.error(f"输入目录不存在: {args.input}")
+        run_scan(processor, args)
+        return 0
+    
+    if args.command == 'coordinator':
+        print(f"正在分发处理步骤: {' -> '.join(step['op'] for step in args.steps)}...")
+        results = run_coordinator(processor, args)
+        print(f"处理完成! 成功: {results['success']} 张图片，失败: {results['fail']} 张图片，"
+              f"跳过: {results['skipped']} 个文件，上次已完成: {results['up_to_date']} 张图片")
+        return 0
+    
+    if args.command == 'worker':
+        jobs = args.jobs or os.cpu_count() or 1
+        if jobs == 1:
+            processed = run_worker(args.connect, args.input, args.output)
+            print(f"工作进程结束，处理了 {processed} 张图片")
+        else:
+            for process in start_workers(args.connect, jobs, args.input, args.output):
+                process.join()
+            print(f"{jobs} 个工作进程已结束")
+        return 0
+    
+    if args.command == 'watch':
+        if not os.path.isdir(args.input):
+            parser.error(f"输入目录不存在: {args.input}")
+        print(f"正在监视 {args.input}，处理步骤: {' -> '.join(step['op'] for step in args.steps)}，按 Ctrl+C 停止...")
+        results = run_watch(processor, args)
+        print(f"已停止监视。成功: {results['success']} 张图片，失败: {results['fail']} 张图片")
+        return 0
+    
     try:
         # 执行相应的命令
         if args.command == 'resize':
-            print(f"正在批量调整图片大小为 {args.width}x{args.height}...")
-            results = processor.batch_process(
-                args.input, 
-                args.output, 
-                'resize', 
-                size=(args.width, args.height)
+            size, mode = resize_target(args.width, args.height, args.mode, args.max_edge)
+            if mode == 'max-edge':
+                print(f"正在批量调整图片大小，最长边为 {args.max_edge}...")
+            else:
+                print(f"正在批量调整图片大小为 {args.width or '自动'}x{args.height or '自动'} ({mode})...")
+            results = run_batch(
+                processor,
+                args,
+                'resize',
+                size=size,
+                mode=mode,
+                quality=args.quality,
+                tiled=args.tiled,
+                strip_bytes=args.strip_size
             )
         
         elif args.command == 'convert':
             print(f"正在批量转换图片格式为 {args.format}...")
-            results = processor.batch_process(
-                args.input, 
-                args.output, 
-                'convert', 
-                format_name=args.format
+            results = run_batch(
+                processor,
+                args,
+                'convert',
+                format_name=args.format,
+                profile=args.profile,
+                max_bytes=args.max_bytes,
+                tiled=args.tiled,
+                strip_bytes=args.strip_size
             )
         
         elif args.command == 'watermark':
             # 处理位置参数
-            position = args.position
-            if position != 'center' and ',' in position:
-                try:
-                    x, y = map(int, position.split(','))
-                    position = (x, y)
-                except ValueError:
-                    print("位置格式错误，应为 'x,y' 或 'center'")
-                    return
+            try:
+                position = parse_position(args.position)
+            except ValueError as e:
+                print(e)
+                return
             
             watermark_type = "文本" if args.text else "图片"
             print(f"正在批量添加{watermark_type}水印...")
             
-            results = processor.batch_process(
-                args.input, 
-                args.output, 
-                'watermark', 
+            results = run_batch(
+                processor,
+                args,
+                'watermark',
                 watermark_text=args.text,
                 watermark_image=args.image,
                 position=position,
-                opacity=args.opacity
+                opacity=args.opacity,
+                font_scale=args.font_scale,
+                tiled=args.tiled,
+                strip_bytes=args.strip_size
+            )
+        
+        elif args.command == 'pipeline':
+            print(f"正在批量执行 {len(args.steps)} 个处理步骤: {' -> '.join(step['op'] for step in args.steps)}...")
+            results = run_batch(
+                processor,
+                args,
+                'pipeline',
+                steps=args.steps
+            )
+        
+        elif args.command == 'renditions':
+            print(f"正在批量生成 {', '.join(map(str, args.sizes))} 尺寸的版本...")
+            results = run_batch(
+                processor,
+                args,
+                'renditions',
+                sizes=args.sizes,
+                layout=args.layout,
+                quality=args.quality
             )
         
         # 打印处理结果
@@ -90,6 +614,10 @@ def main():
         print(f"成功: {results['success']} 张图片")
         print(f"失败: {results['fail']} 张图片")
         print(f"跳过: {results['skipped']} 个文件 (非支持的图片格式)")
+        if args.incremental or args.resume:
+            print(f"已是最新: {results['up_to_date']} 张图片 (上次已完成或源文件未变化)")
+        if args.dedup:
+            print(f"重复: {results['duplicate']} 张图片 (复用了内容相同图片的输出)")
         
     except Exception as e:
         print(f"处理过程中出错: {e}")
@@ -0,0 +1,125 @@
+import os
+import json
+import hashlib
+from journal import durable_replace
+
+MANIFEST_NAME = '.image_manifest.json'
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """
+    计算文件内容的BLAKE2b摘要
+
+    参数:
+        path (str): 文件路径
+        chunk_size (int): 每次读取的字节数
+
+    返回:
+        str: 十六进制摘要
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def params_fingerprint(operation, kwargs):
+    """
+    计算操作参数的指纹，参数或水印图片变化时指纹随之改变
+
+    参数:
+        operation (str): 操作类型
+        kwargs (dict): 操作特定的参数
+
+    返回:
+        str: 十六进制指纹
+    """
+    watermark_images = [kwargs.get('watermark_image')]
+    watermark_images += [step.get('watermark_image') for step in kwargs.get('steps', [])]
+    watermark_stats = {}
+    for path in filter(None, watermark_images):
+        try:
+            stat = os.stat(path)
+            watermark_stats[path] = [stat.st_size, stat.st_mtime_ns]
+        except OSError:
+            watermark_stats[path] = None
+
+    payload = json.dumps([operation, kwargs, watermark_stats], sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+class BatchManifest:
+    """增量批处理清单，记录每个源文件上次成功处理时的状态"""
+
+    def __init__(self, output_dir, use_hash=False):
+        """
+        初始化并加载清单
+
+        参数:
+            output_dir (str): 输出目录，清单文件保存在其中
+            use_hash (bool): 源文件修改时间变化时是否再比较内容摘要
+        """
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        self.use_hash = use_hash
+        self.entries = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f).get('files', {})
+            except (OSError, ValueError) as e:
+                print(f"读取清单失败，将重新处理所有文件: {e}")
+
+    def is_current(self, key, input_path, fingerprint, output_paths):
+        """
+        判断源文件的输出是否已是最新
+
+        参数:
+            key (str): 源文件在清单中的键（相对输入目录的路径）
+            input_path (str): 源文件路径
+            fingerprint (str): 当前操作参数指纹
+            output_paths (list): 该文件对应的全部输出路径
+
+        返回:
+            bool: 输出存在且源文件和参数都未变化时返回True
+        """
+        entry = self.entries.get(key)
+        if not entry or entry.get('fingerprint') != fingerprint:
+            return False
+        if not all(os.path.exists(path) for path in output_paths):
+            return False
+
+        try:
+            stat = os.stat(input_path)
+            if entry['size'] != stat.st_size:
+                return False
+            if entry['mtime_ns'] == stat.st_mtime_ns:
+                return True
+
+            # 修改时间变化但内容可能未变（如同步工具重写了文件）
+            if self.use_hash and entry.get('hash') and entry['hash'] == file_hash(input_path):
+                entry['mtime_ns'] = stat.st_mtime_ns
+                return True
+        except OSError:
+            # 源文件在扫描后被删除或无法读取，交给处理流程记为失败
+            return False
+        return False
+
+    def record(self, key, input_path, fingerprint):
+        """记录源文件处理成功后的状态"""
+        try:
+            stat = os.stat(input_path)
+        except OSError:
+            return
+        self.entries[key] = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'hash': file_hash(input_path) if self.use_hash else None,
+            'fingerprint': fingerprint
+        }
+
+    def save(self):
+        """原子地写回清单文件"""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': 1, 'files': self.entries}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        durable_replace(tmp_path, self.path, synced=True)
@@ -0,0 +1,82 @@
+import os
+from fnmatch import fnmatch
+
+def _matches(rel_path, patterns):
+    """判断相对路径或其文件名是否匹配任一通配符模式"""
+    posix_path = rel_path.replace(os.sep, '/')
+    name = posix_path.rsplit('/', 1)[-1]
+    return any(fnmatch(posix_path, pattern) or fnmatch(name, pattern) for pattern in patterns)
+
+def scan_files(root, recursive=False, include=None, exclude=None, skip_dirs=()):
+    """
+    流式扫描目录中的文件
+
+    基于 os.scandir 的生成器，边遍历边产出结果：不需要先列出整个目录，
+    第一批文件可以在遍历结束前就开始处理，内存占用与目录大小无关。
+    子目录在当前目录的文件全部产出后再依次进入。
+
+    参数:
+        root (str): 要扫描的根目录
+        recursive (bool): 是否递归进入子目录
+        include (list, optional): 包含的通配符模式，匹配相对路径或文件名，默认包含全部
+        exclude (list, optional): 排除的通配符模式，匹配的目录整个跳过
+        skip_dirs (iterable): 需要跳过的目录路径（例如位于输入目录内的输出目录）
+
+    返回:
+        generator: 依次产出 (相对路径, 完整路径)
+    """
+    include = include or []
+    exclude = exclude or []
+    skip_dirs = {os.path.abspath(path) for path in skip_dirs}
+    pending = [(root, '')]
+
+    while pending:
+        directory, rel_dir = pending.pop()
+        subdirs = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    rel_path = os.path.join(rel_dir, entry.name)
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        continue
+
+                    if is_dir:
+                        if recursive and os.path.abspath(entry.path) not in skip_dirs \
+                                and not _matches(rel_path, exclude):
+                            subdirs.append((entry.path, rel_path))
+                        continue
+
+                    if include and not _matches(rel_path, include):
+                        continue
+                    if exclude and _matches(rel_path, exclude):
+                        continue
+                    yield rel_path, entry.path
+        except OSError as e:
+            print(f"无法读取目录 {directory}: {e}")
+
+        # 反向入栈，使子目录按遍历顺序被处理
+        pending.extend(reversed(subdirs))
+
+def path_selected(rel_path, include=None, exclude=None):
+    """
+    判断不在文件系统中的相对路径（如归档成员）是否被筛选条件选中
+
+    与 scan_files 的规则相同：被排除目录下的文件同样被排除。
+
+    参数:
+        rel_path (str): 相对路径
+        include (list, optional): 包含的通配符模式
+        exclude (list, optional): 排除的通配符模式
+
+    返回:
+        bool: 是否选中
+    """
+    exclude = exclude or []
+    parts = rel_path.replace(os.sep, '/').split('/')
+    if any(_matches('/'.join(parts[:i]), exclude) for i in range(1, len(parts))):
+        return False
+    if include and not _matches(rel_path, include):
+        return False
+    return not (exclude and _matches(rel_path, exclude))
@@ -0,0 +1,107 @@
+from concurrent.futures import wait, FIRST_COMPLETED
+from tiling import DEFAULT_STRIP_BYTES, RowReader, open_unchecked
+
+# 处理过程中同时存在的整幅图像副本数（相对解码后大小的倍数）
+OPERATION_FACTORS = {
+    'resize': 1.5,
+    'convert': 2.0,
+    'watermark': 2.0,
+    'pipeline': 2.5,
+    'renditions': 1.5,
+}
+
+# 每个任务的固定开销（编码缓冲区、水印素材等）
+TASK_OVERHEAD = 8 * 1024 * 1024
+
+def pixel_bytes(mode):
+    """
+    Pillow内部存储每个像素占用的字节数
+
+    参数:
+        mode (str): 图片模式
+
+    返回:
+        int: 字节数，多通道模式按4字节存储
+    """
+    if mode in ('1', 'L', 'P'):
+        return 1
+    if mode.startswith('I;16'):
+        return 2
+    return 4
+
+def estimate_footprint(image_path, operation=None, kwargs=None):
+    """
+    只读取文件头估算处理一张图片的峰值内存
+
+    参数:
+        image_path (str 或 文件对象): 图片路径，或内存中的文件内容
+        operation (str, optional): 操作类型，用于估算处理过程中的副本数
+        kwargs (dict, optional): 操作参数，分条处理时按条大小估算
+
+    返回:
+        int: 估算的字节数，无法读取文件头时只返回固定开销
+    """
+    try:
+        with open_unchecked(image_path) as img:
+            width, height = img.size
+            mode = img.mode
+    except Exception:
+        return TASK_OVERHEAD
+
+    # 水印合成可能需要RGBA副本
+    if operation in ('watermark', 'pipeline'):
+        mode = 'RGBA'
+    decoded = width * height * pixel_bytes(mode)
+    footprint = int(decoded * OPERATION_FACTORS.get(operation, 2.0)) + TASK_OVERHEAD
+
+    # 分条处理的内存与条大小相关，缩放时还需容纳输出图片
+    kwargs = kwargs or {}
+    if kwargs.get('tiled') and isinstance(image_path, str) and operation in ('resize', 'convert', 'watermark') and RowReader(image_path).streamable:
+        tiled = 3 * (kwargs.get('strip_bytes') or DEFAULT_STRIP_BYTES) + TASK_OVERHEAD
+        if operation == 'resize':
+            width, height = kwargs['size']
+            tiled += (width or height) * (height or width) * 4
+        footprint = min(footprint, tiled)
+    return footprint
+
+class MemoryScheduler:
+    """按内存预算准入并行任务：小图密集并行，超出预算的大图单独运行"""
+
+    def __init__(self, budget, max_running):
+        """
+        初始化调度器
+
+        参数:
+            budget (int): 内存预算（字节）
+            max_running (int): 同时运行的最大任务数（通常为进程数）
+        """
+        self.budget = budget
+        self.max_running = max_running
+        self.used = 0
+        self.running = {}
+
+    def admit(self, cost):
+        """
+        判断估算占用为 cost 的任务现在能否提交
+
+        没有任务在运行时总是允许，因此单张超出预算的图片也会被处理，只是不与其他任务并行。
+        """
+        self._release_done()
+        if not self.running:
+            return True
+        return len(self.running) < self.max_running and self.used + cost <= self.budget
+
+    def track(self, future, cost):
+        """记录已提交任务的内存占用"""
+        self.running[future] = cost
+        self.used += cost
+
+    def wait(self):
+        """阻塞直到至少一个运行中的任务完成并释放其预算"""
+        if self.running:
+            wait(list(self.running), return_when=FIRST_COMPLETED)
+        self._release_done()
+
+    def _release_done(self):
+        for future in [future for future in self.running if future.done()]:
+            self.used -= self.running.pop(future)
@@ -0,0 +1,158 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from journal import atomic_write
+
+# 可以从内存中解码、编码到内存的操作（分条处理和多尺寸版本自行读写文件）
+BUFFERED_OPERATIONS = ('resize', 'convert', 'watermark', 'pipeline')
+
+class StagedExecutor:
+    """分阶段流水线：读取线程预取文件内容，当前线程解码、处理和编码，写出线程写入磁盘"""
+
+    def __init__(self, readers=2, writers=2, queue_depth=8):
+        """
+        初始化流水线
+
+        参数:
+            readers (int): 读取线程数
+            writers (int): 写出线程数
+            queue_depth (int): 预取和待写出队列的长度上限，决定内存中最多缓存的文件数
+        """
+        self.readers = max(1, readers)
+        self.writers = max(1, writers)
+        self.queue_depth = max(1, queue_depth)
+        self.busy = {'read': 0.0, 'cpu': 0.0, 'write': 0.0}
+        self.read_wait = 0.0
+        self.write_wait = 0.0
+        self.wall_time = 0.0
+        self._lock = threading.Lock()
+
+    def run(self, processor, keyed_tasks):
+        """
+        执行任务并按提交顺序产出处理记录
+
+        参数:
+            processor (ImageProcessor): 图片处理器
+            keyed_tasks (iterable): 产出 (键, 任务参数元组, 记录) 的可迭代对象，
+                记录不为None时表示无需处理，按原顺序直接产出
+
+        返回:
+            generator: 依次产出 (键, 任务参数元组, 处理记录)
+        """
+        tasks = iter(keyed_tasks)
+        reads = deque()
+        writes = deque()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(self.readers) as read_pool, ThreadPoolExecutor(self.writers) as write_pool:
+            try:
+                while True:
+                    # 保持预取队列填满，读取与当前文件的处理重叠进行
+                    while len(reads) < self.queue_depth:
+                        item = next(tasks, None)
+                        if item is None:
+                            break
+                        key, task, record = item
+                        future = None
+                        if task is not None and task[2] in BUFFERED_OPERATIONS and not task[3].get('tiled'):
+                            future = read_pool.submit(self._read, task[0])
+                        reads.append((key, task, record, future))
+                    if not reads:
+                        break
+
+                    key, task, record, future = reads.popleft()
+                    if task is not None:
+                        record, future = self._process(processor, task, future, write_pool)
+                    writes.append((key, task, record, future))
+
+                    # 待写出队列满时等待最早的写出完成，限制内存中的编码结果数量
+                    while writes and (len(writes) > self.queue_depth or self._written(writes[0])):
+                        yield self._finish(*writes.popleft())
+                while writes:
+                    yield self._finish(*writes.popleft())
+            finally:
+                for item in reads:
+                    if item[3] is not None:
+                        item[3].cancel()
+                self.wall_time += time.perf_counter() - start
+
+    def _process(self, processor, task, read_future, write_pool):
+        """处理阶段：取出预取的内容，在内存中解码、处理、编码后提交写出"""
+        input_path, output_path, operation, kwargs = task
+        if read_future is None:
+            # 不能在内存中处理的任务直接读写文件
+            started = time.perf_counter()
+            record = processor.process_file(*task)
+            self.busy['cpu'] += time.perf_counter() - started
+            return record, None
+
+        waited = time.perf_counter()
+        try:
+            data, read_time = read_future.result()
+        except OSError as e:
+            record = processor._make_record(input_path, output_path, 'fail')
+            record['error'] = str(e)
+            return record, None
+        started = time.perf_counter()
+        self.read_wait += started - waited
+
+        record, encoded = processor.process_bytes(input_path, output_path, operation, kwargs, data)
+        record['read_time'] = read_time
+        self.busy['cpu'] += time.perf_counter() - started
+        if encoded is None:
+            return record, None
+        return record, write_pool.submit(self._write, output_path, encoded)
+
+    def _read(self, path):
+        """读取阶段：把整个文件读入内存"""
+        started = time.perf_counter()
+        with open(path, 'rb') as f:
+            data = f.read()
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.busy['read'] += elapsed
+        return data, elapsed
+
+    def _write(self, path, data):
+        """写出阶段：把编码结果写入磁盘"""
+        started = time.perf_counter()
+        atomic_write(path, data)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.busy['write'] += elapsed
+        return elapsed
+
+    @staticmethod
+    def _written(item):
+        future = item[3]
+        return future is None or future.done()
+
+    def _finish(self, key, task, record, future):
+        """等待写出完成，补全处理记录"""
+        if future is not None:
+            waited = time.perf_counter()
+            try:
+                record['write_time'] = future.result()
+            except OSError as e:
+                record['status'] = 'fail'
+                record['error'] = str(e)
+                record['bytes_out'] = 0
+            self.write_wait += time.perf_counter() - waited
+        return key, task, record
+
+    def utilization(self):
+        """
+        统计各阶段的利用率
+
+        返回:
+            dict: 'read'、'cpu'、'write' 为各阶段忙碌时间占 (线程数 × 总时间) 的比例，
+                  'read_wait' 为处理阶段等待预取的秒数，'write_wait' 为等待写出的秒数
+        """
+        wall = self.wall_time or 1e-9
+        return {
+            'read': self.busy['read'] / (wall * self.readers),
+            'cpu': self.busy['cpu'] / wall,
+            'write': self.busy['write'] / (wall * self.writers),
+            'read_wait': self.read_wait,
+            'write_wait': self.write_wait
+        }
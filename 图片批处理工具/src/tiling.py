@@ -0,0 +1,285 @@
+import os
+import math
+import struct
+import tempfile
+import zlib
+from functools import lru_cache
+from PIL import Image
+
+# 分条处理时每条源数据的默认大小上限
+DEFAULT_STRIP_BYTES = 64 * 1024 * 1024
+
+# 可按行分段解码的原始数据格式每像素位数
+RAW_MODE_BITS = {
+    '1': 1, '1;I': 1, 'L': 8, 'P': 8, 'LA': 16,
+    'RGB': 24, 'BGR': 24, 'RGBA': 32, 'RGBX': 32, 'BGRA': 32, 'BGRX': 32, 'CMYK': 32,
+    'I;16': 16, 'I;16L': 16, 'I;16B': 16, 'I': 32, 'F': 32,
+}
+
+def open_unchecked(path):
+    """
+    打开图片而不触发Pillow的解压炸弹检查
+
+    分条处理的内存上限由调用方控制，因此超大图片不应在打开时就被拒绝。
+    """
+    saved = Image.MAX_IMAGE_PIXELS
+    Image.MAX_IMAGE_PIXELS = None
+    try:
+        return Image.open(path)
+    finally:
+        Image.MAX_IMAGE_PIXELS = saved
+
+def stream_mode(mode):
+    """返回流式写出时使用的图片模式 (L、RGB 或 RGBA)"""
+    if mode in ('L', 'RGB', 'RGBA'):
+        return mode
+    if mode == '1':
+        return 'L'
+    if mode in ('LA', 'PA', 'P'):
+        return 'RGBA'
+    return 'RGB'
+
+def strip_rows(width, max_strip_bytes, bytes_per_pixel=4):
+    """计算在字节上限内每条可以包含的行数，至少为1"""
+    return max(1, max_strip_bytes // max(width * bytes_per_pixel, 1))
+
+class RowReader:
+    """按行区间解码图片，只支持由原始数据块 (raw tile) 组成的图片，如BMP、PPM和未压缩的TIFF"""
+
+    def __init__(self, path, verify=True):
+        """
+        读取文件头并检查是否可以分段解码
+
+        参数:
+            path (str): 图片路径
+            verify (bool): 同时确认当前Pillow版本的分段解码结果与整图解码一致，见 row_reads_supported
+        """
+        self.path = path
+        with open_unchecked(path) as img:
+            self.size = img.size
+            self.mode = img.mode
+            self.format = img.format
+            self.info = dict(img.info)
+            self.tiles = list(img.tile)
+            # 带方向标记的图片在解码后整体旋转，无法分段处理
+            oriented = img.getexif().get(0x0112, 1) != 1
+        self.streamable = bool(self.tiles) and not oriented and all(self._raw_args(tile) for tile in self.tiles) \
+            and (not verify or row_reads_supported())
+
+    @staticmethod
+    def _raw_args(tile):
+        """返回原始数据块的 (rawmode, 行字节数, 行方向)，不是可分段的数据块时返回None"""
+        codec, extents, offset, args = tile[:4]
+        if codec != 'raw':
+            return None
+        if isinstance(args, str):
+            args = (args, 0, 1)
+        rawmode, stride, orientation = (tuple(args) + (0, 1))[:3]
+        if not stride:
+            bits = RAW_MODE_BITS.get(rawmode)
+            if bits is None:
+                return None
+            stride = (bits * (extents[2] - extents[0]) + 7) // 8
+        return rawmode, stride, orientation or 1
+
+    @staticmethod
+    def _make_tile(tile, extents, offset, args):
+        if hasattr(tile, '_replace'):
+            return tile._replace(extents=extents, offset=offset, args=args)
+        return (tile[0], extents, offset, args)
+
+    def read(self, top, bottom):
+        """
+        解码第 top 到 bottom-1 行
+
+        参数:
+            top (int): 起始行
+            bottom (int): 结束行（不含）
+
+        返回:
+            PIL.Image.Image: 宽度与原图相同、高度为 bottom-top 的图片
+        """
+        tiles = []
+        for tile in self.tiles:
+            x0, y0, x1, y1 = tile[1]
+            if y1 <= top or y0 >= bottom:
+                continue
+            rawmode, stride, orientation = self._raw_args(tile)
+            # 只取数据块中与请求区间重叠的行
+            start, end = max(y0, top), min(y1, bottom)
+            if orientation < 0:
+                offset = tile[2] + (y1 - end) * stride
+            else:
+                offset = tile[2] + (start - y0) * stride
+            tiles.append(self._make_tile(tile, (x0, start - top, x1, end - top), offset,
+                                         (rawmode, stride, orientation)))
+
+        img = open_unchecked(self.path)
+        img.tile = tiles
+        img._size = (self.size[0], bottom - top)
+        if hasattr(img, '_tile_size'):
+            # TIFF按 _tile_size 分配解码缓冲区
+            img._tile_size = img._size
+        img.load()
+        return img
+
+@lru_cache(maxsize=None)
+def row_reads_supported():
+    """
+    检查分段解码在当前Pillow版本下是否与整图解码逐像素一致
+
+    RowReader.read 直接修改Pillow内部的 tile、_size 和 _tile_size 属性，Pillow升级后可能失效。
+    首次使用时分别用自下而上存储的BMP和未压缩的TIFF小图做一次往返校验，不一致或出错时
+    所有图片都退回整图处理。
+
+    返回:
+        bool: 分段解码可用时返回True
+    """
+    sample = Image.effect_noise((7, 37), 64).convert('RGB')
+    bands = [(0, 5), (5, 18), (18, 37)]
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for filename in ('sample.bmp', 'sample.tif'):
+                path = os.path.join(directory, filename)
+                sample.save(path)
+                reader = RowReader(path, verify=False)
+                if not reader.streamable:
+                    return False
+                for top, bottom in bands:
+                    with reader.read(top, bottom) as band:
+                        if band.tobytes() != sample.crop((0, top, sample.width, bottom)).tobytes():
+                            return False
+    except Exception:
+        return False
+    return True
+
+def iter_row_bands(height, rows):
+    """依次产出 (起始行, 结束行)"""
+    for top in range(0, height, rows):
+        yield top, min(top + rows, height)
+
+class TiffStripWriter:
+    """逐条写出未压缩的TIFF文件，内存中只保留当前一条数据"""
+
+    PHOTOMETRIC = {'L': 1, 'RGB': 2, 'RGBA': 2}
+
+    def __init__(self, path, size, mode):
+        if mode not in self.PHOTOMETRIC:
+            raise ValueError(f"TIFF流式写出不支持的模式: {mode}")
+        self.size = size
+        self.mode = mode
+        self.samples = len(mode)
+        self.row_bytes = size[0] * self.samples
+        if self.row_bytes * size[1] + 1024 >= 2 ** 32:
+            raise ValueError("图片超过标准TIFF的4GB上限")
+        self.rows_written = 0
+        self.file = open(path, 'wb')
+        # 文件头中IFD的位置在写完所有数据后回填
+        self.file.write(b'II*\x00\x00\x00\x00\x00')
+        self.data_offset = 8
+
+    def write(self, strip):
+        """写入若干整行"""
+        if strip.mode != self.mode:
+            strip = strip.convert(self.mode)
+        self.file.write(strip.tobytes())
+        self.rows_written += strip.height
+
+    def close(self):
+        """写出IFD并关闭文件"""
+        width, height = self.size
+        rows_per_strip = max(1, (1024 * 1024) // max(self.row_bytes, 1))
+        strip_count = math.ceil(height / rows_per_strip)
+        offsets = [self.data_offset + i * rows_per_strip * self.row_bytes for i in range(strip_count)]
+        counts = [min(rows_per_strip, height - i * rows_per_strip) * self.row_bytes for i in range(strip_count)]
+
+        f = self.file
+        if f.tell() % 2:
+            f.write(b'\x00')
+
+        def write_array(fmt, values):
+            position = f.tell()
+            f.write(struct.pack(f'<{len(values)}{fmt}', *values))
+            return position
+
+        entries = []
+
+        def add(tag, typ, values):
+            fmt, size = ('H', 2) if typ == 3 else ('I', 4)
+            if len(values) * size <= 4:
+                value = struct.pack(f'<{len(values)}{fmt}', *values).ljust(4, b'\x00')
+            else:
+                value = struct.pack('<I', write_array(fmt, values))
+            entries.append(struct.pack('<HHI', tag, typ, len(values)) + value)
+
+        add(256, 4, [width])
+        add(257, 4, [height])
+        add(258, 3, [8] * self.samples)
+        add(259, 3, [1])
+        add(262, 3, [self.PHOTOMETRIC[self.mode]])
+        add(273, 4, offsets)
+        add(277, 3, [self.samples])
+        add(278, 4, [rows_per_strip])
+        add(279, 4, counts)
+        add(284, 3, [1])
+        if self.mode == 'RGBA':
+            add(338, 3, [2])
+
+        if f.tell() % 2:
+            f.write(b'\x00')
+        ifd_offset = f.tell()
+        f.write(struct.pack('<H', len(entries)) + b''.join(entries) + b'\x00\x00\x00\x00')
+        f.seek(4)
+        f.write(struct.pack('<I', ifd_offset))
+        f.close()
+
+    def abort(self):
+        """放弃写入并删除不完整的文件"""
+        self.file.close()
+        os.remove(self.file.name)
+
+class PngStripWriter:
+    """逐条写出PNG文件，每条数据压缩为一个IDAT块"""
+
+    COLOR_TYPES = {'L': 0, 'RGB': 2, 'LA': 4, 'RGBA': 6}
+
+    def __init__(self, path, size, mode, compress_level=6):
+        if mode not in self.COLOR_TYPES:
+            raise ValueError(f"PNG流式写出不支持的模式: {mode}")
+        self.size = size
+        self.mode = mode
+        self.row_bytes = size[0] * len(mode)
+        self.compressor = zlib.compressobj(compress_level)
+        self.file = open(path, 'wb')
+        self.file.write(b'\x89PNG\r\n\x1a\n')
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', size[0], size[1], 8, self.COLOR_TYPES[mode], 0, 0, 0))
+
+    def _chunk(self, chunk_type, data):
+        self.file.write(struct.pack('>I', len(data)) + chunk_type + data)
+        self.file.write(struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff))
+
+    def write(self, strip):
+        """写入若干整行，每行使用无滤波 (filter type 0)"""
+        if strip.mode != self.mode:
+            strip = strip.convert(self.mode)
+        raw = strip.tobytes()
+        rows = b''.join(b'\x00' + raw[i:i + self.row_bytes] for i in range(0, len(raw), self.row_bytes))
+        data = self.compressor.compress(rows)
+        if data:
+            self._chunk(b'IDAT', data)
+
+    def close(self):
+        """写出剩余压缩数据和IEND并关闭文件"""
+        self._chunk(b'IDAT', self.compressor.flush())
+        self._chunk(b'IEND', b'')
+        self.file.close()
+
+    def abort(self):
+        """放弃写入并删除不完整的文件"""
+        self.file.close()
+        os.remove(self.file.name)
+
+STRIP_WRITERS = {
+    'TIFF': TiffStripWriter,
+    'PNG': PngStripWriter,
+}
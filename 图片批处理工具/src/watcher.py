@@ -0,0 +1,516 @@
+import os
+import sys
+import posixpath
+import json
+import time
+import select
+import signal
+import struct
+import ctypes
+import ctypes.util
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dedup import break_link
+from image_processor import _init_worker, _run_task
+from journal import durable_replace
+from manifest import BatchManifest, params_fingerprint
+from scanner import path_selected, scan_files
+
+QUEUE_NAME = '.image_watch_queue.json'
+
+# inotify 事件掩码（见 <sys/inotify.h>）
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+# struct inotify_event 的固定部分: wd, mask, cookie, len
+_EVENT = struct.Struct('iIII')
+
+def _init_watch_worker():
+    """工作进程忽略 Ctrl+C，由主进程负责停止并保存队列"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    _init_worker()
+
+class InotifySource:
+    """基于 Linux inotify 的变化来源，没有变化时阻塞在 select 上，不占用CPU"""
+
+    def __init__(self, root, recursive=False, skip_dirs=()):
+        """
+        建立对目录（递归模式下包括全部子目录）的监视
+
+        参数:
+            root (str): 监视的根目录
+            recursive (bool): 是否监视子目录，新建的子目录会自动加入监视
+            skip_dirs (iterable): 不监视的目录（例如位于输入目录内的输出目录）
+        """
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.root = root
+        self.recursive = recursive
+        self.skip_dirs = {os.path.abspath(path) for path in skip_dirs}
+        # 监视描述符 -> 目录相对路径
+        self.watches = {}
+        try:
+            self._watch_tree('')
+        except OSError:
+            self.close()
+            raise
+
+    def _watch(self, rel_dir):
+        path = os.path.join(self.root, rel_dir)
+        wd = self._add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            # 目录在加入监视前已被删除时忽略，其他错误（如超过 max_user_watches）向上报告
+            if rel_dir and error == 2:
+                return
+            raise OSError(error, os.strerror(error), path)
+        self.watches[wd] = rel_dir
+
+    def _watch_tree(self, rel_dir):
+        """监视目录，递归模式下同时监视其全部子目录"""
+        self._watch(rel_dir)
+        if not self.recursive:
+            return
+        for dirpath, dirnames, _ in os.walk(os.path.join(self.root, rel_dir)):
+            dirnames[:] = [name for name in dirnames
+                           if os.path.abspath(os.path.join(dirpath, name)) not in self.skip_dirs]
+            for name in dirnames:
+                self._watch(os.path.relpath(os.path.join(dirpath, name), self.root))
+
+    def wait(self, timeout):
+        """
+        等待文件变化
+
+        参数:
+            timeout (float): 最长等待秒数
+
+        返回:
+            list: 新建、写入或移入的文件的相对路径；事件队列溢出时返回None，调用方需要重新扫描
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+
+        changed = []
+        overflow = False
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                    continue
+                if mask & IN_IGNORED:
+                    self.watches.pop(wd, None)
+                    continue
+                rel_dir = self.watches.get(wd)
+                if rel_dir is None or not name:
+                    continue
+                rel_path = os.path.join(rel_dir, name)
+
+                if mask & IN_ISDIR:
+                    path = os.path.join(self.root, rel_path)
+                    if self.recursive and mask & (IN_CREATE | IN_MOVED_TO) \
+                            and os.path.abspath(path) not in self.skip_dirs:
+                        # 新目录: 先加入监视，再补上加入监视前已经写入其中的文件
+                        self._watch_tree(rel_path)
+                        changed.extend(os.path.join(rel_path, rel) for rel, _ in
+                                       scan_files(path, True, skip_dirs=self.skip_dirs))
+                    continue
+                changed.append(rel_path)
+        return None if overflow else changed
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingSource:
+    """轮询目录的变化来源，定期比较文件的大小和修改时间，不读取文件内容"""
+
+    def __init__(self, root, recursive=False, skip_dirs=(), interval=2.0):
+        """
+        记录目录的初始状态
+
+        参数:
+            root (str): 监视的根目录
+            recursive (bool): 是否扫描子目录
+            skip_dirs (iterable): 不扫描的目录
+            interval (float): 两次扫描之间的秒数，空闲时的CPU占用与 目录文件数/interval 成正比
+        """
+        self.root = root
+        self.recursive = recursive
+        self.skip_dirs = skip_dirs
+        self.interval = interval
+        self.snapshot = self._scan()
+        self.next_scan = time.monotonic() + interval
+
+    def _scan(self):
+        snapshot = {}
+        for rel_path, path in scan_files(self.root, self.recursive, skip_dirs=self.skip_dirs):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            snapshot[rel_path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def wait(self, timeout):
+        """
+        等待文件变化，接口与 InotifySource.wait 相同
+
+        未到下次扫描时间时只休眠，到时间后扫描一次并返回与上次扫描相比新增或变化的文件。
+        """
+        delay = self.next_scan - time.monotonic()
+        if timeout < delay:
+            time.sleep(max(timeout, 0))
+            return []
+        time.sleep(max(delay, 0))
+        self.next_scan = time.monotonic() + self.interval
+        snapshot = self._scan()
+        changed = [rel_path for rel_path, state in snapshot.items() if self.snapshot.get(rel_path) != state]
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+def create_source(root, recursive=False, skip_dirs=(), poll_interval=2.0, use_inotify=True):
+    """
+    创建目录变化来源，优先使用inotify，不可用时（非Linux、超过监视数量上限等）退回轮询
+
+    返回:
+        InotifySource 或 PollingSource
+    """
+    if use_inotify and sys.platform.startswith('linux'):
+        try:
+            return InotifySource(root, recursive, skip_dirs)
+        except (OSError, AttributeError) as e:
+            print(f"inotify 不可用，改为每 {poll_interval} 秒轮询一次: {e}")
+    return PollingSource(root, recursive, skip_dirs, poll_interval)
+
+class PersistentQueue:
+    """保存在输出目录中的待处理队列，进程重启后继续处理上次未完成的文件"""
+
+    def __init__(self, output_dir):
+        """
+        初始化并加载队列
+
+        参数:
+            output_dir (str): 输出目录，队列文件保存在其中
+        """
+        self.path = os.path.join(output_dir, QUEUE_NAME)
+        # 相对路径 -> 首次发现的时间戳，按发现顺序排列
+        self.items = {}
+        self.dirty = False
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.items = json.load(f).get('files', {})
+            except (OSError, ValueError) as e:
+                print(f"读取待处理队列失败，将重新扫描输入目录: {e}")
+
+    def add(self, key):
+        if key not in self.items:
+            self.items[key] = time.time()
+            self.dirty = True
+
+    def discard(self, key):
+        if self.items.pop(key, None) is not None:
+            self.dirty = True
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def __iter__(self):
+        return iter(list(self.items))
+
+    def __len__(self):
+        return len(self.items)
+
+    def save(self):
+        """有变化时原子地写回队列文件"""
+        if not self.dirty:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': 1, 'files': self.items}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        durable_replace(tmp_path, self.path, synced=True)
+        self.dirty = False
+
+class Watcher:
+    """持续监视输入目录，把新增或修改的图片交给进程池处理"""
+
+    # 有文件等待写入完成或正在处理时，检查状态的间隔（秒）
+    CHECK_INTERVAL = 0.1
+    # 空闲时的最长阻塞时间（秒），决定 stop() 生效的延迟
+    IDLE_TIMEOUT = 1.0
+    # 清单和队列写回磁盘的最小间隔（秒）
+    SAVE_INTERVAL = 1.0
+
+    def __init__(self, processor, input_dir, output_dir, operation, workers=1, recursive=False,
+                 include=None, exclude=None, use_hash=False, settle=1.0, poll_interval=2.0,
+                 use_inotify=True, **kwargs):
+        """
+        初始化监视器
+
+        参数:
+            processor (ImageProcessor): 图片处理器
+            input_dir (str): 监视的输入目录
+            output_dir (str): 输出目录，清单和待处理队列也保存在其中
+            operation (str): 操作类型 ('resize', 'convert', 'watermark', 'pipeline', 'renditions')
+            workers (int): 并行进程数，1表示在当前进程中顺序处理，0表示使用全部CPU核心
+            recursive (bool): 是否监视子目录，输出目录中会重建相同的目录结构
+            include (list, optional): 包含的通配符模式
+            exclude (list, optional): 排除的通配符模式
+            use_hash (bool): 修改时间变化时再比较内容摘要，内容未变的文件不重新处理
+            settle (float): 文件大小和修改时间保持不变多少秒后才认为写入已完成
+            poll_interval (float): 无法使用inotify时轮询目录的间隔（秒）
+            use_inotify (bool): 是否尝试使用inotify
+            **kwargs: 操作特定的参数
+        """
+        self.processor = processor
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.operation = operation
+        self.kwargs = kwargs
+        self.workers = workers or os.cpu_count() or 1
+        self.recursive = recursive
+        self.include = include
+        self.exclude = exclude
+        self.use_hash = use_hash
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.source = None
+        self.stopped = False
+
+    def stop(self):
+        """请求停止监视，最迟在 IDLE_TIMEOUT 秒后生效"""
+        self.stopped = True
+
+    def run(self, on_record=None):
+        """
+        监视并处理文件，直到调用 stop() 或收到 KeyboardInterrupt
+
+        启动时先处理上次退出时队列中未完成的文件，以及停止期间新增或修改的文件。
+        新文件的大小和修改时间在 settle 秒内不再变化后才会处理，避免读取到写了一半的文件。
+        成功处理的文件记入输出目录的增量清单；退出时正在处理的文件留在队列中，下次启动时重新处理。
+
+        参数:
+            on_record (callable, optional): 每处理完一个文件调用一次，参数为处理记录（结构见
+                ImageProcessor.process_file），额外包含 key（相对输入目录的路径）和
+                latency（从发现文件到处理完成的秒数）
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.manifest = BatchManifest(self.output_dir, self.use_hash)
+        self.queue = PersistentQueue(self.output_dir)
+        self.fingerprint = params_fingerprint(self.operation, self.kwargs)
+        skip_dirs = [self.output_dir]
+        # 相对路径 -> (大小, 修改时间, 保持不变的起始时间)，None 表示尚未检查
+        self.settling = {key: None for key in self.queue}
+        self.ready = deque()
+        # 相对路径 -> (Future 或处理记录, 提交时的 (大小, 修改时间))
+        self.in_flight = {}
+        self.on_record = on_record
+        self.manifest_dirty = False
+        last_save = time.monotonic()
+
+        # 先建立监视再扫描，扫描期间新增的文件不会遗漏
+        self.source = create_source(self.input_dir, self.recursive, skip_dirs, self.poll_interval, self.use_inotify)
+        for rel_path, _ in scan_files(self.input_dir, self.recursive, self.include, self.exclude, skip_dirs):
+            self._offer(rel_path, skip_current=True)
+
+        self.executor = self._new_executor()
+        try:
+            while not self.stopped:
+                if self.ready and len(self.in_flight) < self.workers * 2:
+                    timeout = 0
+                elif self.settling or self.in_flight:
+                    timeout = self.CHECK_INTERVAL
+                else:
+                    timeout = self.IDLE_TIMEOUT
+
+                changed = self.source.wait(timeout)
+                if changed is None:
+                    # 事件太多、内核队列溢出，重新扫描整个目录
+                    changed = [rel_path for rel_path, _ in
+                               scan_files(self.input_dir, self.recursive, self.include, self.exclude, skip_dirs)]
+                for rel_path in changed:
+                    self._offer(rel_path)
+
+                self._check_settled()
+                self._submit()
+                if self._collect():
+                    # 工作进程异常退出后进程池不能再用，换一个新的继续监视
+                    print("工作进程异常退出，重新创建进程池")
+                    self.executor.shutdown(wait=False, cancel_futures=True)
+                    self.executor = self._new_executor()
+
+                now = time.monotonic()
+                if now - last_save >= self.SAVE_INTERVAL:
+                    # 只在有变化时写回，空闲时不产生磁盘I/O
+                    if self.manifest_dirty:
+                        self.manifest.save()
+                        self.manifest_dirty = False
+                    self.queue.save()
+                    last_save = now
+        finally:
+            if self.executor:
+                # 未完成的任务留在队列中，下次启动时重新处理
+                self.executor.shutdown(wait=False, cancel_futures=True)
+            self.source.close()
+            self.manifest.save()
+            self.queue.save()
+
+    def _new_executor(self):
+        """创建进程池，单进程处理时返回None"""
+        if self.workers <= 1:
+            return None
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_watch_worker)
+
+    def _offer(self, rel_path, skip_current=False):
+        """把发生变化的文件加入待处理队列，等待其写入完成"""
+        key = rel_path.replace(os.sep, '/')
+        if os.path.splitext(key)[1].lower() not in self.processor.supported_formats:
+            return
+        if not path_selected(key, self.include, self.exclude):
+            return
+        if skip_current and key not in self.queue:
+            # 启动扫描时跳过已是最新的文件，不把整个目录写进队列
+            input_path, output_path = self._paths(key)
+            try:
+                if self.manifest.is_current(key, input_path, self.fingerprint,
+                                            self.processor.output_paths(output_path, self.operation, self.kwargs)):
+                    return
+            except OSError:
+                return
+        self.queue.add(key)
+        self.settling[key] = None
+
+    def _paths(self, key):
+        """返回文件的输入路径和输出路径"""
+        rel_dir, filename = posixpath.split(key)
+        input_path = os.path.join(self.input_dir, *key.split('/'))
+        target_dir = os.path.join(self.output_dir, *rel_dir.split('/')) if rel_dir else self.output_dir
+        return input_path, os.path.join(target_dir, self.processor.output_filename(filename, self.operation, self.kwargs))
+
+    def _check_settled(self):
+        """大小和修改时间保持 settle 秒不变的文件视为写入完成，移入就绪队列"""
+        now = time.monotonic()
+        for key, previous in list(self.settling.items()):
+            try:
+                stat = os.stat(self._paths(key)[0])
+            except OSError:
+                # 文件已被删除或改名（改名后的新路径会另外收到事件）
+                del self.settling[key]
+                self.queue.discard(key)
+                continue
+            state = (stat.st_size, stat.st_mtime_ns)
+            if previous is None or previous[:2] != state:
+                self.settling[key] = state + (now,)
+            elif now - previous[2] >= self.settle and key not in self.in_flight:
+                del self.settling[key]
+                self.ready.append(key)
+
+    def _submit(self):
+        """提交就绪的文件，保持有限数量的任务在途"""
+        while self.ready and len(self.in_flight) < self.workers * 2:
+            key = self.ready.popleft()
+            if key in self.in_flight or key in self.settling:
+                continue
+            input_path, output_path = self._paths(key)
+            outputs = self.processor.output_paths(output_path, self.operation, self.kwargs)
+            try:
+                stat = os.stat(input_path)
+                if self.manifest.is_current(key, input_path, self.fingerprint, outputs):
+                    self.queue.discard(key)
+                    continue
+            except OSError:
+                self.queue.discard(key)
+                continue
+            for path in outputs:
+                os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+                break_link(path)
+
+            task = (input_path, output_path, self.operation, self.kwargs)
+            state = (stat.st_size, stat.st_mtime_ns)
+            if self.executor:
+                self.in_flight[key] = (self.executor.submit(_run_task, task), state)
+            else:
+                # 顺序处理时每轮只处理一个文件，处理间隙继续接收新的事件
+                try:
+                    result = self.processor.run_task(task)
+                except Exception as e:
+                    result = self._failed_record(input_path, output_path, e)
+                self.in_flight[key] = (result, state)
+                break
+
+    def _failed_record(self, input_path, output_path, error):
+        """任务本身抛出异常（如工作进程崩溃）时生成失败记录"""
+        record = self.processor._make_record(input_path, output_path, 'fail')
+        record['error'] = str(error) or error.__class__.__name__
+        return record
+
+    def _collect(self):
+        """
+        取回已完成的任务，更新清单和队列
+
+        返回:
+            bool: 有工作进程异常退出、进程池需要重新创建时返回True
+        """
+        # 进程池损坏后其余在途任务也会很快以同样的异常结束，一并取回，避免重复创建进程池
+        broken = any(not isinstance(result, dict) and result.done() and
+                     isinstance(result.exception(), BrokenProcessPool)
+                     for result, _ in self.in_flight.values())
+        for key, (result, state) in list(self.in_flight.items()):
+            if not isinstance(result, dict):
+                if not result.done() and not broken:
+                    continue
+                try:
+                    result = result.result()
+                except Exception as e:
+                    # 与普通的处理失败相同，记为失败并移出队列，文件再次修改后才重新处理
+                    result = self._failed_record(*self._paths(key), e)
+            del self.in_flight[key]
+
+            record = result
+            record['key'] = key
+            record['latency'] = max(time.time() - self.queue.items.get(key, time.time()), 0.0)
+            try:
+                stat = os.stat(record['input'])
+            except OSError:
+                stat = None
+            if stat is not None and (stat.st_size, stat.st_mtime_ns) != state:
+                # 处理期间文件又被改写，保留在队列中等待重新处理
+                self.settling.setdefault(key, None)
+            else:
+                if record['status'] == 'success' and stat is not None:
+                    self.manifest.record(key, record['input'], self.fingerprint)
+                    self.manifest_dirty = True
+                # 失败的文件不再重试，直到它再次被修改
+                self.queue.discard(key)
+            if self.on_record:
+                self.on_record(record)
+        return broken
@@ -0,0 +1,53 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from PIL import Image
+from batch_job import BatchJob
+from image_processor import ImageProcessor
+
+class BatchJobPauseTest(unittest.TestCase):
+    """暂停后不再提交新的图片"""
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='test_batch_job_')
+        self.input_dir = os.path.join(self.work_dir, 'input')
+        self.output_dir = os.path.join(self.work_dir, 'output')
+        os.makedirs(self.input_dir)
+        for i in range(6):
+            Image.new('RGB', (32, 32), (i * 40, 0, 0)).save(os.path.join(self.input_dir, f"{i}.png"))
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def wait_finished(self, job):
+        records = []
+        deadline = time.monotonic() + 30
+        while not job.finished and time.monotonic() < deadline:
+            records += job.drain()
+            time.sleep(0.01)
+        return records + job.drain()
+
+    def test_pause_before_start(self):
+        for workers in (None, 2):
+            with self.subTest(workers=workers):
+                job = BatchJob(ImageProcessor(), self.input_dir, self.output_dir, 'resize',
+                               workers=workers, size=(16, 16))
+                job.pause()
+                job.start()
+                time.sleep(0.5)
+                self.assertEqual(job.drain(), [])
+                self.assertFalse([name for name in os.listdir(self.output_dir) if name.endswith('.png')])
+                job.resume()
+                records = self.wait_finished(job)
+                self.assertIsNone(job.error)
+                self.assertEqual([record['status'] for record in records], ['success'] * 6)
+                shutil.rmtree(self.output_dir)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from PIL import Image
+from image_processor import ImageProcessor
+
+class DedupTest(unittest.TestCase):
+    """去重模式只在输出扩展名相同的文件之间复用输出"""
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='test_dedup_')
+        self.input_dir = os.path.join(self.work_dir, 'input')
+        self.output_dir = os.path.join(self.work_dir, 'output')
+        os.makedirs(self.input_dir)
+        source = os.path.join(self.input_dir, 'a.jpg')
+        Image.linear_gradient('L').convert('RGB').save(source)
+        # 内容完全相同，只有文件名不同
+        shutil.copyfile(source, os.path.join(self.input_dir, 'b.png'))
+        shutil.copyfile(source, os.path.join(self.input_dir, 'c.jpg'))
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_same_bytes_different_extension(self):
+        result = ImageProcessor().batch_process(self.input_dir, self.output_dir, 'resize', dedup='link', size=(64, 64))
+        self.assertEqual(result['success'], 2)
+        self.assertEqual(result['duplicate'], 1)
+        formats = {}
+        for name in ('a.jpg', 'b.png', 'c.jpg'):
+            with Image.open(os.path.join(self.output_dir, name)) as img:
+                formats[name] = img.format
+        self.assertEqual(formats, {'a.jpg': 'JPEG', 'b.png': 'PNG', 'c.jpg': 'JPEG'})
+        self.assertTrue(os.path.samefile(os.path.join(self.output_dir, 'a.jpg'), os.path.join(self.output_dir, 'c.jpg')))
+
+if __name__ == "__main__":
+    unittest.main()
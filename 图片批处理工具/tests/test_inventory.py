@@ -0,0 +1,43 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from inventory import iter_inventory
+
+class InventoryTest(unittest.TestCase):
+    """文件清单中的路径不能指向输入目录外部"""
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='test_inventory_')
+        self.input_dir = os.path.join(self.work_dir, 'input')
+        self.inventory = os.path.join(self.work_dir, 'inventory.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def write_inventory(self, *paths):
+        with open(self.inventory, 'w', encoding='utf-8') as f:
+            for path in paths:
+                f.write(json.dumps({'path': path, 'status': 'ok'}) + '\n')
+
+    def test_relative_paths(self):
+        self.write_inventory('a.jpg', 'sub/./b.png')
+        self.assertEqual(list(iter_inventory(self.inventory, self.input_dir)), [
+            ('a.jpg', os.path.join(self.input_dir, 'a.jpg')),
+            (os.path.join('sub', 'b.png'), os.path.join(self.input_dir, 'sub', 'b.png')),
+        ])
+
+    def test_unsafe_paths(self):
+        for path in ('../outside.jpg', 'sub/../../outside.jpg', '/etc/passwd.jpg', 'C:/outside.jpg', '..\\outside.jpg'):
+            with self.subTest(path=path):
+                self.write_inventory('a.jpg', path)
+                with self.assertRaises(ValueError):
+                    list(iter_inventory(self.inventory, self.input_dir))
+
+if __name__ == "__main__":
+    unittest.main()